@@ -4,19 +4,549 @@ costi totali associati, sia da input manuale che da un file JSON.
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 import math
+import io
+import os
+import sys
+import glob
+import csv
 import json
+import gzip
+import bz2
+import lzma
+import zlib
+import queue
+import heapq
+import hashlib
+import random
+import time
+import shutil
+import socket
+import tempfile
+import threading
+import datetime
+import itertools
+from array import array
+from collections import deque
+import sqlite3
+from decimal import Decimal, ROUND_HALF_UP, localcontext
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from functools import partial
+from operator import itemgetter
 
 # Costanti globali
 VERSIONE = "1.0"
 AUTORE = "Mirko Benenati"
 PERCORSO_JSON = "dati.json"
+PERCORSO_DB = "risultati.db"
+# Versione delle formule e del formato dei risultati salvati: va incrementata a
+# ogni modifica, l'archivio con una versione diversa viene svuotato all'apertura
+VERSIONE_ARCHIVIO = 3
+INTERVALLO_MONITORAGGIO_MS = 2000  # Intervallo di controllo del file in modalità monitoraggio
+INTERVALLO_RISULTATI_MS = 100  # Intervallo di controllo dei calcoli in corso in background
+ATTESA_ARCHIVIO = 30.0  # Secondi di attesa sull'archivio bloccato da un altro processo
+ANNO_MINIMO = 1900  # Gli anni validi sono strettamente maggiori
+BLOCCO_VALIDAZIONE = 4096  # Righe massime per blocco nella validazione fail-fast
+CAMPI_NUMERICI = ("domanda_annua", "costo_setup", "costo_mantenimento")
+CAMPI_LOTTO = ("confezione", "lotto_minimo", "lotto_massimo")  # Vincoli di lotto facoltativi
+# Campi facoltativi dei record -> True se il valore zero è ammesso
+CAMPI_FACOLTATIVI = {
+    "confezione": False,
+    "lotto_minimo": True,
+    "lotto_massimo": False,
+    "tasso_deterioramento": True,  # Quota di merce deteriorata per anno (tasso esponenziale)
+    "vita_utile": False,  # Giorni
+    "costo_unitario": True,
+}
+VALUTA_ESATTA = os.environ.get("EOQ_VALUTA_ESATTA") == "1"  # Costi in Decimal al centesimo
+CENTESIMO = Decimal("0.01")
+COLONNE_COSTI = ("Costo Ordini Annuo (€)", "Costo Magazzino Annuo (€)", "Costo Totale Annuo (€)")
+SENZA_FORNITORE = "(nessun fornitore)"  # Gruppo del riepilogo per i risultati senza fornitore
+PUNTI_CURVA = 200  # Punti della curva dei costi nel grafico
+# Colonne dei dati incollati senza intestazione (con una colonna in più, la prima è il codice)
+COLONNE_INCOLLA = ("anno", "domanda_annua", "costo_setup", "costo_mantenimento")
+ALTEZZA_GRAFICO = 200  # Pixel
+MARGINE_GRAFICO = 30  # Pixel attorno a ciascun grafico
+GIORNI_ANNO = 365
+CICLO_MASSIMO_DCF = 10.0  # Anni: orizzonte di pianificazione, ciclo massimo dell'EOQ attualizzato
+GIORNI_LAVORATIVI = (0, 1, 2, 3, 4)  # Lunedì-venerdì (datetime.weekday)
+MAX_PROCESSI = 4  # Numero massimo di processi per l'elaborazione di più file
+ESTENSIONI_INPUT = (".json", ".ndjson", ".jsonl")  # Estensioni cercate nelle cartelle di input
+ESTENSIONI_NDJSON = (".ndjson", ".jsonl")  # Un record JSON per riga
+TASSO_MANTENIMENTO = 0.25  # Costo di mantenimento annuo come quota del valore unitario
+MAX_CHIAVI_AGGREGAZIONE = 500000  # Chiavi (codice, anno) in memoria prima di scrivere su disco
+# File compressi: estensione -> modulo, riconosciuti anche dai primi byte
+COMPRESSIONI = {".gz": gzip, ".bz2": bz2, ".xz": lzma}
+FIRME_COMPRESSIONE = ((b"\x1f\x8b", gzip), (b"BZh", bz2), (b"\xfd7zXZ\x00", lzma))
+DIMENSIONE_BLOCCO = 1 << 20  # Byte decompressi per blocco di lettura
+BLOCCHI_IN_CODA = 4  # Blocchi decompressi in anticipo dal thread di lettura
+RECORD_PER_BLOCCO = 50000  # Record per blocco nelle elaborazioni con checkpoint
+DURATA_PRENOTAZIONE = 600  # Secondi di validità della prenotazione di uno shard senza rinnovo
+LARGHEZZA_CODICE = 32  # Byte (UTF-8) del codice articolo nel buffer condiviso dei risultati
+# Confronto tra due esecuzioni: colonne confrontate e variazione relativa minima segnalata
+COLONNE_DIFF = ("EOQ (pz)", "Costo Ordini Annuo (€)", "Costo Magazzino Annuo (€)", "Costo Totale Annuo (€)")
+SOGLIA_DIFF = 0.0
+
+# Percorsi di input configurabili: file, cartelle o glob separati da os.pathsep
+PERCORSI_INPUT = os.environ.get("EOQ_INPUT", PERCORSO_JSON).split(os.pathsep)
+
+
+def record_key(record):
+    ''' Restituisce l'identità di un record: (codice articolo, anno).
+    Il codice è facoltativo e vale "" per i file con un solo articolo '''
+    return (str(record.get("codice", "")), record.get("anno", 0))
+
+
+def input_hash(demand, setup, holding, *extra):
+    # Hash dei parametri di input, usato per capire se un record è cambiato
+    # (modalità di calcolo e vincoli di lotto, se indicati, fanno parte dell'hash)
+    params = [demand, setup, holding]
+    params.extend(value for value in extra if value is not None)
+    payload = json.dumps(params)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def to_decimal(value):
+    # Converte un numero in Decimal partendo dalla sua rappresentazione
+    # testuale, così 0.1 letto dal JSON resta esattamente 0.1
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(repr(value))
+
+
+def format_money_bulk(values):
+    ''' Formatta una colonna di importi con due decimali in un'unica
+    operazione di formattazione invece di una f-string per valore.
+    I Decimal vengono arrotondati al centesimo senza passare dai float '''
+    values = list(values)
+    if not values:
+        return []
+    if isinstance(values[0], Decimal):
+        return [str(value.quantize(CENTESIMO, ROUND_HALF_UP)) for value in values]
+    return ("%.2f\n" * len(values) % tuple(values)).split("\n")[:-1]
+
+
+def format_results_bulk(results):
+    # Converte in stringhe le colonne dei costi di una lista di risultati
+    # prodotti con get_results_dict(formatta=False)
+    for column in COLONNE_COSTI:
+        formatted = format_money_bulk(result[column] for result in results)
+        for result, text in zip(results, formatted):
+            result[column] = text
+    return results
+
+
+class ValidationError(ValueError):
+    ''' Errore sollevato dalla validazione in modalità fail-fast '''
+
+    def __init__(self, issue):
+        self.issue = issue
+        super().__init__(
+            f"Riga {issue['riga']}, campo '{issue['campo']}': {issue['motivo']}"
+        )
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_records(data, fail_fast=False):
+    ''' Valida in blocco una lista di record, colonna per colonna.
+    Restituisce (record validi, report) dove il report è una lista di
+    dizionari {"riga", "anno", "campo", "motivo"} (riga numerata da 1).
+    Con fail_fast=True solleva ValidationError per il primo errore: i
+    record vengono validati a blocchi crescenti (1, 2, 4, ... fino a
+    BLOCCO_VALIDAZIONE righe), così ci si ferma subito dopo il primo
+    errore senza rinunciare alla validazione in blocco '''
+    if fail_fast:
+        data = list(data)
+        start, size = 0, 1
+        while start < len(data):
+            _, issues = validate_records(data[start:start + size])
+            if issues:
+                raise ValidationError(dict(issues[0], riga=issues[0]["riga"] + start))
+            start += size
+            size = min(size * 2, BLOCCO_VALIDAZIONE)
+        return data, []
+
+    issues = []
+
+    # Schema: ogni record deve essere un oggetto JSON
+    records = [record if isinstance(record, dict) else None for record in data]
+    for index in [i for i, record in enumerate(records) if record is None]:
+        issues.append({"riga": index + 1, "anno": None, "campo": "record",
+                       "motivo": "Il record non è un oggetto JSON"})
+    rows = [i for i, record in enumerate(records) if record is not None]
+
+    # Anno: numero intero maggiore di ANNO_MINIMO
+    years = [records[i].get("anno", 0) for i in rows]
+    for i, year in zip(rows, years):
+        if not (_is_number(year) and year > ANNO_MINIMO):
+            issues.append({"riga": i + 1, "anno": year, "campo": "anno",
+                           "motivo": f"L'anno deve essere un numero maggiore di {ANNO_MINIMO}"})
+
+    # Valori numerici: devono essere presenti e positivi
+    for field in CAMPI_NUMERICI:
+        column = [records[i].get(field) for i in rows]
+        for i, year, value in zip(rows, years, column):
+            if value is None:
+                reason = "Valore mancante"
+            elif not _is_number(value):
+                reason = "Il valore deve essere un numero"
+            elif value <= 0:
+                reason = "Il valore deve essere positivo"
+            else:
+                continue
+            issues.append({"riga": i + 1, "anno": year, "campo": field, "motivo": reason})
+
+    # Campi facoltativi: se presenti devono essere numeri validi
+    for field, zero_allowed in CAMPI_FACOLTATIVI.items():
+        column = [records[i].get(field) for i in rows]
+        for i, year, value in zip(rows, years, column):
+            if value is None:
+                continue
+            if not _is_number(value):
+                reason = "Il valore deve essere un numero"
+            elif value < 0 or (value == 0 and not zero_allowed):
+                reason = "Il valore deve essere positivo"
+            else:
+                continue
+            issues.append({"riga": i + 1, "anno": year, "campo": field, "motivo": reason})
+
+    issues.sort(key=lambda issue: issue["riga"])
+    invalid_rows = set(issue["riga"] for issue in issues)
+    valid_records = [records[i] for i in rows if i + 1 not in invalid_rows]
+    return valid_records, issues
+
+
+def _column(value, n):
+    # Un parametro può essere uno scalare (uguale per tutte le righe) o una lista
+    return value if isinstance(value, (list, tuple)) else [value] * n
+
+
+def snap_lots(demands, setups, holdings, eoqs, confezione=1, lotto_minimo=0, lotto_massimo=None):
+    ''' Arrotonda in blocco i lotti economici a quantità ordinabili:
+    multipli della confezione, non inferiori al lotto minimo e non
+    superiori al lotto massimo. Tra il multiplo inferiore e quello
+    superiore all'EOQ sceglie quello con il costo totale minore.
+    I vincoli possono essere scalari o liste (uno per riga); se lotto
+    minimo e massimo sono in conflitto prevale il lotto minimo.
+    Restituisce le colonne (quantità, costi ordini, costi magazzino, totali) '''
+    n = len(eoqs)
+    quantities, ordering, holding_costs, totals = [], [], [], []
+    for demand, setup, holding, eoq, pack, minimum, maximum in zip(
+        demands, setups, holdings, eoqs,
+        _column(confezione, n), _column(lotto_minimo, n), _column(lotto_massimo, n)
+    ):
+        low = max(math.ceil(minimum / pack), 1) * pack
+        high = math.floor(maximum / pack) * pack if maximum else math.inf
+        down = math.floor(eoq / pack) * pack
+        best = None
+        for q in (down, down + pack):
+            q = max(min(q, high), low)
+            cost_o = demand / q * setup
+            cost_h = q / 2 * holding
+            if best is None or cost_o + cost_h < best[1] + best[2]:
+                best = (q, cost_o, cost_h)
+        quantities.append(best[0])
+        ordering.append(best[1])
+        holding_costs.append(best[2])
+        totals.append(best[1] + best[2])
+    return quantities, ordering, holding_costs, totals
+
+
+def format_validation_report(issues, max_righe=20):
+    # Testo riepilogativo del report di validazione per la GUI; le
+    # segnalazioni senza riga (righe calcolate, non lette) indicano il codice
+    lines = [
+        f"{'Riga ' + str(issue['riga']) if issue['riga'] is not None else 'Codice ' + str(issue.get('codice', ''))}"
+        f" (anno {issue['anno']}), {issue['campo']}: {issue['motivo']}"
+        for issue in issues[:max_righe]
+    ]
+    if len(issues) > max_righe:
+        lines.append(f"... e altri {len(issues) - max_righe} errori")
+    return "\n".join(lines)
+
+
+def format_files_report(reports, max_righe=5):
+    # Testo unico con errori e report di validazione di più file, raggruppati per file
+    sections = []
+    for report in reports:
+        lines = []
+        if report["error"]:
+            lines.append(report["error"])
+        if report["validation"]:
+            lines.append(f"{len(report['validation'])} errori di validazione:")
+            lines.append(format_validation_report(report["validation"], max_righe))
+        if lines:
+            sections.append(f"{report['file']}:\n" + "\n".join(lines))
+    return "\n\n".join(sections)
+
+
+def compression_of(path):
+    ''' Restituisce il modulo di compressione (gzip, bz2, lzma) del file,
+    riconosciuto dall'estensione o dai primi byte, oppure None '''
+    module = COMPRESSIONI.get(os.path.splitext(path)[1].lower())
+    if module is not None:
+        return module
+    try:
+        with open(path, 'rb') as file:
+            head = file.read(6)
+    except OSError:
+        return None
+    for magic, module in FIRME_COMPRESSIONE:
+        if head.startswith(magic):
+            return module
+    return None
+
+
+def strip_compression(path):
+    # Percorso senza l'estensione di compressione ("dati.json.gz" -> "dati.json")
+    root, ext = os.path.splitext(path)
+    return root if ext.lower() in COMPRESSIONI else path
+
+
+class PrefetchReader(io.RawIOBase):
+    ''' Flusso binario in sola lettura che decompressa il file in un
+    thread separato, BLOCCHI_IN_CODA blocchi in anticipo: la
+    decompressione (che rilascia il GIL) si sovrappone all'elaborazione
+    dei dati già letti '''
+
+    def __init__(self, stream, blocco=DIMENSIONE_BLOCCO, in_coda=BLOCCHI_IN_CODA):
+        super().__init__()
+        self._stream = stream
+        self._blocco = blocco
+        self._queue = queue.Queue(in_coda)
+        self._stop = threading.Event()
+        self._pending = memoryview(b"")
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def _fill(self):
+        try:
+            while not self._stop.is_set():
+                block = self._stream.read(self._blocco)
+                self._put(block)
+                if not block:
+                    return
+        except (zlib.error, lzma.LZMAError, EOFError) as e:
+            # Errori di decompressione: come OSError, al pari di bz2 e dei file illeggibili
+            self._put(OSError(f"Archivio compresso non valido: {str(e)}"))
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        # Attende spazio nella coda, salvo chiusura anticipata del lettore
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _next_block(self):
+        if not self._pending and not self._eof:
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                self._eof = True
+                raise item
+            if not item:
+                self._eof = True
+            self._pending = memoryview(item)
+        return self._pending
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        pending = self._next_block()
+        n = min(len(buffer), len(pending))
+        buffer[:n] = pending[:n]
+        self._pending = pending[n:]
+        return n
+
+    def readall(self):
+        blocks = []
+        while self._next_block():
+            blocks.append(bytes(self._pending))
+            self._pending = memoryview(b"")
+        return b"".join(blocks)
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._stream.close()
+        super().close()
+
+
+def open_input(path, mode='rb', **kwargs):
+    ''' Apre un file di input, decomprimendolo in modo trasparente se è
+    compresso (gzip, bz2 o xz). mode è 'rb' oppure 'r' (testo, con gli
+    stessi argomenti di open) '''
+    module = compression_of(path)
+    if module is None:
+        return open(path, mode, **kwargs)
+    stream = io.BufferedReader(PrefetchReader(module.open(path, 'rb')), DIMENSIONE_BLOCCO)
+    if 'b' in mode:
+        return stream
+    return io.TextIOWrapper(stream, **kwargs)
+
+
+def open_output(path, mode='w', **kwargs):
+    ''' Apre un file di output, comprimendolo se l'estensione è .gz, .bz2
+    o .xz. mode è 'w'/'wb' (o 'a'/'ab') con gli stessi argomenti di open '''
+    module = COMPRESSIONI.get(os.path.splitext(path)[1].lower())
+    if module is None:
+        return open(path, mode, **kwargs)
+    binary_mode = mode if 'b' in mode else mode + 'b'
+    if module is gzip:
+        # Intestazione gzip senza data: lo stesso contenuto produce gli stessi byte
+        stream = gzip.GzipFile(path, binary_mode, mtime=0)
+    else:
+        stream = module.open(path, binary_mode)
+    return stream if 'b' in mode else io.TextIOWrapper(stream, **kwargs)
+
+
+class ResultStore:
+    ''' Archivio persistente (SQLite) dei risultati già calcolati,
+    indicizzato per identità del record e hash dei parametri di input.
+    La versione del formato (VERSIONE_ARCHIVIO) è salvata in user_version.
+    Più processi possono usare lo stesso archivio: il journal WAL permette
+    le letture durante una scrittura e le scritture concorrenti attendono
+    fino a ATTESA_ARCHIVIO secondi invece di fallire '''
+
+    def __init__(self, percorso=PERCORSO_DB):
+        self.percorso = percorso
+        self.connection = sqlite3.connect(percorso, timeout=ATTESA_ARCHIVIO)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS risultati ("
+            " codice TEXT NOT NULL,"
+            " anno INTEGER NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " risultato TEXT NOT NULL,"
+            " PRIMARY KEY (codice, anno))"
+        )
+        self.connection.commit()
+        # Risultati scritti da una versione precedente: formato o formule diversi
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != VERSIONE_ARCHIVIO:
+            with self.connection:
+                self.connection.execute("DELETE FROM risultati")
+                self.connection.execute(f"PRAGMA user_version = {VERSIONE_ARCHIVIO}")
+
+    def get(self, chiave, hash_input):
+        # Restituisce il risultato salvato solo se i parametri non sono cambiati
+        row = self.connection.execute(
+            "SELECT risultato FROM risultati WHERE codice = ? AND anno = ? AND hash = ?",
+            (chiave[0], chiave[1], hash_input)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_many(self, entries):
+        # Salva (chiave, hash, risultato) in un'unica transazione
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO risultati (codice, anno, hash, risultato)"
+                " VALUES (?, ?, ?, ?)",
+                [
+                    (chiave[0], chiave[1], hash_input, json.dumps(risultato))
+                    for chiave, hash_input, risultato in entries
+                ]
+            )
+
+    def load_all(self):
+        # Tutti i risultati salvati, ordinati per anno e codice
+        rows = self.connection.execute(
+            "SELECT risultato FROM risultati ORDER BY anno, codice"
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute("DELETE FROM risultati")
+
+    def close(self):
+        self.connection.close()
+
+
+class InputWatcher:
+    ''' Sorveglia un file di input JSON o NDJSON: rileva le modifiche confrontando
+    prima mtime e dimensione, poi l'hash del contenuto, e restituisce
+    solo i record nuovi, modificati o rimossi rispetto all'ultima lettura '''
+
+    def __init__(self, percorso):
+        self.percorso = percorso
+        self.firma = None  # (mtime, dimensione) dell'ultima lettura
+        self.digest = None  # Hash del contenuto dell'ultima lettura
+        self.records = {}  # chiave -> record dell'ultima lettura valida
+        self.invalid = []  # Elementi dell'ultima lettura che non sono oggetti JSON
+
+    def poll(self):
+        ''' Restituisce None se il file non è cambiato, altrimenti la
+        coppia (record nuovi o modificati, chiavi dei record rimossi) '''
+        try:
+            stat = os.stat(self.percorso)
+        except FileNotFoundError:
+            return None
+
+        # Controllo veloce: se mtime e dimensione sono uguali non rilegge il file
+        firma = (stat.st_mtime_ns, stat.st_size)
+        if firma == self.firma:
+            return None
+        self.firma = firma
+
+        with open_input(self.percorso, 'rb') as file:
+            content = file.read()
+        digest = hashlib.sha1(content).hexdigest()
+        if digest == self.digest:
+            return None
+
+        try:
+            if is_ndjson(self.percorso):
+                data, invalid = parse_ndjson_records(content)
+                if invalid and invalid[-1] == content.count(b"\n") + 1:
+                    # Ultima riga incompleta: il file è in fase di scrittura
+                    raise json.JSONDecodeError("Riga incompleta", "", 0)
+                # Le altre righe non valide sono ignorate (le segnala la lettura completa)
+            else:
+                data = json.loads(content)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            # Probabilmente il file è in fase di scrittura: riprova al prossimo controllo
+            self.firma = None
+            return None
+        if not isinstance(data, list):
+            self.firma = None
+            return None
+        self.digest = digest
+
+        # Confronto record per record con la lettura precedente; gli elementi
+        # che non sono oggetti non hanno chiave e vengono restituiti tra i
+        # cambiati solo se diversi dall'ultima lettura, così la validazione
+        # li segnala una volta
+        new_records = {record_key(record): record for record in data if isinstance(record, dict)}
+        invalid = [record for record in data if not isinstance(record, dict)]
+        changed = [
+            record for key, record in new_records.items()
+            if self.records.get(key) != record
+        ]
+        if invalid != self.invalid:
+            changed.extend(invalid)
+        removed = [key for key in self.records if key not in new_records]
+        self.records = new_records
+        self.invalid = invalid
+        return changed, removed
 
 
 class EOQCalculator:
     ''' Classe principale che racchiude la logica per il calcolo dell'EOQ 
     e dei vari costi '''
 
-    def __init__(self):
+    def __init__(self, valuta_esatta=VALUTA_ESATTA):
+        self.valuta_esatta = valuta_esatta  # Costi in Decimal arrotondati al centesimo
+        self.codice = ""
         self.anno = 0
         self.domanda_annua = 0.0
         self.costo_setup = 0.0
@@ -27,6 +557,8 @@ class EOQCalculator:
         self.costi_mantenimento = 0.0
         self.ordini_annui = 0.0
         self.tempo_tra_ordini = 0.0
+        self.record_ricalcolati = 0  # Record calcolati nell'ultima lettura (non presi dall'archivio)
+        self.report_validazione = []  # Errori di validazione dell'ultima lettura
 
     def calculate_EOQ(self):
         # Questa funzione si occupa dei calcoli (EOQ e costi totali)
@@ -57,88 +589,2301 @@ class EOQCalculator:
 
         # Calcolo del tempo tra ordini (in giorni)
         self.tempo_tra_ordini = (
-            365 / self.ordini_annui
+            GIORNI_ANNO / self.ordini_annui
         )
 
-    def read_from_json(self, PERCORSO_JSON):
+        if self.valuta_esatta:
+            self.calculate_exact_costs()
+
+    def calculate_exact_costs(self):
+        ''' Ricalcola i costi in Decimal arrotondandoli al centesimo: il costo
+        totale è esattamente la somma dei due costi arrotondati, come
+        richiesto dalle riconciliazioni contabili '''
+        with localcontext() as ctx:
+            ctx.prec = 28
+            demand = to_decimal(self.domanda_annua)
+            setup = to_decimal(self.costo_setup)
+            holding = to_decimal(self.costo_mantenimento)
+            eoq = (2 * demand * setup / holding).sqrt()
+
+            self.costi_ordinazione = (demand / eoq * setup).quantize(CENTESIMO, ROUND_HALF_UP)
+            self.costi_mantenimento = (eoq / 2 * holding).quantize(CENTESIMO, ROUND_HALF_UP)
+            self.costi_totali = self.costi_ordinazione + self.costi_mantenimento
+
+    def read_from_json(self, PERCORSO_JSON, store=None, fail_fast=False):
         ''' Questa funzione legge i dati appartenenti a diversi anni 
-        da un file JSON e itera ad ogni anno per calcolare l'EOQ '''
+        da un file JSON e itera ad ogni anno per calcolare l'EOQ.
+        Se viene passato uno store (ResultStore) i record invariati
+        vengono presi dall'archivio invece di essere ricalcolati.
+        I record scartati sono descritti in self.report_validazione '''
 
         try:
-            with open(PERCORSO_JSON, 'r') as file:
+            with open_input(PERCORSO_JSON, 'r') as file:
                 data = json.load(file)
-                results = []
-                invalid_years = []  # Tiene traccia degli anni non validi
-                
-                for record in data:
-                    # Estrazione e validazione dell'anno
-                    year = record.get("anno", 0)
-                    if year <= 1900:
-                        invalid_years.append(year)
-                        continue  # Salta il record con anno non valido
-                    
-                    # Estrazione e validazione degli altri campi
-                    demand = record.get("domanda_annua", 0.0)
-                    setup = record.get("costo_setup", 0.0)
-                    holding = record.get("costo_mantenimento", 0.0)
-                    
-                    # Controllo che tutti i valori siano numeri positivi
-                    if not all(
-                        isinstance(val, (int, float)) and val > 0
-                        for val in [demand, setup, holding]
-                    ):
-                        messagebox.showerror(
-                            "ERRORE", 
-                            f"Valori non validi per l'anno {year}. Devono essere numeri positivi."
-                        )
-                        continue
-                    
-                    # Assegnazione e calcolo
-                    self.anno = year
-                    self.domanda_annua = demand
-                    self.costo_setup = setup
-                    self.costo_mantenimento = holding
-                    self.calculate_EOQ()
-                    results.append(self.get_results_dict())
-                
-                # Mostra un avviso riepilogativo per gli anni non validi
-                if invalid_years:
-                    years_str = ", ".join(map(str, invalid_years))
-                    messagebox.showwarning(
-                        "Anni non validi",
-                        f"Sono stati saltati {len(invalid_years)} record con anni non validi: {years_str}"
-                    )
-                
-                return results, invalid_years
+                return self.calculate_records(data, store=store, fail_fast=fail_fast)
 
         except FileNotFoundError:
             return [{"error": f"ERRORE: Il file {PERCORSO_JSON} non è stato trovato."}]
         except json.JSONDecodeError:
             return [{"error": "ERRORE: Formato JSON non valido."}]
+        except (OSError, EOFError, lzma.LZMAError) as e:
+            return [{"error": f"ERRORE: Impossibile leggere il file {PERCORSO_JSON}: {str(e)}"}]
+        except ValidationError as e:
+            return [{"error": f"ERRORE: {str(e)}"}]
+
+    def calculate_records(self, data, store=None, fail_fast=False, formatta=True):
+        ''' Valida e calcola l'EOQ per una lista di record già letti
+        (tutto il file oppure solo i record cambiati).
+        La validazione avviene in blocco prima del calcolo (vedi
+        validate_records); con fail_fast=True solleva ValidationError.
+        Con formatta=False i costi restano numerici (float, o Decimal in
+        modalità valuta esatta), anche per i risultati presi dall'archivio '''
+        valid_records, self.report_validazione = validate_records(data, fail_fast=fail_fast)
+        invalid_years = [
+            issue["anno"] for issue in self.report_validazione if issue["campo"] == "anno"
+        ]
+
+        results = []
+        new_entries = []  # Risultati da salvare nell'archivio
+        fresh = []  # Risultati calcolati ora, con i costi ancora da formattare
+        stored = []  # Risultati presi dall'archivio, con i costi già formattati
+        constrained = []  # (risultato, record, EOQ continuo) dei record da arrotondare a un lotto
+        self.record_ricalcolati = 0
+        
+        for record in valid_records:
+            year = record["anno"]
+            demand = record["domanda_annua"]
+            setup = record["costo_setup"]
+            holding = record["costo_mantenimento"]
+            
+            # Se il record è invariato usa il risultato in archivio
+            key = record_key(record)
+            lots = {field: record[field] for field in CAMPI_LOTTO if field in record} or None
+            digest = input_hash(demand, setup, holding, "esatta" if self.valuta_esatta else None, lots)
+            supplier = record.get("fornitore")  # Facoltativo, solo per i riepiloghi
+            if store is not None:
+                cached = store.get(key, digest)
+                if cached is not None:
+                    cached.pop("Fornitore", None)
+                    if supplier is not None:
+                        cached["Fornitore"] = str(supplier)
+                    results.append(cached)
+                    stored.append(cached)
+                    continue
+
+            # Assegnazione e calcolo
+            self.codice = key[0]
+            self.anno = year
+            self.domanda_annua = demand
+            self.costo_setup = setup
+            self.costo_mantenimento = holding
+            self.calculate_EOQ()
+            result = self.get_results_dict(formatta=False)
+            if supplier is not None:
+                result["Fornitore"] = str(supplier)
+            results.append(result)
+            fresh.append(result)
+            constrained.append((result, record, self.eoq))
+            new_entries.append((key, digest, result))
+            self.record_ricalcolati += 1
+
+        # Ogni record viene arrotondato in blocco a un lotto intero (con i
+        # suoi vincoli di lotto, se presenti), così EOQ e costi mostrati si
+        # riferiscono alla stessa quantità; poi i costi vengono formattati
+        # tutti insieme alla fine (nell'archivio sempre formattati)
+        if constrained:
+            self.apply_lot_constraints(constrained)
+        if formatta:
+            format_results_bulk(fresh)
+        else:
+            number = Decimal if self.valuta_esatta else float
+            for result in stored:
+                for column in COLONNE_COSTI:
+                    result[column] = number(result[column])
+            new_entries = [
+                (key, digest, result) for (key, digest, _), result in zip(
+                    new_entries, format_results_bulk([dict(result) for _, _, result in new_entries])
+                )
+            ]
+
+        if store is not None and new_entries:
+            store.put_many(new_entries)
+        
+        return results, invalid_years
     
-    def get_results_dict(self):
-        """Restituisce i risultati come dizionario"""
+    def apply_lot_constraints(self, constrained):
+        ''' Sostituisce nei risultati (non ancora formattati) l'EOQ continuo
+        con il lotto ordinabile più conveniente (vedi snap_lots; senza
+        vincoli è il lotto intero migliore) e ricalcola costi, ordini annui
+        e giorni tra ordini per quel lotto '''
+        records = [record for _, record, _ in constrained]
+        demands = [record["domanda_annua"] for record in records]
+        quantities, ordering, holding, totals = snap_lots(
+            demands,
+            [record["costo_setup"] for record in records],
+            [record["costo_mantenimento"] for record in records],
+            [eoq for _, _, eoq in constrained],
+            confezione=[record.get("confezione", 1) for record in records],
+            lotto_minimo=[record.get("lotto_minimo", 0) for record in records],
+            lotto_massimo=[record.get("lotto_massimo") for record in records]
+        )
+        for (result, record, _), demand, q, cost_o, cost_h, total in zip(
+            constrained, demands, quantities, ordering, holding, totals
+        ):
+            if self.valuta_esatta:
+                # In modalità valuta esatta i costi del lotto scelto sono ricalcolati in Decimal
+                with localcontext() as ctx:
+                    ctx.prec = 28
+                    lot = to_decimal(q)
+                    cost_o = to_decimal(demand) / lot * to_decimal(record["costo_setup"])
+                    cost_h = lot / 2 * to_decimal(record["costo_mantenimento"])
+                    cost_o = cost_o.quantize(CENTESIMO, ROUND_HALF_UP)
+                    cost_h = cost_h.quantize(CENTESIMO, ROUND_HALF_UP)
+                    total = cost_o + cost_h
+            result["EOQ (pz)"] = int(q) if float(q).is_integer() else q
+            result["Costo Ordini Annuo (€)"] = cost_o
+            result["Costo Magazzino Annuo (€)"] = cost_h
+            result["Costo Totale Annuo (€)"] = total
+            result["Ordini/Anno"] = int(round(demand / q))
+            result["Giorni tra ordini"] = int(round(GIORNI_ANNO * q / demand))
+
+    def get_results_dict(self, formatta=True):
+        """Restituisce i risultati come dizionario (con formatta=False i
+        costi restano numerici, per la formattazione in blocco)"""
+        if formatta:
+            costs = (
+                f"{self.costi_ordinazione:.2f}",
+                f"{self.costi_mantenimento:.2f}",
+                f"{self.costi_totali:.2f}"
+            )
+        else:
+            costs = (self.costi_ordinazione, self.costi_mantenimento, self.costi_totali)
         return {
+            "Codice": self.codice,
             "Anno": int(self.anno),
             "Domanda Annua (pz)": int(round(self.domanda_annua)),
             "EOQ (pz)": int(round(self.eoq)),
-            "Costo Ordini Annuo (€)": f"{self.costi_ordinazione:.2f}",
-            "Costo Magazzino Annuo (€)": f"{self.costi_mantenimento:.2f}",
-            "Costo Totale Annuo (€)": f"{self.costi_totali:.2f}",
+            "Costo Ordini Annuo (€)": costs[0],
+            "Costo Magazzino Annuo (€)": costs[1],
+            "Costo Totale Annuo (€)": costs[2],
             "Ordini/Anno": int(round(self.ordini_annui)),
             "Giorni tra ordini": int(round(self.tempo_tra_ordini))
         }
 
 
+class TransactionAggregator:
+    ''' Ricava i dati di input dell'EOQ dallo storico delle transazioni.
+    Legge file CSV con colonne codice, data (AAAA-MM-GG), tipo ("ordine" o
+    "ricevimento"), quantita e valore, in un'unica passata e con memoria
+    limitata: quando le chiavi (codice, anno) superano max_chiavi gli
+    aggregati parziali vengono scritti ordinati su disco e poi fusi.
+    La domanda annua è la somma delle quantità ordinate; il costo di
+    mantenimento è tasso_mantenimento per il valore unitario medio ricevuto '''
+
+    def __init__(self, costo_setup, tasso_mantenimento=TASSO_MANTENIMENTO,
+                 max_chiavi=MAX_CHIAVI_AGGREGAZIONE, costi_setup=None, temp_dir=None):
+        self.costo_setup = costo_setup
+        self.costi_setup = costi_setup or {}  # Costo di setup specifico per codice
+        self.tasso_mantenimento = tasso_mantenimento
+        self.max_chiavi = max_chiavi
+        self.temp_dir = temp_dir
+        self.righe_lette = 0
+        self.righe_scartate = 0
+        self.file_spill = 0
+
+    def records(self, paths):
+        ''' Generatore dei record aggregati (nel formato di dati.json),
+        ordinati per codice e anno '''
+        table = {}  # (codice, anno) -> [domanda, quantità ricevuta, valore ricevuto]
+        spills = []
+        try:
+            for path in paths:
+                with open_input(path, 'r', newline='', encoding='utf-8') as file:
+                    for row in csv.DictReader(file):
+                        self.righe_lette += 1
+                        try:
+                            key = (row["codice"], int(row["data"][:4]))
+                            kind = row["tipo"].strip().lower()
+                            quantity = float(row["quantita"].replace(',', '.'))
+                            value = float((row.get("valore") or "0").replace(',', '.'))
+                        except (KeyError, ValueError, AttributeError):
+                            self.righe_scartate += 1
+                            continue
+
+                        totals = table.get(key)
+                        if totals is None:
+                            if len(table) >= self.max_chiavi:
+                                spills.append(self._spill(table))
+                                table = {}
+                            totals = table[key] = [0.0, 0.0, 0.0]
+                        if kind == "ordine":
+                            totals[0] += quantity
+                        elif kind == "ricevimento":
+                            totals[1] += quantity
+                            totals[2] += value
+                        else:
+                            self.righe_scartate += 1
+
+            if spills:
+                spills.append(self._spill(table))
+                merged = self._merge(spills)
+            else:
+                merged = ((key[0], key[1], *table[key]) for key in sorted(table))
+
+            for codice, anno, demand, received, value in merged:
+                unit_value = value / received if received > 0 else 0.0
+                yield {
+                    "codice": codice,
+                    "anno": anno,
+                    "domanda_annua": demand,
+                    "costo_setup": self.costi_setup.get(codice, self.costo_setup),
+                    "costo_mantenimento": self.tasso_mantenimento * unit_value
+                }
+        finally:
+            for spill in spills:
+                spill.close()
+
+    def _spill(self, table):
+        # Scrive gli aggregati parziali ordinati per chiave in un file temporaneo
+        spill = tempfile.TemporaryFile(mode='w+', encoding='utf-8', dir=self.temp_dir)
+        for key in sorted(table):
+            spill.write(json.dumps([key[0], key[1], *table[key]]) + "\n")
+        spill.seek(0)
+        self.file_spill += 1
+        return spill
+
+    @staticmethod
+    def _merge(spills):
+        # Fusione ordinata dei file parziali, sommando le righe con la stessa chiave
+        runs = [(json.loads(line) for line in spill) for spill in spills]
+        current = None
+        for row in heapq.merge(*runs, key=lambda r: (r[0], r[1])):
+            if current is not None and current[:2] == row[:2]:
+                current[2] += row[2]
+                current[3] += row[3]
+                current[4] += row[4]
+                continue
+            if current is not None:
+                yield tuple(current)
+            current = row
+        if current is not None:
+            yield tuple(current)
+
+
+def calculate_from_transactions(paths, costo_setup, dimensione=RECORD_PER_BLOCCO, **options):
+    ''' Aggrega lo storico delle transazioni e calcola direttamente l'EOQ
+    per ogni (codice, anno). Generatore: i record aggregati vengono
+    calcolati a blocchi di dimensione record man mano che escono dalla
+    fusione e ogni blocco produce una parte nel formato di
+    write_results_csv ({"risultati", "report" con righe relative al
+    blocco, "righe"}), così né i record né i risultati restano tutti in
+    memoria: write_results_csv(percorso, calculate_from_transactions(...))
+    scrive il CSV con il report numerato sui record aggregati '''
+    aggregator = TransactionAggregator(costo_setup, **options)
+    calculator = EOQCalculator()
+    records = aggregator.records(paths)
+    while True:
+        chunk = list(itertools.islice(records, dimensione))
+        if not chunk:
+            return
+        results, _ = calculator.calculate_records(chunk)
+        yield {"risultati": results, "report": calculator.report_validazione, "righe": len(chunk)}
+
+
+def forecast_demand(series, metodo="ses", alpha=0.5, beta=0.3, finestra=3):
+    ''' Prevede la domanda del periodo successivo per tutte le serie insieme.
+    Le serie (liste di domande annue in ordine di anno, anche di lunghezze
+    diverse) vengono allineate sull'ultimo anno e aggiornate un passo alla
+    volta su tutte le serie contemporaneamente.
+    Metodi: "ses" (livellamento esponenziale semplice), "holt" (con trend),
+    "media_mobile" (media degli ultimi `finestra` valori) '''
+    if not series:
+        return []
+    length = max(len(values) for values in series)
+    # Allineamento a destra: None dove la serie non ha ancora dati
+    columns = list(zip(*[[None] * (length - len(values)) + list(values) for values in series]))
+
+    if metodo == "media_mobile":
+        recent = [[x for x in values if x is not None] for values in zip(*columns[-finestra:])]
+        return [sum(values) / len(values) if values else 0.0 for values in recent]
+
+    if metodo not in ("ses", "holt"):
+        raise ValueError(f"Metodo di previsione non supportato: {metodo}")
+
+    level = [None] * len(series)
+    trend = [0.0] * len(series)
+    for column in columns:
+        if metodo == "ses":
+            level = [
+                lv if x is None else x if lv is None else alpha * x + (1 - alpha) * lv
+                for x, lv in zip(column, level)
+            ]
+        else:
+            new_level = [
+                lv if x is None else x if lv is None else alpha * x + (1 - alpha) * (lv + tr)
+                for x, lv, tr in zip(column, level, trend)
+            ]
+            trend = [
+                tr if x is None or lv is None else beta * (nl - lv) + (1 - beta) * tr
+                for x, lv, nl, tr in zip(column, level, new_level, trend)
+            ]
+            level = new_level
+
+    # La domanda prevista non può essere negativa
+    return [max(lv + tr, 0.0) for lv, tr in zip(level, trend)]
+
+
+def forecast_records(data, metodo="ses", **params):
+    ''' Crea, per ogni codice articolo, il record dell'anno successivo
+    all'ultimo presente con la domanda prevista e gli ultimi costi noti.
+    Vengono usati solo i record che superano la validazione. Una domanda
+    prevista nulla (Holt con trend in calo) non dà un record ma una
+    segnalazione per codice, senza numero di riga perché non corrisponde a
+    una riga dell'input. Restituisce (record previsti, segnalazioni) '''
+    valid_records, issues = validate_records(data)
+    history = {}  # codice -> record ordinati per anno
+    for record in sorted(valid_records, key=lambda r: (record_key(r)[0], r["anno"])):
+        history.setdefault(record_key(record)[0], []).append(record)
+
+    codes = list(history)
+    forecasts = forecast_demand(
+        [[record["domanda_annua"] for record in history[code]] for code in codes],
+        metodo=metodo, **params
+    )
+    records = []
+    skipped = []
+    for code, demand in zip(codes, forecasts):
+        last = history[code][-1]
+        if demand <= 0:
+            skipped.append({"riga": None, "anno": last["anno"] + 1, "codice": code, "campo": "domanda_annua",
+                            "motivo": "Domanda prevista nulla: EOQ non calcolato"})
+            continue
+        record = {
+            "anno": last["anno"] + 1,
+            "domanda_annua": demand,
+            "costo_setup": last["costo_setup"],
+            "costo_mantenimento": last["costo_mantenimento"]
+        }
+        if code:
+            record["codice"] = code
+        records.append(record)
+    return records, skipped
+
+
+def calculate_with_forecast(data, metodo="ses", **params):
+    ''' Calcola l'EOQ degli anni storici e quello dell'anno successivo
+    previsto. Restituisce (risultati storici, risultati previsti, report):
+    il report contiene la validazione dell'input, con le righe dell'input,
+    seguita dalle segnalazioni delle previsioni, per codice (vedi
+    forecast_records) '''
+    forecasts, skipped = forecast_records(data, metodo=metodo, **params)
+    calculator = EOQCalculator()
+    historical, _ = calculator.calculate_records(list(data))
+    issues = calculator.report_validazione
+    predicted, _ = calculator.calculate_records(forecasts)
+    return historical, predicted, issues + skipped
+
+
+def load_holidays(values):
+    ''' Converte un elenco di festività (date o stringhe AAAA-MM-GG, ad
+    esempio le righe di un file) in un insieme di date '''
+    holidays = set()
+    for value in values:
+        if isinstance(value, datetime.date):
+            holidays.add(value)
+        elif value.strip():
+            holidays.add(datetime.date.fromisoformat(value.strip()))
+    return holidays
+
+
+def next_working_day(day, festivi=frozenset(), giorni_lavorativi=GIORNI_LAVORATIVI):
+    # Primo giorno lavorativo a partire da day (incluso)
+    if not giorni_lavorativi:
+        raise ValueError("Il calendario deve avere almeno un giorno lavorativo")
+    while day.weekday() not in giorni_lavorativi or day in festivi:
+        day += datetime.timedelta(days=1)
+    return day
+
+
+def order_schedule(result, inizio, giorni=GIORNI_ANNO, festivi=frozenset(),
+                   giorni_lavorativi=GIORNI_LAVORATIVI, sfasamento=0):
+    ''' Generatore delle date d'ordine di un risultato (dizionario di
+    get_results_dict) sull'orizzonte [inizio, inizio + giorni).
+    Gli ordini sono distanziati di GIORNI_ANNO * EOQ / domanda giorni (senza
+    l'arrotondamento di "Giorni tra ordini") e spostati al primo giorno
+    lavorativo utile; il primo ordine cade `sfasamento` giorni dopo
+    l'inizio (vedi stagger_orders). Produce tuple (data, codice, quantità) '''
+    demand = result["Domanda Annua (pz)"]
+    quantity = result["EOQ (pz)"]
+    if demand <= 0 or quantity <= 0:
+        return
+    interval = GIORNI_ANNO * quantity / demand
+    code = result.get("Codice", "")
+    fine = inizio + datetime.timedelta(days=giorni)
+    k = 0
+    while True:
+        # Moltiplicazione invece di somme successive: nessun errore accumulato
+        day = inizio + datetime.timedelta(days=sfasamento + math.floor(k * interval))
+        day = next_working_day(day, festivi, giorni_lavorativi)
+        if day >= fine:
+            return
+        yield (day, code, quantity)
+        k += 1
+
+
+def purchase_plan(results, inizio, giorni=GIORNI_ANNO, festivi=frozenset(),
+                  giorni_lavorativi=GIORNI_LAVORATIVI, sfasamenti=None):
+    ''' Piano acquisti di tutti gli articoli in ordine di data: i generatori
+    dei singoli articoli vengono fusi con un heap, quindi in memoria c'è
+    un solo ordine in attesa per articolo '''
+    if sfasamenti is None:
+        sfasamenti = itertools.repeat(0)
+    return heapq.merge(*(
+        order_schedule(result, inizio, giorni, festivi, giorni_lavorativi, offset)
+        for result, offset in zip(results, sfasamenti)
+    ))
+
+
+def export_purchase_plan(results, percorso, inizio, giorni=GIORNI_ANNO, festivi=frozenset(),
+                         sfasamenti=None):
+    # Scrive il piano acquisti in CSV riga per riga; restituisce il numero di ordini
+    count = 0
+    with open_output(percorso, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(["data", "codice", "quantita"])
+        plan = purchase_plan(results, inizio, giorni, festivi, sfasamenti=sfasamenti)
+        for day, code, quantity in plan:
+            writer.writerow([day.isoformat(), code, quantity])
+            count += 1
+    return count
+
+
+def _order_cycles(results):
+    # (durata del ciclo in giorni interi, quantità) per ogni risultato
+    cycles = []
+    for result in results:
+        demand = result["Domanda Annua (pz)"]
+        quantity = result["EOQ (pz)"]
+        cycle = max(1, int(round(GIORNI_ANNO * quantity / demand))) if demand > 0 else GIORNI_ANNO
+        cycles.append((cycle, quantity))
+    return cycles
+
+
+def receipt_timeline(cycles, offsets, orizzonte=GIORNI_ANNO):
+    ''' Quantità ricevute per giorno sull'orizzonte: ogni articolo riceve
+    la sua quantità nei giorni offset, offset + ciclo, ... '''
+    load = array('d', bytes(8 * orizzonte))
+    for (cycle, quantity), offset in zip(cycles, offsets):
+        load[offset::cycle] = array('d', [x + quantity for x in load[offset::cycle]])
+    return load
+
+
+def inventory_timeline(cycles, offsets, orizzonte=GIORNI_ANNO):
+    ''' Giacenza complessiva per giorno in regime stazionario: ogni articolo
+    scende linearmente da Q a zero lungo il suo ciclo. La giacenza del
+    giorno t è quella del giorno t-1, meno il consumo giornaliero totale,
+    più le quantità ricevute nel giorno t, quindi basta una somma cumulata '''
+    load = receipt_timeline(cycles, offsets, orizzonte)
+    rate = sum(quantity / cycle for cycle, quantity in cycles)
+    start = sum(
+        quantity - quantity / cycle * ((-offset) % cycle)
+        for (cycle, quantity), offset in zip(cycles, offsets)
+    )
+    steps = [start] + [x - rate for x in load[1:]]
+    return list(itertools.accumulate(steps))
+
+
+def stagger_orders(results, orizzonte=GIORNI_ANNO):
+    ''' Assegna a ogni articolo uno sfasamento (giorno del primo ordine,
+    entro il suo ciclo) per ridurre il picco dei ricevimenti giornalieri e
+    quindi della giacenza complessiva. Gli articoli vengono inseriti dal
+    lotto più grande; per ognuno si sceglie lo sfasamento il cui picco
+    sulla linea temporale già occupata è minimo (a parità, il primo).
+    Restituisce (sfasamenti, riepilogo dei picchi prima e dopo) '''
+    cycles = _order_cycles(results)
+    load = array('d', bytes(8 * orizzonte))
+    offsets = [0] * len(cycles)
+    for index in sorted(range(len(cycles)), key=lambda i: -cycles[i][1]):
+        cycle, quantity = cycles[index]
+        best = min(
+            range(min(cycle, orizzonte)),
+            key=lambda offset: (max(load[offset::cycle]), sum(load[offset::cycle]))
+        )
+        offsets[index] = best
+        load[best::cycle] = array('d', [x + quantity for x in load[best::cycle]])
+
+    aligned = [0] * len(cycles)
+    summary = {
+        "picco_ricevimenti_prima": max(receipt_timeline(cycles, aligned, orizzonte), default=0),
+        "picco_ricevimenti_dopo": max(load, default=0),
+        "picco_giacenza_prima": max(inventory_timeline(cycles, aligned, orizzonte), default=0),
+        "picco_giacenza_dopo": max(inventory_timeline(cycles, offsets, orizzonte), default=0),
+    }
+    return offsets, summary
+
+
+def reorder_point(domanda_annua, lead_time):
+    # Punto di riordino senza scorta di sicurezza: domanda media nel lead time
+    return domanda_annua / GIORNI_ANNO * lead_time
+
+
+def simulate_policy(domanda_giornaliera, q, punto_riordino, costo_setup, costo_mantenimento,
+                    lead_time=0, costo_rottura=0.0, livello_massimo=None, giacenza_iniziale=None):
+    ''' Simulazione a eventi discreti di una politica di riordino su uno
+    storico di domanda giornaliera. Gli eventi (domande e arrivi degli
+    ordini) sono gestiti con una coda di priorità; a parità di giorno gli
+    arrivi precedono le domande. Quando la posizione di magazzino (giacenza
+    + ordinato - arretrati) scende al punto di riordino si ordina Q (o il
+    multiplo di Q che basta a superare il punto di riordino), oppure,
+    se è indicato livello_massimo (politica (s, S)), quanto basta per
+    tornare a S. La domanda non soddisfatta resta in arretrato.
+    costo_mantenimento è annuo per unità, costo_rottura per unità mancante.
+    Restituisce un dizionario con costi realizzati e statistiche '''
+    heappush, heappop = heapq.heappush, heapq.heappop
+    holding_per_day = costo_mantenimento / GIORNI_ANNO
+    if giacenza_iniziale is None:
+        giacenza_iniziale = livello_massimo if livello_massimo is not None else punto_riordino + q
+
+    net = giacenza_iniziale  # Giacenza netta (negativa se ci sono arretrati)
+    on_order = 0
+    area = 0.0  # Integrale della giacenza fisica nel tempo (pezzi * giorni)
+    last = 0
+    orders = 0
+    short = 0
+    n_events = 0
+
+    # La domanda viene inserita nella coda un evento alla volta
+    demand = ((day, qty) for day, qty in enumerate(domanda_giornaliera) if qty)
+    events = []
+    first = next(demand, None)
+    if first is not None:
+        heappush(events, (first[0], 1, first[1]))
+
+    while events:
+        time, kind, qty = heappop(events)
+        n_events += 1
+        if net > 0:
+            area += net * (time - last)
+        last = time
+
+        if kind == 0:
+            # Arrivo di un ordine
+            net += qty
+            on_order -= qty
+            continue
+
+        # Domanda: la parte non coperta dalla giacenza va in arretrato
+        if qty > net:
+            short += qty - max(net, 0)
+        net -= qty
+        following = next(demand, None)
+        if following is not None:
+            heappush(events, (following[0], 1, following[1]))
+
+        # Revisione continua della posizione di magazzino
+        position = net + on_order
+        if position <= punto_riordino:
+            if livello_massimo is not None:
+                lot = livello_massimo - position
+            else:
+                lot = q * (math.floor((punto_riordino - position) / q) + 1)
+            orders += 1
+            on_order += lot
+            heappush(events, (time + lead_time, 0, lot))
+
+    horizon = max(len(domanda_giornaliera), last)
+    if net > 0:
+        area += net * (horizon - last)
+
+    ordering_cost = orders * costo_setup
+    holding_cost = area * holding_per_day
+    shortage_cost = short * costo_rottura
+    return {
+        "ordini": orders,
+        "costo_ordini": ordering_cost,
+        "costo_magazzino": holding_cost,
+        "costo_rottura": shortage_cost,
+        "costo_totale": ordering_cost + holding_cost + shortage_cost,
+        "unita_mancanti": short,
+        "eventi": n_events,
+        "giorni": horizon
+    }
+
+
+def _simulate_item(item):
+    # Funzione di appoggio per i processi: item contiene gli argomenti di simulate_policy
+    return simulate_policy(**item)
+
+
+def simulate_many(items, max_workers=MAX_PROCESSI, chunksize=16):
+    ''' Simula più articoli in processi separati. items è una lista di
+    dizionari con gli argomenti di simulate_policy; i risultati tornano
+    nello stesso ordine '''
+    if max_workers <= 1 or len(items) <= 1:
+        return [_simulate_item(item) for item in items]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_simulate_item, items, chunksize=chunksize))
+
+
+def generate_demand(domanda_annua, giorni, probabilita=1.0, rng=None):
+    ''' Genera una domanda giornaliera casuale con media domanda_annua:
+    ogni giorno c'è una richiesta con probabilità `probabilita` e la sua
+    quantità è esponenziale (domanda irregolare se probabilita è bassa).
+    Con domanda o probabilità nulle la serie è tutta a zero '''
+    rng = rng or random.Random()
+    if domanda_annua <= 0 or probabilita <= 0:
+        return [0] * giorni
+    mean = domanda_annua / GIORNI_ANNO / probabilita
+    return [
+        int(round(rng.expovariate(1 / mean))) if rng.random() < probabilita else 0
+        for _ in range(giorni)
+    ]
+
+
+def search_ss_policy(domanda_annua, costo_setup, costo_mantenimento, lead_time=0,
+                     costo_rottura=0.0, scenari=None, n_scenari=20, giorni=GIORNI_ANNO,
+                     probabilita=1.0, seed=0):
+    ''' Cerca la politica (s, S) di costo minimo simulandola.
+    Tutte le politiche candidate sono valutate sugli stessi scenari di
+    domanda (numeri casuali comuni), quindi le differenze di costo non
+    dipendono dal rumore. Gli scenari possono essere storici (lista di
+    domande giornaliere) o generati con generate_demand.
+    La ricerca parte dalla politica EOQ (s = domanda nel lead time,
+    S = s + EOQ) ed esplora solo i vicini del punto migliore, dimezzando il
+    passo quando nessun vicino migliora (ricerca a pattern), invece di
+    valutare l'intera griglia. Restituisce un dizionario con s, S, costo
+    annuo medio, costo della politica EOQ e statistiche della ricerca '''
+    start = time.perf_counter()
+    if scenari is None:
+        rng = random.Random(seed)
+        scenari = [generate_demand(domanda_annua, giorni, probabilita, rng) for _ in range(n_scenari)]
+    days = max(len(scenario) for scenario in scenari)
+    cache = {}
+
+    def cost(s_level, big_s):
+        # Costo annuo medio sugli scenari comuni (memorizzato per non ripetere)
+        key = (s_level, big_s)
+        if key not in cache:
+            total = 0.0
+            for scenario in scenari:
+                total += simulate_policy(
+                    scenario, big_s - s_level, s_level, costo_setup, costo_mantenimento,
+                    lead_time=lead_time, costo_rottura=costo_rottura, livello_massimo=big_s
+                )["costo_totale"]
+            cache[key] = total / len(scenari) * GIORNI_ANNO / days
+        return cache[key]
+
+    eoq = math.sqrt(2 * domanda_annua * costo_setup / costo_mantenimento)
+    best_s = int(round(reorder_point(domanda_annua, lead_time)))
+    best_q = max(1, int(round(eoq)))
+    eoq_cost = cost(best_s, best_s + best_q)
+    best_cost = eoq_cost
+    step = max(1, best_q // 4)
+    while step >= 1:
+        improved = False
+        for ds, dq in ((step, 0), (-step, 0), (0, step), (0, -step)):
+            s_level, q = best_s + ds, best_q + dq
+            if s_level < 0 or q < 1:
+                continue
+            candidate = cost(s_level, s_level + q)
+            if candidate < best_cost:
+                best_s, best_q, best_cost = s_level, q, candidate
+                improved = True
+        if not improved:
+            step //= 2
+
+    elapsed = time.perf_counter() - start
+    return {
+        "s": best_s,
+        "S": best_s + best_q,
+        "costo_annuo": best_cost,
+        "costo_annuo_eoq": eoq_cost,
+        "valutazioni": len(cache),
+        "valutazioni_al_secondo": len(cache) / elapsed if elapsed > 0 else 0.0
+    }
+
+
+def _search_item(item):
+    # Funzione di appoggio per i processi: item contiene gli argomenti di search_ss_policy
+    return search_ss_policy(**item)
+
+
+def search_ss_many(items, max_workers=MAX_PROCESSI):
+    ''' Cerca la politica (s, S) di più articoli in processi separati;
+    i risultati tornano nello stesso ordine degli articoli '''
+    if max_workers <= 1 or len(items) <= 1:
+        return [_search_item(item) for item in items]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_search_item, items))
+
+
+def _expm1_ratio(x):
+    # (e^x - 1) / x, che tende a 1 per x -> 0
+    return math.expm1(x) / x if abs(x) > 1e-6 else 1 + x / 2 + x * x / 6
+
+
+def _expm1_minus_x_ratio(x):
+    # (e^x - 1 - x) / x^2, che tende a 1/2 per x -> 0 (serie per evitare cancellazioni)
+    if abs(x) > 1e-3:
+        return (math.expm1(x) - x) / (x * x)
+    return 0.5 + x / 6 + x * x / 24 + x ** 3 / 120
+
+
+def deteriorating_eoq_batch(demands, setups, holdings, tassi, vite_utili=None,
+                            costi_unitari=0.0, iterazioni=60):
+    ''' EOQ per merce deperibile, calcolato in blocco per tutti gli articoli.
+    Con tasso di deterioramento esponenziale t (per anno) la giacenza di un
+    ciclo di durata T segue dI/dt = -D - t*I; il costo annuo è
+        C(T) = S/T + (h + c*t) * D * T * (e^(tT) - 1 - tT) / (tT)^2
+    (c = costo unitario della merce persa) e il lotto è Q = D*(e^(tT) - 1)/t.
+    Lo zero della derivata di C viene cercato per bisezione su tutti gli
+    articoli insieme, tra 0 e il ciclo di Wilson (che è sempre un estremo
+    superiore). Con vita utile (giorni) il ciclo non può superarla.
+    Con tasso nullo il risultato coincide con il modello di Wilson.
+    Restituisce le colonne (Q, ciclo in anni, costi ordini, costi magazzino) '''
+    n = len(demands)
+    costi_unitari = _column(costi_unitari, n)
+    vite_utili = _column(vite_utili, n)
+    slopes = [(h + c * t) * d for d, h, c, t in zip(demands, holdings, costi_unitari, tassi)]
+
+    # Derivata di T*C(T) rispetto a T: a*T^2*(f1(x) - f2(x)) - S con x = t*T
+    low = [0.0] * n
+    high = [math.sqrt(2 * s / (h * d)) for d, s, h in zip(demands, setups, holdings)]
+    for _ in range(iterazioni):
+        mid = [(lo + hi) / 2 for lo, hi in zip(low, high)]
+        positive = [
+            a * m * m * (_expm1_ratio(t * m) - _expm1_minus_x_ratio(t * m)) > s
+            for a, m, t, s in zip(slopes, mid, tassi, setups)
+        ]
+        high = [m if p else hi for m, p, hi in zip(mid, positive, high)]
+        low = [lo if p else m for m, p, lo in zip(mid, positive, low)]
+
+    cycles = [
+        min(hi, life / GIORNI_ANNO) if life else hi
+        for hi, life in zip(high, vite_utili)
+    ]
+    quantities = [d * T * _expm1_ratio(t * T) for d, T, t in zip(demands, cycles, tassi)]
+    ordering = [s / T for s, T in zip(setups, cycles)]
+    holding_costs = [
+        a * T * _expm1_minus_x_ratio(t * T) for a, T, t in zip(slopes, cycles, tassi)
+    ]
+    return quantities, cycles, ordering, holding_costs
+
+
+def calculate_deteriorating_records(data):
+    ''' Calcola l'EOQ per merce deperibile (campi facoltativi
+    tasso_deterioramento, vita_utile e costo_unitario dei record) e
+    restituisce (risultati nello stesso formato di get_results_dict,
+    report di validazione). Il costo di magazzino comprende il valore
+    della merce deteriorata '''
+    records, issues = validate_records(data)
+    demands = [record["domanda_annua"] for record in records]
+    quantities, cycles, ordering, holding = deteriorating_eoq_batch(
+        demands,
+        [record["costo_setup"] for record in records],
+        [record["costo_mantenimento"] for record in records],
+        [record.get("tasso_deterioramento", 0.0) for record in records],
+        vite_utili=[record.get("vita_utile") for record in records],
+        costi_unitari=[record.get("costo_unitario", 0.0) for record in records]
+    )
+    results = [
+        {
+            "Codice": record_key(record)[0],
+            "Anno": int(record["anno"]),
+            "Domanda Annua (pz)": int(round(demand)),
+            "EOQ (pz)": int(round(q)),
+            "Costo Ordini Annuo (€)": cost_o,
+            "Costo Magazzino Annuo (€)": cost_h,
+            "Costo Totale Annuo (€)": cost_o + cost_h,
+            "Ordini/Anno": int(round(1 / cycle)),
+            "Giorni tra ordini": int(round(GIORNI_ANNO * cycle))
+        }
+        for record, demand, q, cycle, cost_o, cost_h in zip(
+            records, demands, quantities, cycles, ordering, holding
+        )
+    ]
+    return format_results_bulk(results), issues
+
+
+def interpolate_years(records, campi=CAMPI_NUMERICI + ("costo_unitario",)):
+    ''' Completa le serie annuali di ogni articolo aggiungendo gli anni
+    mancanti tra il primo e l'ultimo, con interpolazione lineare dei campi
+    indicati (calcolata per colonna). I record aggiunti hanno
+    "interpolato": True '''
+    history = {}
+    for record in sorted(records, key=lambda r: (record_key(r)[0], r["anno"])):
+        history.setdefault(record_key(record)[0], []).append(record)
+
+    completed = []
+    for code, series in history.items():
+        for left, right in zip(series, series[1:]):
+            completed.append(left)
+            gap = right["anno"] - left["anno"]
+            if gap <= 1:
+                continue
+            weights = [step / gap for step in range(1, gap)]
+            columns = {
+                field: [left[field] + w * (right[field] - left[field]) for w in weights]
+                for field in campi if field in left and field in right
+            }
+            for index, w in enumerate(weights):
+                record = {"anno": left["anno"] + index + 1, "interpolato": True}
+                if code:
+                    record["codice"] = code
+                for field, values in columns.items():
+                    record[field] = values[index]
+                completed.append(record)
+        completed.append(series[-1])
+    return completed
+
+
+def _discount_ratio(x):
+    # (1 - e^-x) / x, che tende a 1 per x -> 0
+    return -math.expm1(-x) / x if abs(x) > 1e-6 else 1 - x / 2 + x * x / 6
+
+
+def _discount_holding_ratio(x):
+    # (x - (1 - e^-x)) / x^2, che tende a 1/2 per x -> 0
+    if abs(x) > 1e-3:
+        return (x + math.expm1(-x)) / (x * x)
+    return 0.5 - x / 6 + x * x / 24 - x ** 3 / 120
+
+
+def dcf_eoq_batch(demands, setups, holdings, costo_capitale, inflazione=0.0,
+                  costi_unitari=0.0, iterazioni=80):
+    ''' EOQ a flussi di cassa attualizzati, calcolato in blocco.
+    Tutti i costi crescono con l'inflazione e vengono attualizzati al costo
+    del capitale, quindi si usa il tasso reale continuo
+        r = ln(1 + costo_capitale) - ln(1 + inflazione).
+    Con ordini di costo S e acquisto di c*D*T all'inizio di ogni ciclo e
+    mantenimento h sulla giacenza, il costo annuo equivalente
+    (r per il valore attuale) di un ciclo T, al netto dell'acquisto della
+    domanda c*D che non dipende dal lotto, è
+        C(T) = (S + c*D*T + h*D*T^2*g(rT)) / (T*f(rT)) - c*D
+    con f(x) = (1 - e^-x)/x e g(x) = (x - 1 + e^-x)/x^2; con r = 0 e c = 0
+    coincide con il modello di Wilson. Il minimo viene cercato con la
+    sezione aurea su tutti gli articoli insieme, con cicli non oltre
+    CICLO_MASSIMO_DCF anni: se il costo del capitale reale non compensa il
+    mantenimento (h + c*r <= 0) il costo scende sempre al crescere del
+    ciclo e il risultato è il ciclo massimo.
+    Restituisce le colonne (Q, ciclo in anni, costi ordini, costi magazzino) '''
+    n = len(demands)
+    rates = [
+        math.log1p(k) - math.log1p(i)
+        for k, i in zip(_column(costo_capitale, n), _column(inflazione, n))
+    ]
+    costi_unitari = _column(costi_unitari, n)
+
+    def cost(T, d, s, h, c, r):
+        x = r * T
+        return (s + c * d * T + h * d * T * T * _discount_holding_ratio(x)) / (T * _discount_ratio(x)) - c * d
+
+    # Sezione aurea tra un ciclo molto breve e il doppio del ciclo di Wilson;
+    # con inflazione maggiore del costo del capitale (r < 0) il minimo può
+    # stare oltre, quindi l'estremo superiore raddoppia finché il costo non
+    # risale, fino al ciclo massimo. Senza minimo si cerca subito fino al
+    # ciclo massimo
+    ratio = (math.sqrt(5) - 1) / 2
+    params = list(zip(demands, setups, holdings, costi_unitari, rates))
+    low = [1e-9] * n
+    high = []
+    for p in params:
+        d, s, h, c, r = p
+        hi = min(2 * math.sqrt(2 * s / (h * d)), CICLO_MASSIMO_DCF)
+        if h + c * r <= 0:
+            hi = CICLO_MASSIMO_DCF
+        while hi < CICLO_MASSIMO_DCF and cost(hi, *p) <= cost(hi / 2, *p):
+            hi = min(hi * 2, CICLO_MASSIMO_DCF)
+        high.append(hi)
+    for _ in range(iterazioni):
+        left = [hi - ratio * (hi - lo) for lo, hi in zip(low, high)]
+        right = [lo + ratio * (hi - lo) for lo, hi in zip(low, high)]
+        better_left = [
+            cost(a, *p) < cost(b, *p) for a, b, p in zip(left, right, params)
+        ]
+        high = [b if bl else hi for b, bl, hi in zip(right, better_left, high)]
+        low = [lo if bl else a for a, bl, lo in zip(left, better_left, low)]
+
+    cycles = [(lo + hi) / 2 for lo, hi in zip(low, high)]
+    quantities = [d * T for (d, _, _, _, _), T in zip(params, cycles)]
+    ordering = [s / (T * _discount_ratio(r * T)) for (_, s, _, _, r), T in zip(params, cycles)]
+    holding_costs = [
+        cost(T, *p) - o for T, p, o in zip(cycles, params, ordering)
+    ]
+    return quantities, cycles, ordering, holding_costs
+
+
+def calculate_dcf_records(data, costo_capitale, inflazione=0.0, interpola=True):
+    ''' Calcola l'EOQ a flussi di cassa attualizzati per tutti gli articoli e
+    gli anni, completando prima gli anni mancanti per interpolazione.
+    Il costo di magazzino comprende il costo del capitale immobilizzato
+    (campo facoltativo costo_unitario). Costo del capitale e inflazione
+    sono scalari, uguali per tutti i record (l'interpolazione cambia il
+    numero di righe; per tassi diversi per riga usare dcf_eoq_batch).
+    Gli articoli senza minimo, limitati a CICLO_MASSIMO_DCF anni, sono
+    segnalati nel report con il codice. Restituisce (risultati nel
+    formato di get_results_dict, report di validazione) '''
+    if not all(_is_number(rate) for rate in (costo_capitale, inflazione)):
+        raise ValueError("Costo del capitale e inflazione devono essere numeri")
+    records, issues = validate_records(data)
+    if interpola:
+        records = interpolate_years(records)
+    demands = [record["domanda_annua"] for record in records]
+    quantities, cycles, ordering, holding = dcf_eoq_batch(
+        demands,
+        [record["costo_setup"] for record in records],
+        [record["costo_mantenimento"] for record in records],
+        costo_capitale,
+        inflazione,
+        costi_unitari=[record.get("costo_unitario", 0.0) for record in records]
+    )
+    results = [
+        {
+            "Codice": record_key(record)[0],
+            "Anno": int(record["anno"]),
+            "Domanda Annua (pz)": int(round(demand)),
+            "EOQ (pz)": int(round(q)),
+            "Costo Ordini Annuo (€)": cost_o,
+            "Costo Magazzino Annuo (€)": cost_h,
+            "Costo Totale Annuo (€)": cost_o + cost_h,
+            "Ordini/Anno": int(round(1 / cycle)),
+            "Giorni tra ordini": int(round(GIORNI_ANNO * cycle))
+        }
+        for record, demand, q, cycle, cost_o, cost_h in zip(
+            records, demands, quantities, cycles, ordering, holding
+        )
+    ]
+    for record, cycle in zip(records, cycles):
+        if cycle >= CICLO_MASSIMO_DCF * (1 - 1e-6):
+            issues.append({
+                "riga": None, "anno": record["anno"], "codice": record_key(record)[0], "campo": "ciclo",
+                "motivo": f"Costo sempre decrescente: ciclo limitato a {CICLO_MASSIMO_DCF:g} anni"
+            })
+    return format_results_bulk(results), issues
+
+
+def wilson_batch(demands, setups, holdings):
+    ''' Modello di Wilson in blocco: restituisce le colonne
+    (EOQ, costi ordini, costi magazzino) '''
+    eoqs = [math.sqrt(2 * d * s / h) for d, s, h in zip(demands, setups, holdings)]
+    ordering = [d / q * s for d, s, q in zip(demands, setups, eoqs)]
+    holding_costs = [q / 2 * h for h, q in zip(holdings, eoqs)]
+    return eoqs, ordering, holding_costs
+
+
+def load_network(sources):
+    ''' Legge i file dei magazzini: sources è un dizionario
+    {magazzino: percorso} oppure una lista di percorsi/glob (il nome del
+    magazzino è il nome del file senza estensione o, se più file hanno lo
+    stesso nome come milano/dati.json e roma/dati.json, quello della
+    cartella; solleva ValueError se i nomi restano duplicati). Restituisce
+    (record validi con il campo "magazzino", errori per file) '''
+    if not isinstance(sources, dict):
+        paths = resolve_input_paths(sources)
+        names = [os.path.splitext(os.path.basename(strip_compression(path)))[0] for path in paths]
+        names = [
+            os.path.basename(os.path.dirname(os.path.abspath(path))) if names.count(name) > 1 else name
+            for path, name in zip(paths, names)
+        ]
+        duplicates = sorted(set(name for name in names if names.count(name) > 1))
+        if duplicates:
+            raise ValueError(f"Nomi di magazzino duplicati: {', '.join(duplicates)}")
+        sources = dict(zip(names, paths))
+    records = []
+    errors = []
+    for location, path in sources.items():
+        try:
+            if is_ndjson(path):
+                with open_input(path, 'rb') as file:
+                    data, invalid = parse_ndjson_records(file.read())
+                if invalid:
+                    errors.append(f"{path}: {len(invalid)} righe JSON non valide")
+            else:
+                with open_input(path, 'r') as file:
+                    data = json.load(file)
+        except (OSError, EOFError, lzma.LZMAError, json.JSONDecodeError) as e:
+            errors.append(f"{path}: {str(e)}")
+            continue
+        valid, issues = validate_records(data)
+        if issues:
+            errors.append(f"{path}: {len(issues)} errori di validazione")
+        for record in valid:
+            records.append(dict(record, magazzino=location))
+    return records, errors
+
+
+def network_eoq(records, z=0.0, lead_time=0):
+    ''' Confronta la gestione per magazzino con quella centralizzata per
+    ogni (codice, anno). La rete centralizzata ordina la domanda totale con
+    costo di setup e mantenimento medi pesati sulla domanda. Se i record
+    hanno il campo facoltativo dev_std_domanda (annua) e z > 0, si aggiunge
+    la scorta di sicurezza z * sigma * sqrt(lead_time / GIORNI_ANNO), che
+    centralizzando usa sigma = sqrt(somma delle varianze) (domande
+    indipendenti). Restituisce (risultati per magazzino nel formato di
+    get_results_dict con "Magazzino", riepilogo per articolo) '''
+    demands = [record["domanda_annua"] for record in records]
+    setups = [record["costo_setup"] for record in records]
+    holdings = [record["costo_mantenimento"] for record in records]
+    sigmas = [record.get("dev_std_domanda", 0.0) for record in records]
+    factor = z * math.sqrt(lead_time / GIORNI_ANNO)
+    eoqs, ordering, holding = wilson_batch(demands, setups, holdings)
+    safety = [factor * sigma * h for sigma, h in zip(sigmas, holdings)]
+
+    # Riduzioni per gruppo (codice, anno) in un'unica passata
+    groups = {}
+    for record, d, s, h, sigma, cost_o, cost_h, cost_ss in zip(
+        records, demands, setups, holdings, sigmas, ordering, holding, safety
+    ):
+        key = record_key(record)
+        totals = groups.get(key)
+        if totals is None:
+            totals = groups[key] = [0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        totals[0] += 1
+        totals[1] += d
+        totals[2] += d * s
+        totals[3] += d * h
+        totals[4] += sigma * sigma
+        totals[5] += cost_o + cost_h + cost_ss
+
+    keys = sorted(groups, key=lambda k: (k[1], k[0]))
+    central_demand = [groups[k][1] for k in keys]
+    central_setup = [groups[k][2] / groups[k][1] for k in keys]
+    central_holding = [groups[k][3] / groups[k][1] for k in keys]
+    central_eoq, central_o, central_h = wilson_batch(central_demand, central_setup, central_holding)
+
+    summary = []
+    for key, d, h, q, cost_o, cost_h in zip(
+        keys, central_demand, central_holding, central_eoq, central_o, central_h
+    ):
+        count, _, _, _, variance, local_cost = groups[key]
+        central_cost = cost_o + cost_h + factor * math.sqrt(variance) * h
+        summary.append({
+            "Codice": key[0],
+            "Anno": int(key[1]),
+            "Magazzini": count,
+            "Domanda Totale (pz)": int(round(d)),
+            "EOQ Centrale (pz)": int(round(q)),
+            "Costo Totale Locale (€)": local_cost,
+            "Costo Totale Centrale (€)": central_cost,
+            "Risparmio (€)": local_cost - central_cost,
+            "Risparmio (%)": round(100 * (local_cost - central_cost) / local_cost, 2) if local_cost else 0.0
+        })
+
+    per_location = [
+        {
+            "Magazzino": record.get("magazzino", ""),
+            "Codice": record_key(record)[0],
+            "Anno": int(record["anno"]),
+            "Domanda Annua (pz)": int(round(d)),
+            "EOQ (pz)": int(round(q)),
+            "Costo Ordini Annuo (€)": cost_o,
+            "Costo Magazzino Annuo (€)": cost_h + cost_ss,
+            "Costo Totale Annuo (€)": cost_o + cost_h + cost_ss,
+            "Ordini/Anno": int(round(d / q)),
+            "Giorni tra ordini": int(round(GIORNI_ANNO * q / d))
+        }
+        for record, d, q, cost_o, cost_h, cost_ss in zip(records, demands, eoqs, ordering, holding, safety)
+    ]
+    for column in ("Costo Totale Locale (€)", "Costo Totale Centrale (€)", "Risparmio (€)"):
+        for row, text in zip(summary, format_money_bulk(row[column] for row in summary)):
+            row[column] = text
+    return format_results_bulk(per_location), summary
+
+
+def is_ndjson(path):
+    return strip_compression(path).lower().endswith(ESTENSIONI_NDJSON)
+
+
+def parse_ndjson_records(content):
+    ''' Record di un contenuto NDJSON (bytes), ignorando le righe vuote.
+    Restituisce (record, numeri di riga da 1 delle righe non valide) '''
+    records = []
+    invalid = []
+    for number, line in enumerate(content.split(b"\n"), start=1):
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            invalid.append(number)
+    return records, invalid
+
+
+def ndjson_chunks(path, n_chunks):
+    ''' Divide un file NDJSON in al più n_chunks intervalli di byte
+    (inizio, fine) che iniziano e finiscono a capo riga '''
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as file:
+        for i in range(1, n_chunks):
+            file.seek(max(size * i // n_chunks, bounds[-1]))
+            if file.tell() > 0:
+                file.seek(file.tell() - 1)
+                file.readline()  # Avanza fino alla fine della riga corrente
+            position = min(file.tell(), size)
+            if position > bounds[-1]:
+                bounds.append(position)
+    if size > bounds[-1]:
+        bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def _process_ndjson_chunk(task):
+    ''' Legge e calcola un intervallo di byte di un file NDJSON non compresso '''
+    path, start, end, store_path = task
+    with open(path, 'rb') as file:
+        file.seek(start)
+        content = file.read(end - start)
+    return _process_ndjson_block((content, store_path))
+
+
+def _process_ndjson_block(task):
+    ''' Valida e calcola un blocco di righe NDJSON. I numeri di riga del
+    report sono relativi al blocco e vengono corretti nella fusione.
+    Restituisce (risultati, report di validazione, righe lette) '''
+    content, store_path = task
+    return _calculate_ndjson_block(content, store_path)[:3]
+
+
+def _calculate_ndjson_block(content, store_path=None, formatta=True, valuta_esatta=VALUTA_ESATTA):
+    # Come _process_ndjson_block, con in più la riga (da 1) di ciascun risultato;
+    # con formatta=False i costi restano numerici (vedi calculate_records)
+    lines = content.split(b"\n")
+    if lines and lines[-1] == b"":
+        lines.pop()
+
+    records = []
+    line_numbers = []  # Riga (da 1) di ciascun record nel blocco
+    issues = []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+            line_numbers.append(number)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            issues.append({"riga": number, "anno": None, "campo": "record",
+                           "motivo": "Riga JSON non valida"})
+
+    store = ResultStore(store_path) if store_path else None
+    try:
+        calculator = EOQCalculator(valuta_esatta)
+        results, _ = calculator.calculate_records(records, store=store, formatta=formatta)
+    finally:
+        if store is not None:
+            store.close()
+    invalid_rows = set()
+    for issue in calculator.report_validazione:
+        invalid_rows.add(issue["riga"])
+        issue["riga"] = line_numbers[issue["riga"] - 1]
+        issues.append(issue)
+    issues.sort(key=lambda issue: issue["riga"])
+    result_lines = [
+        number for index, number in enumerate(line_numbers, start=1) if index not in invalid_rows
+    ]
+    return results, issues, len(lines), result_lines
+
+
+def ndjson_blocks(path, blocco=DIMENSIONE_BLOCCO):
+    ''' Generatore di blocchi di righe intere (circa blocco byte) di un
+    file NDJSON letto in sequenza, usato per i file compressi su cui non
+    si può saltare a un offset '''
+    with open_input(path, 'rb') as file:
+        while True:
+            lines = file.readlines(blocco)
+            if not lines:
+                return
+            yield b"".join(lines)
+
+
+def _bounded_map(executor, function, tasks, in_volo):
+    # Come executor.map, ma con al più in_volo task inviati e non ancora consumati
+    pending = deque()
+    for task in tasks:
+        if len(pending) >= in_volo:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, task))
+    while pending:
+        yield pending.popleft().result()
+
+
+def read_ndjson_parallel(path, max_workers=MAX_PROCESSI, chunks_per_worker=4, store_path=None):
+    ''' Legge un file NDJSON (un record per riga) dividendolo in intervalli
+    di byte allineati a capo riga: ogni intervallo viene letto, validato e
+    calcolato da un processo separato e i risultati vengono uniti
+    nell'ordine del file. I file compressi vengono decompressi in sequenza
+    e divisi in blocchi di righe man mano che vengono letti.
+    Restituisce (risultati, report di validazione con i numeri di riga del file) '''
+    if compression_of(path) is not None:
+        function = _process_ndjson_block
+        tasks = ((block, store_path) for block in ndjson_blocks(path))
+    else:
+        function = _process_ndjson_chunk
+        chunks = ndjson_chunks(path, max(1, max_workers * chunks_per_worker))
+        tasks = [(path, start, end, store_path) for start, end in chunks]
+
+    results = []
+    issues = []
+    offset = 0  # Righe dei blocchi precedenti
+
+    def merge(outputs):
+        nonlocal offset
+        for chunk_results, chunk_issues, n_lines in outputs:
+            results.extend(chunk_results)
+            for issue in chunk_issues:
+                issue["riga"] += offset
+                issues.append(issue)
+            offset += n_lines
+
+    if max_workers <= 1 or (isinstance(tasks, list) and len(tasks) <= 1):
+        merge(map(function, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            merge(_bounded_map(executor, function, tasks, max_workers * 2))
+    return results, issues
+
+
+class SharedResults:
+    ''' Buffer dei risultati in memoria condivisa (multiprocessing.shared_memory)
+    a colonne di larghezza fissa, una riga per riga del file di input. I
+    processi di calcolo scrivono direttamente nel buffer e il processo
+    principale legge le colonne come memoryview, senza copie né pickle.
+    Le righe non valide o vuote hanno "valido" a 0. In modalità valuta
+    esatta (esatta=True) i costi sono centesimi interi, senza perdere la
+    precisione dei Decimal. Se name è None il
+    buffer viene creato (e va rilasciato con close/unlink o con with),
+    altrimenti ci si collega a un buffer esistente: i processi figli
+    condividono il resource tracker del padre, che resta l'unico a
+    eliminare il segmento '''
+
+    # (colonna, typecode); prima le colonne a 8 byte per l'allineamento
+    COLONNE = (
+        ("domanda", "d"), ("eoq", "d"), ("costo_ordini", "d"), ("costo_magazzino", "d"),
+        ("costo_totale", "d"), ("ordini", "d"), ("giorni", "d"), ("anno", "i"), ("valido", "B"),
+    )
+    COSTI = ("costo_ordini", "costo_magazzino", "costo_totale")  # Come COLONNE_COSTI
+
+    def __init__(self, capacita, name=None, esatta=False):
+        self.capacita = capacita
+        self.proprietario = name is None
+        self.esatta = esatta
+        columns = [
+            (field, "q" if esatta and field in self.COSTI else typecode)
+            for field, typecode in self.COLONNE
+        ]
+        row_size = sum(array(typecode).itemsize for _, typecode in columns) + LARGHEZZA_CODICE
+        self.shm = shared_memory.SharedMemory(name=name, create=self.proprietario,
+                                              size=max(1, capacita * row_size))
+        self.colonne = {}
+        offset = 0
+        for field, typecode in columns:
+            size = capacita * array(typecode).itemsize
+            self.colonne[field] = self.shm.buf[offset:offset + size].cast(typecode)
+            offset += size
+        self.codici = self.shm.buf[offset:offset + capacita * LARGHEZZA_CODICE]
+        if self.proprietario:
+            self.colonne["valido"][:] = bytes(capacita)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, row, result):
+        # Scrive un risultato con i costi numerici (calculate_records con
+        # formatta=False) nella riga indicata
+        code = result["Codice"].encode("utf-8")
+        if len(code) > LARGHEZZA_CODICE:
+            raise ValueError(f"Codice più lungo di {LARGHEZZA_CODICE} byte")
+        start = row * LARGHEZZA_CODICE
+        self.codici[start:start + LARGHEZZA_CODICE] = code.ljust(LARGHEZZA_CODICE, b"\0")
+        columns = self.colonne
+        columns["anno"][row] = result["Anno"]
+        columns["domanda"][row] = result["Domanda Annua (pz)"]
+        columns["eoq"][row] = result["EOQ (pz)"]
+        for field, column in zip(self.COSTI, COLONNE_COSTI):
+            if self.esatta:
+                columns[field][row] = int(to_decimal(result[column]).scaleb(2))
+            else:
+                columns[field][row] = result[column]
+        columns["ordini"][row] = result["Ordini/Anno"]
+        columns["giorni"][row] = result["Giorni tra ordini"]
+        columns["valido"][row] = 1
+
+    def code(self, row):
+        start = row * LARGHEZZA_CODICE
+        return bytes(self.codici[start:start + LARGHEZZA_CODICE]).rstrip(b"\0").decode("utf-8")
+
+    def rows(self):
+        # Indici delle righe con un risultato valido
+        return list(itertools.compress(range(self.capacita), self.colonne["valido"]))
+
+    def cost(self, field, row):
+        # Costo della riga: float, o Decimal al centesimo in modalità esatta
+        value = self.colonne[field][row]
+        return Decimal(value).scaleb(-2) if self.esatta else value
+
+    def results(self):
+        ''' Converte le righe valide nei dizionari di get_results_dict
+        (costi formattati in blocco): da chiamare solo per mostrarle nella
+        tabella della GUI '''
+        rows = self.rows()
+        c = self.colonne
+        results = [
+            {
+                "Codice": self.code(row),
+                "Anno": c["anno"][row],
+                "Domanda Annua (pz)": int(c["domanda"][row]),
+                "EOQ (pz)": int(c["eoq"][row]) if c["eoq"][row].is_integer() else c["eoq"][row],
+                "Costo Ordini Annuo (€)": self.cost("costo_ordini", row),
+                "Costo Magazzino Annuo (€)": self.cost("costo_magazzino", row),
+                "Costo Totale Annuo (€)": self.cost("costo_totale", row),
+                "Ordini/Anno": int(c["ordini"][row]),
+                "Giorni tra ordini": int(c["giorni"][row]),
+            }
+            for row in rows
+        ]
+        return format_results_bulk(results)
+
+    def close(self):
+        # Rilascia le viste prima di chiudere il segmento
+        for view in self.colonne.values():
+            view.release()
+        self.codici.release()
+        self.colonne = {}
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        if self.proprietario:
+            self.unlink()
+
+
+def _process_ndjson_shared(task):
+    ''' Calcola un blocco NDJSON (intervallo di byte o contenuto già letto)
+    scrivendo i risultati nel buffer condiviso alle righe del file.
+    I costi passano dal calcolo al buffer come numeri, senza formattazione.
+    Restituisce solo il report di validazione, con i numeri di riga del file '''
+    source, first_line, name, capacita, store_path, esatta = task
+    if isinstance(source, bytes):
+        content = source
+    else:
+        path, start, end = source
+        with open(path, 'rb') as file:
+            file.seek(start)
+            content = file.read(end - start)
+    results, issues, _, result_lines = _calculate_ndjson_block(
+        content, store_path, formatta=False, valuta_esatta=esatta
+    )
+
+    shared = SharedResults(capacita, name, esatta)
+    try:
+        for result, number in zip(results, result_lines):
+            row = first_line + number - 1
+            try:
+                shared.write(row, result)
+            except ValueError as e:
+                issues.append({"riga": number, "anno": result["Anno"], "campo": "codice",
+                               "motivo": str(e)})
+    finally:
+        shared.close()
+    for issue in issues:
+        issue["riga"] += first_line
+    issues.sort(key=lambda issue: issue["riga"])
+    return issues
+
+
+def _count_lines(content):
+    # Righe di un blocco NDJSON (l'ultima può non terminare con a capo)
+    return content.count(b"\n") + (1 if content and not content.endswith(b"\n") else 0)
+
+
+def read_ndjson_shared(path, max_workers=MAX_PROCESSI, chunks_per_worker=4, store_path=None,
+                       valuta_esatta=VALUTA_ESATTA):
+    ''' Come read_ndjson_parallel, ma i processi scrivono i risultati in un
+    SharedResults (una riga per riga del file) invece di restituirli; con
+    valuta_esatta i costi sono calcolati in Decimal e salvati in centesimi.
+    Restituisce (SharedResults, report di validazione): il chiamante
+    rilascia il buffer con with oppure close() e unlink() '''
+    if compression_of(path) is not None:
+        # Senza offset: una prima passata conta le righe per dimensionare il buffer
+        capacita = sum(_count_lines(block) for block in ndjson_blocks(path))
+        sources = ndjson_blocks(path)
+    else:
+        with open(path, 'rb') as file:
+            sources = []
+            for start, end in ndjson_chunks(path, max(1, max_workers * chunks_per_worker)):
+                file.seek(start)
+                sources.append(((path, start, end), _count_lines(file.read(end - start))))
+        capacita = sum(n_lines for _, n_lines in sources)
+
+    def tasks(name):
+        first_line = 0
+        for source in sources:
+            if isinstance(source, bytes):
+                n_lines = _count_lines(source)
+            else:
+                source, n_lines = source
+            yield source, first_line, name, capacita, store_path, valuta_esatta
+            first_line += n_lines
+
+    shared = SharedResults(capacita, esatta=valuta_esatta)
+    issues = []
+    try:
+        if max_workers <= 1:
+            for chunk_issues in map(_process_ndjson_shared, tasks(shared.name)):
+                issues.extend(chunk_issues)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                outputs = _bounded_map(executor, _process_ndjson_shared, tasks(shared.name), max_workers * 2)
+                for chunk_issues in outputs:
+                    issues.extend(chunk_issues)
+    except BaseException:
+        shared.close()
+        shared.unlink()
+        raise
+    return shared, issues
+
+
+def resolve_input_paths(specs):
+    ''' Espande una lista di file, cartelle (tutti i file di input
+    contenuti) e glob in una lista ordinata e senza duplicati '''
+    paths = []
+    for spec in specs:
+        if os.path.isdir(spec):
+            found = sorted(
+                path for path in glob.glob(os.path.join(spec, "*"))
+                if strip_compression(path).lower().endswith(ESTENSIONI_INPUT)
+            )
+        elif glob.has_magic(spec):
+            found = sorted(glob.glob(spec))
+        else:
+            found = [spec]
+        for path in found:
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def process_file(path, store_path=None):
+    ''' Elabora un singolo file (anche in un processo separato) e
+    restituisce un report con risultati ed eventuali errori del file '''
+    report = {
+        "file": path,
+        "results": [],
+        "invalid_years": [],
+        "validation": [],
+        "error": None
+    }
+    if is_ndjson(path):
+        # Già in un processo separato: l'NDJSON viene letto in sequenza
+        try:
+            results, issues = read_ndjson_parallel(path, max_workers=1, store_path=store_path)
+            report["results"] = results
+            report["validation"] = issues
+            report["invalid_years"] = [i["anno"] for i in issues if i["campo"] == "anno"]
+        except (OSError, EOFError, lzma.LZMAError) as e:
+            report["error"] = f"ERRORE: {str(e)}"
+        return report
+
+    store = ResultStore(store_path) if store_path else None
+    try:
+        calculator = EOQCalculator()
+        output = calculator.read_from_json(path, store=store)
+        if output and "error" in output[0]:
+            report["error"] = output[0]["error"]
+        else:
+            report["results"], report["invalid_years"] = output
+            report["validation"] = calculator.report_validazione
+    except Exception as e:
+        report["error"] = f"ERRORE: {str(e)}"
+    finally:
+        if store is not None:
+            store.close()
+    return report
+
+
+def process_files(paths, max_workers=MAX_PROCESSI, store_path=None):
+    ''' Elabora più file in parallelo con un numero limitato di processi.
+    I report vengono restituiti nello stesso ordine dei percorsi '''
+    worker = partial(process_file, store_path=store_path)
+    if max_workers <= 1 or len(paths) <= 1:
+        return [worker(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+        return list(executor.map(worker, paths))
+
+
+def merge_reports(reports):
+    ''' Unisce i risultati di più file ordinandoli per anno e codice
+    (a parità di chiave vale l'ordine dei file) e raccoglie gli errori '''
+    results = []
+    errors = []
+    for report in reports:
+        results.extend(report["results"])
+        if report["error"]:
+            errors.append(f"{report['file']}: {report['error']}")
+    results.sort(key=lambda x: (int(x.get("Anno", 0)), x.get("Codice", "")))
+    return results, errors
+
+
+def write_atomic(path, content):
+    ''' Scrive un file (testo in UTF-8 o bytes) in modo atomico e duraturo:
+    file temporaneo nella stessa cartella, fsync e os.replace sul percorso finale '''
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    temp = os.path.join(os.path.dirname(path) or ".", ".tmp-" + os.path.basename(path))
+    with open(temp, 'wb') as file:
+        file.write(content)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp, path)
+
+
+def file_digest(path):
+    # Hash del contenuto di un file, letto a blocchi
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(DIMENSIONE_BLOCCO), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def batch_chunks(path, dimensione=RECORD_PER_BLOCCO):
+    ''' Generatore dei blocchi di un file di input: righe NDJSON (bytes) o
+    fette di dimensione record di un array JSON. Un JSON non valido
+    solleva json.JSONDecodeError prima del primo blocco '''
+    if is_ndjson(path):
+        with open_input(path, 'rb') as file:
+            while True:
+                lines = list(itertools.islice(file, dimensione))
+                if not lines:
+                    return
+                yield b"".join(lines)
+    else:
+        with open_input(path, 'r') as file:
+            data = json.load(file)
+        if not isinstance(data, list):
+            raise ValueError("Il file JSON deve contenere una lista di record")
+        for start in range(0, len(data), dimensione):
+            yield data[start:start + dimensione]
+
+
+def process_chunk(chunk, store_path=None):
+    ''' Calcola un blocco prodotto da batch_chunks. Restituisce
+    (risultati, report di validazione con righe relative al blocco, righe) '''
+    if isinstance(chunk, bytes):
+        return _process_ndjson_block((chunk, store_path))
+    store = ResultStore(store_path) if store_path else None
+    try:
+        calculator = EOQCalculator()
+        results, _ = calculator.calculate_records(chunk, store=store)
+    finally:
+        if store is not None:
+            store.close()
+    return results, calculator.report_validazione, len(chunk)
+
+
+def write_results_csv(path, parts):
+    ''' Scrive in CSV (compresso se richiesto dall'estensione) i risultati
+    delle parti, nell'ordine dato, con le colonne della tabella.
+    Restituisce (numero di risultati, report di validazione con le righe
+    del file di input) '''
+    columns = [key for _, key, _ in COLONNE_TABELLA]
+    count = 0
+    issues = []
+    offset = 0  # Righe delle parti precedenti
+    temp = os.path.join(os.path.dirname(path) or ".", ".tmp-" + os.path.basename(path))
+    with open_output(temp, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        for part in parts:
+            writer.writerows([result[key] for key in columns] for result in part["risultati"])
+            count += len(part["risultati"])
+            for issue in part["report"]:
+                issues.append(dict(issue, riga=issue["riga"] + offset))
+            offset += part["righe"]
+    os.replace(temp, path)
+    return count, issues
+
+
+def run_batch(path, output, checkpoint_dir=None, dimensione=RECORD_PER_BLOCCO, store_path=None):
+    ''' Elaborazione di un file di input grande con checkpoint: ogni blocco
+    calcolato viene salvato in un file parziale e il checkpoint (hash
+    dell'input, dimensione dei blocchi, blocchi completati) viene
+    aggiornato in modo atomico. Una nuova esecuzione sullo stesso input
+    salta i blocchi già completati; alla fine i file parziali vengono uniti
+    in output (CSV) e la cartella di checkpoint viene rimossa, quindi
+    l'output è identico byte per byte a quello di un'esecuzione senza
+    interruzioni. Restituisce (numero di risultati, report di validazione) '''
+    checkpoint_dir = checkpoint_dir or output + ".checkpoint"
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    checkpoint_path = os.path.join(checkpoint_dir, "checkpoint.json")
+    firma = {"input": file_digest(path), "dimensione": dimensione}
+
+    completed = 0
+    try:
+        with open(checkpoint_path, 'r', encoding='utf-8') as file:
+            checkpoint = json.load(file)
+        if checkpoint["firma"] == firma:
+            completed = checkpoint["completati"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass  # Nessun checkpoint valido: si riparte dall'inizio
+
+    def part_path(index):
+        return os.path.join(checkpoint_dir, f"parte_{index:06d}.json")
+
+    index = -1
+    for index, chunk in enumerate(batch_chunks(path, dimensione)):
+        if index < completed:
+            continue
+        results, issues, n_lines = process_chunk(chunk, store_path)
+        write_atomic(part_path(index), json.dumps(
+            {"risultati": results, "report": issues, "righe": n_lines}, ensure_ascii=False
+        ))
+        write_atomic(checkpoint_path, json.dumps({"firma": firma, "completati": index + 1}))
+
+    def parts():
+        for i in range(index + 1):
+            with open(part_path(i), 'r', encoding='utf-8') as file:
+                yield json.load(file)
+
+    summary = write_results_csv(output, parts())
+    shutil.rmtree(checkpoint_dir)
+    return summary
+
+
+def _shard_path(queue_dir, index, suffix):
+    return os.path.join(queue_dir, f"shard_{index:06d}{suffix}")
+
+
+def create_shards(path, queue_dir, dimensione=RECORD_PER_BLOCCO):
+    ''' Divide un file di input in shard di dimensione record nella cartella
+    della coda (condivisa tra i nodi). Il manifest, scritto per ultimo,
+    indica il numero di shard. Restituisce il numero di shard '''
+    os.makedirs(queue_dir, exist_ok=True)
+    count = 0
+    for count, chunk in enumerate(batch_chunks(path, dimensione), start=1):
+        if isinstance(chunk, bytes):
+            shard, content = _shard_path(queue_dir, count - 1, ".ndjson"), chunk
+        else:
+            shard, content = _shard_path(queue_dir, count - 1, ".json"), json.dumps(chunk)
+        write_atomic(shard, content)
+    write_atomic(os.path.join(queue_dir, "manifest.json"),
+                 json.dumps({"input": os.path.abspath(path), "shard": count}))
+    return count
+
+
+def _shard_count(queue_dir):
+    with open(os.path.join(queue_dir, "manifest.json"), 'r', encoding='utf-8') as file:
+        return json.load(file)["shard"]
+
+
+def _write_lease(lock, durata):
+    # Scrive nel lock nodo, processo e scadenza della prenotazione; il file
+    # temporaneo è proprio del processo, così rinnovo e recupero non si
+    # sovrascrivono a vicenda il temporaneo
+    owner = f"{socket.gethostname()} {os.getpid()}"
+    temp = os.path.join(os.path.dirname(lock), f".tmp-{owner.replace(' ', '-')}-{os.path.basename(lock)}")
+    with open(temp, 'w', encoding='utf-8') as file:
+        file.write(f"{owner} {time.time() + durata:.6f}\n")
+    os.replace(temp, lock)
+
+
+def _lease_expiry(lock, durata):
+    # Scadenza della prenotazione (testo come scritto nel lock); per un lock
+    # vuoto o illeggibile (worker interrotto subito dopo averlo creato) vale
+    # la data di modifica più la durata. None se il lock non esiste più
+    try:
+        with open(lock, 'r', encoding='utf-8') as file:
+            fields = file.read().split()
+        if len(fields) == 3:
+            try:
+                float(fields[2])
+                return fields[2]
+            except ValueError:
+                pass
+        return f"{os.path.getmtime(lock) + durata:.6f}"
+    except OSError:
+        return None
+
+
+def claim_shard(queue_dir, durata=DURATA_PRENOTAZIONE):
+    ''' Prenota il primo shard libero creando il suo file di lock con
+    O_CREAT | O_EXCL, atomico anche tra nodi diversi sul filesystem
+    condiviso. Il lock contiene nodo, processo e scadenza della
+    prenotazione (durata secondi, rinnovata dal worker mentre calcola): uno
+    shard senza risultato con la prenotazione scaduta viene recuperato. Se
+    più worker vedono la stessa scadenza, solo chi crea per primo il file
+    di recupero per quella scadenza (ancora O_EXCL) prende lo shard.
+    Restituisce l'indice dello shard o None se sono tutti presi '''
+    for index in range(_shard_count(queue_dir)):
+        lock = _shard_path(queue_dir, index, ".lock")
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            if os.path.exists(_shard_path(queue_dir, index, ".risultato.json")):
+                continue
+            expiry = _lease_expiry(lock, durata)
+            if expiry is None or float(expiry) > time.time():
+                continue
+            try:
+                os.close(os.open(_shard_path(queue_dir, index, f".recupero.{expiry}"),
+                                 os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                continue
+        _write_lease(lock, durata)
+        return index
+    return None
+
+
+def run_shard_worker(queue_dir, store_path=None, durata=DURATA_PRENOTAZIONE):
+    ''' Worker della coda: prenota uno shard alla volta, lo calcola e ne
+    scrive il risultato in modo atomico, finché ci sono shard liberi.
+    Durante il calcolo un thread rinnova la prenotazione ogni terzo della
+    durata. Restituisce il numero di shard elaborati '''
+    processed = 0
+    while True:
+        index = claim_shard(queue_dir, durata)
+        if index is None:
+            return processed
+        shard = next(
+            path for path in (_shard_path(queue_dir, index, ".ndjson"), _shard_path(queue_dir, index, ".json"))
+            if os.path.exists(path)
+        )
+        done = threading.Event()
+
+        def renew(lock=_shard_path(queue_dir, index, ".lock")):
+            while not done.wait(durata / 3):
+                _write_lease(lock, durata)
+
+        renewer = threading.Thread(target=renew, daemon=True)
+        renewer.start()
+        try:
+            results, issues, n_lines = process_chunk(next(batch_chunks(shard, sys.maxsize), []), store_path)
+            write_atomic(_shard_path(queue_dir, index, ".risultato.json"), json.dumps(
+                {"risultati": results, "report": issues, "righe": n_lines}, ensure_ascii=False
+            ))
+        finally:
+            done.set()
+            renewer.join()
+        processed += 1
+
+
+def release_stale_locks(queue_dir):
+    ''' Libera gli shard prenotati ma senza risultato (worker interrotti).
+    Da usare solo quando nessun worker è in esecuzione. Restituisce gli
+    indici liberati '''
+    released = []
+    for index in range(_shard_count(queue_dir)):
+        lock = _shard_path(queue_dir, index, ".lock")
+        if os.path.exists(lock) and not os.path.exists(_shard_path(queue_dir, index, ".risultato.json")):
+            os.remove(lock)
+            released.append(index)
+    return released
+
+
+def merge_shards(queue_dir, output):
+    ''' Unisce i risultati degli shard nell'ordine dell'input e li scrive in
+    output (CSV, come run_batch con la stessa dimensione dei blocchi).
+    Solleva ValueError se alcuni shard non sono ancora stati elaborati.
+    Restituisce (numero di risultati, report di validazione) '''
+    count = _shard_count(queue_dir)
+    paths = [_shard_path(queue_dir, index, ".risultato.json") for index in range(count)]
+    missing = [index for index, path in enumerate(paths) if not os.path.exists(path)]
+    if missing:
+        raise ValueError(f"{len(missing)} shard su {count} non elaborati (primo: {missing[0]})")
+
+    def parts():
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as file:
+                yield json.load(file)
+
+    return write_results_csv(output, parts())
+
+
+def external_sort(rows, key, max_righe=MAX_CHIAVI_AGGREGAZIONE, temp_dir=None):
+    ''' Ordina un flusso di righe (liste serializzabili in JSON) con memoria
+    limitata: blocchi di max_righe righe vengono ordinati in memoria,
+    scritti su file temporanei e poi fusi con heapq.merge. L'ordinamento è
+    stabile: a parità di chiave vale l'ordine di arrivo '''
+    rows = iter(rows)
+    spills = []
+    try:
+        while True:
+            run = list(itertools.islice(rows, max_righe))
+            if not run:
+                break
+            run.sort(key=key)
+            if not spills and len(run) < max_righe:
+                yield from run  # Tutto in memoria
+                return
+            spill = tempfile.TemporaryFile(mode='w+', encoding='utf-8', dir=temp_dir)
+            spill.writelines(json.dumps(row) + "\n" for row in run)
+            spill.seek(0)
+            spills.append(spill)
+        yield from heapq.merge(*((json.loads(line) for line in spill) for spill in spills), key=key)
+    finally:
+        for spill in spills:
+            spill.close()
+
+
+def _result_rows(path, colonne):
+    # Righe [codice, anno, valori delle colonne] di un CSV dei risultati
+    with open_input(path, 'r', newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        header = next(reader, [])
+        try:
+            indexes = [header.index(column) for column in ("Codice", "Anno") + tuple(colonne)]
+        except ValueError as e:
+            raise ValueError(f"{path}: colonna mancante ({str(e)})")
+        for number, row in enumerate(reader, start=2):
+            try:
+                values = [row[i] for i in indexes]
+                yield [values[0], int(values[1])] + [float(value) for value in values[2:]]
+            except (IndexError, ValueError):
+                raise ValueError(f"{path}: riga {number} non valida")
+
+
+def _last_per_key(rows):
+    # Per righe ordinate per (codice, anno) tiene l'ultima di ogni chiave
+    previous = None
+    for row in rows:
+        if previous is not None and row[:2] != previous[:2]:
+            yield previous
+        previous = row
+    if previous is not None:
+        yield previous
+
+
+def diff_results(vecchio, nuovo, soglia=SOGLIA_DIFF, colonne=COLONNE_DIFF,
+                 max_righe=MAX_CHIAVI_AGGREGAZIONE, temp_dir=None):
+    ''' Confronta due CSV dei risultati (run_batch, merge_shards) per
+    (codice, anno) con un merge join su flussi ordinati: ogni file viene
+    ordinato con external_sort, quindi la memoria resta limitata anche con
+    decine di milioni di righe. soglia è la variazione relativa minima (un
+    numero per tutte le colonne o un dizionario colonna -> soglia).
+    Generatore delle sole righe cambiate, ordinate per codice e anno, con
+    stato "nuovo", "rimosso" o "modificato" e valori precedenti, nuovi e
+    variazioni delle colonne confrontate '''
+    soglie = soglia if isinstance(soglia, dict) else {column: soglia for column in colonne}
+    limits = [soglie.get(column, SOGLIA_DIFF) for column in colonne]
+    key = itemgetter(0, 1)
+    old_rows = _last_per_key(external_sort(_result_rows(vecchio, colonne), key, max_righe, temp_dir))
+    new_rows = _last_per_key(external_sort(_result_rows(nuovo, colonne), key, max_righe, temp_dir))
+
+    def change(row_old, row_new, status):
+        row = row_old or row_new
+        out = {"Codice": row[0], "Anno": row[1], "Stato": status}
+        for i, column in enumerate(colonne, start=2):
+            before = row_old[i] if row_old else None
+            after = row_new[i] if row_new else None
+            out[f"{column} precedente"] = before
+            out[f"{column} nuovo"] = after
+            out[f"{column} variazione"] = after - before if row_old and row_new else None
+        return out
+
+    old = next(old_rows, None)
+    new = next(new_rows, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and key(old) < key(new)):
+            yield change(old, None, "rimosso")
+            old = next(old_rows, None)
+        elif old is None or key(new) < key(old):
+            yield change(None, new, "nuovo")
+            new = next(new_rows, None)
+        else:
+            if any(
+                b != a and abs(b - a) > limit * abs(a)
+                for a, b, limit in zip(old[2:], new[2:], limits)
+            ):
+                yield change(old, new, "modificato")
+            old = next(old_rows, None)
+            new = next(new_rows, None)
+
+
+def export_diff(vecchio, nuovo, percorso, **options):
+    # Scrive in CSV le righe cambiate tra due esecuzioni; restituisce il numero di righe
+    colonne = options.get("colonne", COLONNE_DIFF)
+    header = ["Codice", "Anno", "Stato"] + [
+        f"{column} {suffix}" for column in colonne for suffix in ("precedente", "nuovo", "variazione")
+    ]
+    count = 0
+    with open_output(percorso, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=header)
+        writer.writeheader()
+        for row in diff_results(vecchio, nuovo, **options):
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def parse_number(text):
+    ''' Converte un numero scritto a mano o copiato da un foglio di calcolo:
+    accetta virgola o punto come separatore decimale e il separatore delle
+    migliaia ("1.234,5", "1,234.5", "1.234.567"). Un solo separatore seguito
+    da esattamente tre cifre ("1.000", "1,234") può essere l'uno o l'altro:
+    in quel caso solleva ValueError. Se il testo non è un numero lo
+    restituisce invariato, così la validazione lo segnala '''
+    value = text.strip().replace(" ", "").replace("\u00a0", "")
+    if "," in value and "." in value:
+        # Il separatore decimale è l'ultimo dei due
+        thousands = "." if value.rfind(",") > value.rfind(".") else ","
+        value = value.replace(thousands, "")
+    else:
+        separator = "," if "," in value else "." if "." in value else None
+        parts = value.lstrip("+-").split(separator) if separator else []
+        if len(parts) > 2 and all(len(part) == 3 and part.isdigit() for part in parts[1:]):
+            value = value.replace(separator, "")  # Solo separatori delle migliaia
+        elif len(parts) == 2 and len(parts[1]) == 3 and parts[1].isdigit() and parts[0] not in ("", "0"):
+            raise ValueError(
+                f"'{text.strip()}' è ambiguo (migliaia o decimali): scrivere"
+                f" {parts[0]}{parts[1]} oppure indicare i decimali con entrambi i separatori"
+            )
+    value = value.replace(",", ".")
+    try:
+        number = float(value)
+    except ValueError:
+        return text.strip()
+    return int(number) if number.is_integer() and "." not in value else number
+
+
+def parse_pasted_table(text):
+    ''' Legge dati incollati da un foglio di calcolo (colonne separate da
+    tabulazioni, o da punto e virgola). Con una riga di intestazione le
+    colonne vengono riconosciute per nome (anno, domanda_annua, codice,
+    fornitore, ...) e le altre ignorate; senza intestazione sono quelle di COLONNE_INCOLLA,
+    precedute dal codice se c'è una colonna in più.
+    Restituisce (record, riga del testo di ciascun record, valori ambigui):
+    i valori ambigui restano testo nel record (quindi non validi) e sono
+    descritti in un dizionario (posizione del record da 1, campo) -> motivo '''
+    lines = text.splitlines()
+    separator = "\t" if any("\t" in line for line in lines) else ";"
+    rows = [
+        (number, [cell.strip() for cell in line.split(separator)])
+        for number, line in enumerate(lines, start=1) if line.strip()
+    ]
+    if not rows:
+        return [], [], {}
+
+    known = set(CAMPI_NUMERICI) | set(CAMPI_FACOLTATIVI) | {"anno", "codice", "fornitore"}
+    header = [cell.lower().replace(" ", "_") for cell in rows[0][1]]
+    if "anno" in header:
+        fields = [name if name in known else "" for name in header]  # Colonne sconosciute ignorate
+        rows = rows[1:]
+    elif len(rows[0][1]) > len(COLONNE_INCOLLA):
+        fields = ("codice",) + COLONNE_INCOLLA
+    else:
+        fields = COLONNE_INCOLLA
+
+    records = []
+    line_numbers = []
+    ambiguous = {}
+    for number, cells in rows:
+        record = {}
+        for field, cell in zip(fields, cells):
+            if not field or cell == "":
+                continue
+            if field in ("codice", "fornitore"):
+                record[field] = cell
+                continue
+            try:
+                record[field] = parse_number(cell)
+            except ValueError as e:
+                record[field] = cell
+                ambiguous[(len(records) + 1, field)] = str(e)
+        records.append(record)
+        line_numbers.append(number)
+    return records, line_numbers, ambiguous
+
+
+def calculate_pasted(text, store=None):
+    ''' Valida in blocco e calcola con un'unica chiamata i dati incollati.
+    Restituisce (risultati, report di validazione con le righe del testo) '''
+    records, line_numbers, ambiguous = parse_pasted_table(text)
+    calculator = EOQCalculator()
+    results, _ = calculator.calculate_records(records, store=store)
+    issues = calculator.report_validazione
+    for issue in issues:
+        issue["motivo"] = ambiguous.get((issue["riga"], issue["campo"]), issue["motivo"])
+        issue["riga"] = line_numbers[issue["riga"] - 1]
+    return results, issues
+
+
+# Colonne della tabella: (intestazione, chiave del risultato, larghezza)
+COLONNE_TABELLA = (
+    ("Codice", "Codice", 80),
+    ("Anno", "Anno", 70),
+    ("Domanda Annua (pz)", "Domanda Annua (pz)", 140),
+    ("EOQ (pz)", "EOQ (pz)", 90),
+    ("Costo Ordini Annuo (€)", "Costo Ordini Annuo (€)", 160),
+    ("Costo Magazzino Annuo (€)", "Costo Magazzino Annuo (€)", 180),
+    ("Costo Totale Annuo (€)", "Costo Totale Annuo (€)", 160),
+    ("Ordini per Anno", "Ordini/Anno", 110),
+    ("Giorni tra ordini", "Giorni tra ordini", 110),
+)
+
+
+def table_sort_key(value):
+    # Chiave di ordinamento: i numeri (anche in stringa) prima, in ordine numerico
+    try:
+        return (0, float(value), "")
+    except (TypeError, ValueError):
+        return (1, 0.0, str(value).lower())
+
+
+def cost_curve(result, punti=PUNTI_CURVA, da=0.2, a=3.0):
+    ''' Costi annui di ordinazione, mantenimento e totali in funzione del
+    lotto q, da da*Q a a*Q dove Q è il lotto del risultato. Usa solo i
+    valori del risultato: ordini(q) = ordini(Q) * Q / q e
+    magazzino(q) = magazzino(Q) * q / Q.
+    Restituisce (lotti, costi ordini, costi magazzino, costi totali) '''
+    lot = float(result["EOQ (pz)"])
+    if lot <= 0 or punti < 2:
+        return [], [], [], []
+    orders_cost = float(result["Costo Ordini Annuo (€)"])
+    holding_cost = float(result["Costo Magazzino Annuo (€)"])
+    step = (a - da) / (punti - 1)
+    lots = [lot * (da + i * step) for i in range(punti)]
+    orders = [orders_cost * lot / q for q in lots]
+    holding = [holding_cost * q / lot for q in lots]
+    total = [o + h for o, h in zip(orders, holding)]
+    return lots, orders, holding, total
+
+
+def downsample_minmax(xs, ys, intervalli):
+    ''' Riduce una serie a al più 2 * intervalli punti: per ogni intervallo
+    di indici tiene il minimo e il massimo di ys, nell'ordine della serie,
+    così picchi e valli restano visibili anche con migliaia di punti '''
+    n = len(xs)
+    if n <= 2 * intervalli:
+        return list(xs), list(ys)
+    out_x = []
+    out_y = []
+    for b in range(intervalli):
+        start = b * n // intervalli
+        segment = ys[start:(b + 1) * n // intervalli]
+        low = segment.index(min(segment))
+        high = segment.index(max(segment))
+        for i in sorted({low, high}):
+            out_x.append(xs[start + i])
+            out_y.append(segment[i])
+    return out_x, out_y
+
+
+def yearly_trend(results, colonna="EOQ (pz)"):
+    ''' Aggrega per anno una colonna dei risultati (più articoli nello
+    stesso anno). Restituisce (anni, medie, minimi, massimi) ordinati per
+    anno; le righe senza valori numerici vengono ignorate '''
+    totals = {}  # anno -> [righe, somma, minimo, massimo]
+    for result in results:
+        try:
+            year = float(result["Anno"])
+            value = float(result[colonna])
+        except (KeyError, TypeError, ValueError):
+            continue
+        total = totals.get(year)
+        if total is None:
+            totals[year] = [1, value, value, value]
+        else:
+            total[0] += 1
+            total[1] += value
+            if value < total[2]:
+                total[2] = value
+            elif value > total[3]:
+                total[3] = value
+    years = sorted(totals)
+    return (
+        years,
+        [totals[year][1] / totals[year][0] for year in years],
+        [totals[year][2] for year in years],
+        [totals[year][3] for year in years],
+    )
+
+
+def scale_points(xs, ys, larghezza, altezza, limiti=None, sinistra=0, margine=MARGINE_GRAFICO):
+    ''' Converte una serie in coordinate di Canvas [x0, y0, x1, y1, ...]
+    in un riquadro largo larghezza pixel a partire da sinistra (y verso
+    l'alto). limiti = (x min, x max, y min, y max) per più serie sulla
+    stessa scala; se None vengono presi dalla serie '''
+    if not xs:
+        return []
+    x_min, x_max, y_min, y_max = limiti or (min(xs), max(xs), min(ys), max(ys))
+    x_scale = (larghezza - 2 * margine) / ((x_max - x_min) or 1)
+    y_scale = (altezza - 2 * margine) / ((y_max - y_min) or 1)
+    x0 = sinistra + margine - x_min * x_scale
+    y0 = altezza - margine + y_min * y_scale
+    coords = []
+    for x, y in zip(xs, ys):
+        coords.append(x0 + x * x_scale)
+        coords.append(y0 - y * y_scale)
+    return coords
+
+
+class ResultSummary:
+    ''' Totali dei costi (ordini, magazzino, totale) e numero di righe per
+    anno, per fornitore e complessivi, aggiornati a ogni riga aggiunta o
+    rimossa: mostrare un riepilogo non richiede di rileggere le righe.
+    I totali sono in Decimal, quindi aggiunte e rimozioni ripetute non
+    accumulano errori di arrotondamento '''
+
+    def __init__(self):
+        self.per_anno = {}  # anno -> [righe, costo ordini, costo magazzino, costo totale]
+        self.per_fornitore = {}  # fornitore -> come per_anno
+        self.totale = self._empty()
+
+    @staticmethod
+    def _empty():
+        return [0, Decimal(0), Decimal(0), Decimal(0)]
+
+    @staticmethod
+    def _costs(result):
+        costs = []
+        for column in COLONNE_COSTI:
+            value = result.get(column) or 0
+            try:
+                costs.append(Decimal(value) if isinstance(value, str) else to_decimal(value))
+            except (ArithmeticError, ValueError):
+                costs.append(Decimal(0))  # Valore non numerico: non conteggiato
+        return costs
+
+    def _update(self, result, sign):
+        costs = self._costs(result)
+        groups = (
+            (self.per_anno, str(result.get("Anno", ""))),
+            (self.per_fornitore, result.get("Fornitore", SENZA_FORNITORE)),
+        )
+        totals = [self.totale]
+        for table, name in groups:
+            totals.append(table.setdefault(name, self._empty()))
+        for total in totals:
+            total[0] += sign
+            for i, cost in enumerate(costs, start=1):
+                total[i] += sign * cost
+        # I gruppi rimasti senza righe spariscono dal riepilogo
+        for table, name in groups:
+            if table[name][0] == 0:
+                del table[name]
+
+    def add(self, result):
+        self._update(result, 1)
+
+    def remove(self, result):
+        self._update(result, -1)
+
+    def clear(self):
+        self.per_anno.clear()
+        self.per_fornitore.clear()
+        self.totale = self._empty()
+
+    def overall(self):
+        # (righe, costi formattati) complessivi
+        return (self.totale[0], *format_money_bulk(self.totale[1:]))
+
+    def rows(self, gruppo="anno"):
+        ''' Righe del riepilogo ordinate per nome: (nome, righe, costi
+        formattati) per gruppo "anno" o "fornitore" '''
+        table = self.per_anno if gruppo == "anno" else self.per_fornitore
+        names = sorted(table, key=table_sort_key)
+        costs = [format_money_bulk(table[name][i] for name in names) for i in (1, 2, 3)]
+        return [
+            (name, table[name][0], *(column[j] for column in costs))
+            for j, name in enumerate(names)
+        ]
+
+
+class TableIndex:
+    ''' Dati grezzi delle righe della tabella, con chiavi di ordinamento
+    precalcolate e un indice ordinato per colonna costruito alla prima
+    richiesta e invalidato a ogni modifica: ordinare e filtrare non
+    richiede di rileggere i valori dal Treeview '''
+
+    def __init__(self, columns=COLONNE_TABELLA):
+        self.keys = [key for _, key, _ in columns]
+        self.rows = {}  # iid -> risultato
+        self.sort_keys = {}  # iid -> chiavi di ordinamento per colonna
+        self.search_text = {}  # iid -> testo in minuscolo per la ricerca
+        self.by_key = {}  # (codice, anno) -> iid delle righe con quella chiave
+        self.indexes = {}  # colonna -> iid ordinati
+        self.summary = ResultSummary()  # Totali aggiornati a ogni modifica
+        self.modifiche = 0  # Contatore delle modifiche, per le cache della GUI
+
+    def values(self, result):
+        # Valori da mostrare nel Treeview, nell'ordine delle colonne
+        return tuple(result.get(key, "") for key in self.keys)
+
+    def add(self, iid, result):
+        values = self.values(result)
+        self.rows[iid] = result
+        self.sort_keys[iid] = tuple(table_sort_key(value) for value in values)
+        self.search_text[iid] = " ".join(str(value) for value in values).lower()
+        self.by_key.setdefault(self._key(result), []).append(iid)
+        self.indexes.clear()
+        self.summary.add(result)
+        self.modifiche += 1
+
+    def remove(self, iid):
+        result = self.rows.pop(iid)
+        del self.sort_keys[iid]
+        del self.search_text[iid]
+        key = self._key(result)
+        self.by_key[key].remove(iid)
+        if not self.by_key[key]:
+            del self.by_key[key]
+        self.indexes.clear()
+        self.summary.remove(result)
+        self.modifiche += 1
+
+    def clear(self):
+        self.rows.clear()
+        self.sort_keys.clear()
+        self.search_text.clear()
+        self.by_key.clear()
+        self.indexes.clear()
+        self.summary.clear()
+        self.modifiche += 1
+
+    @staticmethod
+    def _key(result):
+        return (str(result.get("Codice", "")), str(result.get("Anno", "")))
+
+    def find(self, codice, anno):
+        # iid delle righe con il codice e l'anno indicati (anche inserite a mano)
+        return list(self.by_key.get((str(codice), str(anno)), ()))
+
+    def ordered(self, column=1, reverse=False, text=""):
+        ''' iid ordinati per la colonna indicata e filtrati per testo
+        (ricerca senza distinzione tra maiuscole e minuscole) '''
+        index = self.indexes.get(column)
+        if index is None:
+            sort_keys = self.sort_keys
+            index = self.indexes[column] = sorted(sort_keys, key=lambda iid: sort_keys[iid][column])
+        if reverse:
+            index = index[::-1]
+        text = text.strip().lower()
+        if text:
+            search_text = self.search_text
+            index = [iid for iid in index if text in search_text[iid]]
+        return index
+
+
 class EOQ_GUI:
     # Classe principale che gestisce la GUI
 
-    def __init__(self, master):
+    def __init__(self, master, input_paths=None):
         self.master = master
+        self.input_paths = input_paths or PERCORSI_INPUT
         master.title(f"EOQ Calculator {VERSIONE}")
         master.geometry("1200x650")
         master.minsize(width=1200, height=650) # stabilisce la dimnensione minima della finestra
         master.configure(bg="#f0f0f0")
+
+        # Archivio persistente dei risultati
+        self.store = ResultStore(PERCORSO_DB)
         
         # Stile per i widget
         self.style = ttk.Style()
@@ -179,6 +2924,14 @@ class EOQ_GUI:
             style="TButton"
         )
         self.manual_btn.pack(side=tk.LEFT, padx=5)
+
+        self.paste_btn = ttk.Button(
+            button_frame,
+            text="Incolla Tabella",
+            command=self.paste_window,
+            style="TButton"
+        )
+        self.paste_btn.pack(side=tk.LEFT, padx=5)
         
         self.json_btn = ttk.Button(
             button_frame,
@@ -187,6 +2940,34 @@ class EOQ_GUI:
             style="TButton"
         )
         self.json_btn.pack(side=tk.LEFT, padx=5)
+
+        self.saved_btn = ttk.Button(
+            button_frame,
+            text="Apri Risultati Salvati",
+            command=self.load_saved_results,
+            style="TButton"
+        )
+        self.saved_btn.pack(side=tk.LEFT, padx=5)
+
+        self.summary_btn = ttk.Button(
+            button_frame,
+            text="Riepilogo",
+            command=self.show_summary,
+            style="TButton"
+        )
+        self.summary_btn.pack(side=tk.LEFT, padx=5)
+
+        # Monitoraggio del file JSON con ricalcolo automatico
+        self.watchers = []
+        self.watch_job = None
+        self.background_job = None  # Controllo periodico dell'elaborazione in background in corso
+        self.watch_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            button_frame,
+            text="Monitora JSON",
+            variable=self.watch_var,
+            command=self.toggle_watch
+        ).pack(side=tk.LEFT, padx=5)
         
         self.clear_btn = ttk.Button(
             button_frame,
@@ -200,10 +2981,22 @@ class EOQ_GUI:
         results_frame = ttk.LabelFrame(main_frame, text="Risultati")
         results_frame.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
         
+        # Ricerca nella tabella
+        search_frame = ttk.Frame(results_frame)
+        search_frame.pack(side=tk.TOP, fill=tk.X, padx=5, pady=5)
+        ttk.Label(search_frame, text="Cerca:").pack(side=tk.LEFT)
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add("write", lambda *args: self.refresh_view())
+        ttk.Entry(search_frame, textvariable=self.filter_var, width=40).pack(side=tk.LEFT, padx=5)
+        # Totali complessivi, aggiornati a ogni modifica della tabella
+        self.summary_var = tk.StringVar()
+        ttk.Label(search_frame, textvariable=self.summary_var).pack(side=tk.RIGHT, padx=5)
+
         # Treeview
-        columns = ("Anno", "Domanda Annua (pz)", "EOQ (pz)", "Costo Ordini Annuo (€)",
-                   "Costo Magazzino Annuo (€)", "Costo Totale Annuo (€)", "Ordini per Anno",
-                   "Giorni tra ordini")
+        columns = tuple(heading for heading, _, _ in COLONNE_TABELLA)
+        self.table = TableIndex()
+        self.sort_column = 1  # Ordinamento iniziale per anno
+        self.sort_reverse = False
         
         self.results_tree = ttk.Treeview(
             results_frame, 
@@ -213,10 +3006,9 @@ class EOQ_GUI:
             selectmode="browse"
         )
         
-        # Configurazione colonne
-        col_widths = [80, 150, 100, 170, 190, 170, 120, 120]
-        for col, width in zip(columns, col_widths):
-            self.results_tree.heading(col, text=col)
+        # Configurazione colonne: clic sull'intestazione per ordinare
+        for index, (col, _, width) in enumerate(COLONNE_TABELLA):
+            self.results_tree.heading(col, text=col, command=lambda i=index: self.sort_by_column(i))
             self.results_tree.column(col, width=width, anchor=tk.CENTER)
         
         # Scrollbar
@@ -231,11 +3023,22 @@ class EOQ_GUI:
         self.results_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
+        # Grafico: curva dei costi della riga selezionata e andamento dell'EOQ per anno
+        self.chart_job = None
+        self.chart_parts = set()  # Parti del grafico da ridisegnare: "curva", "andamento"
+        self.trend = None  # (modifiche della tabella, filtro, andamento per anno)
+        self.trend_coords = None  # ((larghezza, altezza), coordinate dell'andamento)
+        self.chart = tk.Canvas(main_frame, height=ALTEZZA_GRAFICO, bg="white", highlightthickness=0)
+        self.chart.pack(fill=tk.X, pady=(10, 0))
+        self.chart.bind("<Configure>", lambda event: self.schedule_chart())
+        self.results_tree.bind("<<TreeviewSelect>>", lambda event: self.schedule_chart(("curva",)))
+
         # Status bar
         self.status_var = tk.StringVar()
         self.status_var.set("Pronto")
         status_bar = ttk.Label(master, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
         status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.update_summary()
     
     def user_input_window(self):
         # Apre la finestra per l'inserimento manuale
@@ -293,6 +3096,59 @@ class EOQ_GUI:
             width=10
         ).pack(side=tk.RIGHT, padx=10)
     
+    def paste_window(self):
+        # Finestra per incollare più righe da un foglio di calcolo e calcolarle insieme
+        window = tk.Toplevel(self.master)
+        window.title("Incolla Tabella")
+        window.geometry("640x420")
+        window.grab_set()
+
+        frame = ttk.Frame(window, padding=10)
+        frame.pack(fill=tk.BOTH, expand=True)
+        ttk.Label(
+            frame,
+            text="Incollare le righe (anno, domanda annua, costo setup, costo mantenimento;"
+                 " facoltativo il codice come prima colonna o un'intestazione):"
+        ).pack(anchor=tk.W)
+        text = scrolledtext.ScrolledText(frame, height=15, font=("Courier", 10))
+        text.pack(fill=tk.BOTH, expand=True, pady=5)
+        text.focus_set()
+
+        def paste_clipboard():
+            try:
+                text.insert(tk.END, window.clipboard_get())
+            except tk.TclError:
+                messagebox.showwarning("Appunti", "Gli appunti non contengono testo", parent=window)
+
+        btn_frame = ttk.Frame(frame)
+        btn_frame.pack(fill=tk.X)
+        ttk.Button(btn_frame, text="Incolla dagli appunti", command=paste_clipboard).pack(side=tk.LEFT)
+        ttk.Button(btn_frame, text="Annulla", command=window.destroy, width=10).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(
+            btn_frame,
+            text="Calcola",
+            command=lambda: self.paste_calculation(text.get("1.0", tk.END), window),
+            width=10
+        ).pack(side=tk.RIGHT, padx=5)
+
+    def paste_calculation(self, text, window):
+        # Calcola tutte le righe incollate e le inserisce nella tabella in un solo aggiornamento
+        try:
+            results, issues = calculate_pasted(text, store=self.store)
+        except Exception as e:
+            messagebox.showerror("Errore", f"Si è verificato un errore: {str(e)}", parent=window)
+            return
+        self.show_validation_report(issues, "dati incollati")
+        if not results:
+            self.status_var.set("Nessun dato da elaborare")
+            return
+        self.replace_years(results)
+        self.status_var.set(
+            f"Calcolo da tabella incollata completato: {len(results)}/"
+            f"{len(results) + len(set(issue['riga'] for issue in issues))} righe calcolate"
+        )
+        window.destroy()
+
     def user_input_calculation(self, year, demand, setup, holding, window):
         # Esegue il calcolo per l'input manuale
         try:
@@ -308,16 +3164,15 @@ class EOQ_GUI:
             if any(val <= 0 for val in [demand, setup, holding]):
                 raise ValueError("Tutti i valori devono essere positivi")
             
-            # Calcolo
+            # Calcolo, con il lotto intero come per i record letti da file
             calculator = EOQCalculator()
-            calculator.anno = year
-            calculator.domanda_annua = demand
-            calculator.costo_setup = setup
-            calculator.costo_mantenimento = holding
-            calculator.calculate_EOQ()
+            results, _ = calculator.calculate_records([{
+                "anno": year, "domanda_annua": demand,
+                "costo_setup": setup, "costo_mantenimento": holding
+            }])
             
             # Aggiungi risultati alla tabella e ordina
-            self.add_to_table(calculator.get_results_dict())
+            self.add_to_table(results[0])
             self.status_var.set("Calcolo manuale completato con successo")
             window.destroy()
             
@@ -328,98 +3183,370 @@ class EOQ_GUI:
     
     def calculate_from_json(self):
         try:
+            paths = resolve_input_paths(self.input_paths)
+            if len(paths) > 1:
+                self.calculate_from_files(paths)
+                return
+
+            path = paths[0] if paths else self.input_paths[0]
+            if is_ndjson(path) and os.path.exists(path):
+                self.calculate_from_ndjson(path)
+                return
+
             calculator = EOQCalculator()
-            results, invalid_years = calculator.read_from_json(PERCORSO_JSON)
+            output = calculator.read_from_json(path, store=self.store)
 
-            if not results:
+            if not output:
                 self.status_var.set("Nessun dato da elaborare")
                 return
                 
-            if "error" in results[0]:
-                messagebox.showerror("Errore", results[0]["error"])
+            if "error" in output[0]:
+                messagebox.showerror("Errore", output[0]["error"])
                 return
 
-            # Crea un set con i dati presenti nel file json per la rimozione
-            json_years = set()
-            for result in results:
-                if "Anno" in result:
-                    json_years.add(str(result["Anno"]))
-            
-            # Rimuove i record esistenti con gli stessi anni
-            for item in self.results_tree.get_children():
-                values = self.results_tree.item(item, 'values')
-                if values:
-                    year_in_table = values[0]
-                    if year_in_table in json_years:
-                        self.results_tree.delete(item)
-            
-            # Ordina i risultati per anno prima di aggiungerli alla tabella
-            sorted_results = sorted(results, key=lambda x: int(x.get("Anno", 0)))
-
-            # Aggiorna i nuovi risultati
-            for result in sorted_results:
-                self.add_to_table(result, sort_after_add=False) # Non ordinare dopo ogni singola aggiunta qui
+            results, invalid_years = output
+            self.show_validation_report(calculator.report_validazione)
+            if not results:
+                self.status_var.set("Nessun dato da elaborare")
+                return
 
-            self.sort_table_by_year() # Ordina una sola volta alla fine
+            self.replace_years(results)
             self.status_var.set(
                 f"Calcolo da JSON completato: {len(results)}/{len(invalid_years)+len(results)} record calcolati"
+                f" ({calculator.record_ricalcolati} ricalcolati)"
                 )
             
         except Exception as e:
             messagebox.showerror("Errore", f"Si è verificato un errore: {str(e)}")
 
+    def run_in_background(self, message, work, done):
+        # Esegue work in un thread separato, così la finestra resta
+        # reattiva; il risultato arriva in una coda controllata con after
+        # dal thread dell'interfaccia, che lo passa a done. Una sola
+        # elaborazione alla volta
+        if self.background_job is not None:
+            self.status_var.set("Elaborazione già in corso")
+            return
+        outcome = queue.Queue(maxsize=1)
+
+        def run():
+            try:
+                outcome.put(work())
+            except Exception as e:
+                outcome.put(e)
+
+        threading.Thread(target=run, daemon=True).start()
+        self.status_var.set(message)
+        self.background_job = self.master.after(INTERVALLO_RISULTATI_MS, self.collect_background, outcome, done)
+
+    def collect_background(self, outcome, done):
+        # Controlla l'elaborazione avviata con run_in_background
+        try:
+            value = outcome.get_nowait()
+        except queue.Empty:
+            self.background_job = self.master.after(INTERVALLO_RISULTATI_MS, self.collect_background, outcome, done)
+            return
+        self.background_job = None
+        if isinstance(value, Exception):
+            messagebox.showerror("Errore", f"Si è verificato un errore: {str(value)}")
+            self.status_var.set("Errore durante l'elaborazione")
+            return
+        done(value)
+
+    def calculate_from_ndjson(self, path):
+        # Legge un file NDJSON dividendolo tra più processi, che scrivono
+        # i risultati nel buffer condiviso invece di restituirli; le colonne
+        # diventano righe solo alla fine, per la tabella
+        def work():
+            shared, issues = read_ndjson_shared(path, store_path=PERCORSO_DB)
+            with shared:
+                return shared.results(), issues
+
+        self.run_in_background(f"Lettura di {path} in corso...", work, partial(self.show_ndjson_results, path))
+
+    def show_ndjson_results(self, path, outcome):
+        # Mostra i risultati di calculate_from_ndjson
+        results, issues = outcome
+        self.show_validation_report(issues, path)
+        if not results:
+            self.status_var.set("Nessun dato da elaborare")
+            return
+        self.replace_years(results)
+        self.status_var.set(f"Calcolo da NDJSON completato: {len(results)} record calcolati")
+
+    def calculate_from_files(self, paths):
+        # Elabora più file in parallelo senza bloccare la finestra
+        self.run_in_background(
+            f"Elaborazione di {len(paths)} file in corso...",
+            partial(process_files, paths, store_path=PERCORSO_DB),
+            partial(self.show_files_results, paths)
+        )
+
+    def show_files_results(self, paths, reports):
+        # Mostra i risultati di calculate_from_files con un unico riepilogo degli errori
+        results, errors = merge_reports(reports)
+        summary = format_files_report(reports)
+        if summary:
+            messagebox.showwarning(
+                "Riepilogo errori",
+                f"{len(errors)} file su {len(paths)} non elaborati, "
+                f"{sum(len(report['validation']) for report in reports)} errori di validazione:\n\n" + summary
+            )
+        self.replace_years(results)
+        self.status_var.set(
+            f"Calcolo da JSON completato: {len(results)} record da {len(paths) - len(errors)}/{len(paths)} file"
+        )
+
+    def show_validation_report(self, issues, source=None):
+        # Mostra un'unica finestra riepilogativa con i record scartati
+        if not issues:
+            return
+        header = f"Sono stati trovati {len(issues)} errori di validazione"
+        if source:
+            header += f" in {source}"
+        messagebox.showwarning(
+            "Record non validi",
+            header + ":\n" + format_validation_report(issues)
+        )
+
+    def replace_years(self, results, removed_keys=()):
+        # Sostituisce nella tabella le righe con lo stesso codice e anno dei
+        # risultati (e rimuove quelle di removed_keys) senza toccare le altre
+        keys = set((str(codice), str(anno)) for codice, anno in removed_keys)
+        for result in results:
+            if "Anno" in result:
+                keys.add((str(result.get("Codice", "")), str(result["Anno"])))
+        
+        # Rimuove i record esistenti con le stesse chiavi
+        stale = [iid for key in keys for iid in self.table.find(*key)]
+        if stale:
+            self.results_tree.delete(*stale)
+            for iid in stale:
+                self.table.remove(iid)
+
+        # Aggiorna i nuovi risultati
+        for result in results:
+            self.add_to_table(result, sort_after_add=False) # Non ordinare dopo ogni singola aggiunta qui
+
+        self.refresh_view() # Ordina una sola volta alla fine
+
+    def toggle_watch(self):
+        # Attiva o disattiva il monitoraggio del file JSON
+        if self.watch_var.get():
+            self.watchers = [InputWatcher(path) for path in resolve_input_paths(self.input_paths)]
+            self.poll_input()
+        else:
+            if self.watch_job is not None:
+                self.master.after_cancel(self.watch_job)
+                self.watch_job = None
+            self.status_var.set("Monitoraggio disattivato")
+
+    def poll_input(self):
+        # Controlla i file configurati e ricalcola solo i record cambiati
+        try:
+            for watcher in self.watchers:
+                changes = watcher.poll()
+                if changes is None:
+                    continue
+                changed, removed = changes
+                calculator = EOQCalculator()
+                results, invalid_years = calculator.calculate_records(changed, store=self.store)
+                self.show_validation_report(calculator.report_validazione, watcher.percorso)
+                # Un record modificato e ora non valido va tolto dalla tabella
+                removed_keys = list(removed) + [
+                    record_key(record) for record in changed if isinstance(record, dict)
+                ]
+                self.replace_years(results, removed_keys)
+                self.status_var.set(
+                    f"Monitoraggio {watcher.percorso}: {len(changed)} record cambiati, {len(removed)} rimossi"
+                    f" ({calculator.record_ricalcolati} ricalcolati)"
+                )
+        except Exception as e:
+            self.status_var.set(f"Monitoraggio: errore ({str(e)})")
+        self.watch_job = self.master.after(INTERVALLO_MONITORAGGIO_MS, self.poll_input)
+
+    def load_saved_results(self):
+        # Riapre i risultati salvati nell'archivio senza ricalcolarli
+        results = self.store.load_all()
+        if not results:
+            self.status_var.set("Nessun risultato salvato")
+            return
+        self.clear_results()
+        for result in results:
+            self.add_to_table(result, sort_after_add=False)
+        self.sort_table_by_year()
+        self.status_var.set(f"Caricati {len(results)} risultati salvati")
+
     def add_to_table(self, result, sort_after_add=True):
         # Aggiunge una riga alla tabella dei risultati
-        values = (
-            result.get("Anno", ""),
-            result.get("Domanda Annua (pz)", ""),
-            result.get("EOQ (pz)", ""),
-            result.get("Costo Ordini Annuo (€)", ""),
-            result.get("Costo Magazzino Annuo (€)", ""),
-            result.get("Costo Totale Annuo (€)", ""),
-            result.get("Ordini/Anno", ""),
-            result.get("Giorni tra ordini", "")
-        )
-        self.results_tree.insert("", tk.END, values=values)
+        iid = self.results_tree.insert("", tk.END, values=self.table.values(result))
+        self.table.add(iid, result)
         if sort_after_add:
-            self.sort_table_by_year()
+            self.refresh_view()
     
     def sort_table_by_year(self):
-        # Raccogli tutti gli elementi dalla treeview
-        items = self.results_tree.get_children()
-
-        # Prepara i dati per l'ordinamento: (anno, item_id)
-        # item_id è necessario per poter riordinare gli elementi nella treeview
-        data_to_sort = []
-        for item_id in items:
-            values = self.results_tree.item(item_id, 'values')
-            if values and values[0] != "":
-                try:
-                    year = int(values[0])
-                    data_to_sort.append((year, item_id, values)) # Include anche i valori originali per reinserirli
-                except ValueError:
-                    # Ignora o gestisci righe con anno non numerico
-                    pass
-
-        # Ordina i dati in base all'anno
-        data_to_sort.sort(key=lambda x: x[0])
-
-        # Rimuovi tutti gli elementi esistenti dalla treeview
-        for item_id in items:
-            self.results_tree.delete(item_id)
-
-        # Reinserisci gli elementi ordinati
-        for year, item_id, values in data_to_sort:
-            self.results_tree.insert("", tk.END, values=values)
+        # Ordina la tabella per anno crescente
+        self.sort_column = 1
+        self.sort_reverse = False
+        self.refresh_view()
+
+    def sort_by_column(self, column):
+        # Clic sull'intestazione: ordina per la colonna, un secondo clic inverte l'ordine
+        if column == self.sort_column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = column
+            self.sort_reverse = False
+        self.refresh_view()
+
+    def refresh_view(self):
+        # Mostra le righe filtrate nell'ordine scelto con un'unica operazione
+        # sul Treeview (le righe escluse dal filtro vengono solo staccate)
+        order = self.table.ordered(self.sort_column, self.sort_reverse, self.filter_var.get())
+        self.results_tree.set_children("", *order)
+        for index, (col, _, _) in enumerate(COLONNE_TABELLA):
+            arrow = ""
+            if index == self.sort_column:
+                arrow = " ▼" if self.sort_reverse else " ▲"
+            self.results_tree.heading(col, text=col + arrow)
+        if self.filter_var.get().strip():
+            self.status_var.set(f"Visualizzate {len(order)} di {len(self.table.rows)} righe")
+        self.update_summary()
+        self.schedule_chart()
+
+    def schedule_chart(self, parts=("curva", "andamento")):
+        # Ridisegna le parti indicate del grafico una sola volta quando l'interfaccia è libera
+        self.chart_parts.update(parts)
+        if self.chart_job is None:
+            self.chart_job = self.master.after_idle(self.draw_chart)
+
+    def draw_chart(self):
+        # Ridisegna solo le parti richieste: la selezione ricalcola la curva
+        # dei costi, l'andamento per anno viene ricostruito solo quando
+        # cambiano le righe o il filtro
+        self.chart_job = None
+        parts, self.chart_parts = self.chart_parts, set()
+        width = self.chart.winfo_width() // 2
+        height = self.chart.winfo_height()
+        for part in parts:
+            self.chart.delete(part)
+        if width <= 2 * MARGINE_GRAFICO or height <= 2 * MARGINE_GRAFICO:
+            return
+        if "curva" in parts:
+            self.draw_cost_curve(width, height)
+        if "andamento" in parts:
+            self.draw_trend(width, height)
+
+    def draw_cost_curve(self, width, height):
+        # Curva dei costi della riga selezionata, calcolata alla selezione
+        chart = self.chart
+        selection = [iid for iid in self.results_tree.selection() if iid in self.table.rows]
+        result = self.table.rows[selection[0]] if selection else None
+        curves = cost_curve(result) if result else ([],)
+        if not curves[0]:
+            chart.create_text(width // 2, height // 2, tags="curva",
+                              text="Selezionare una riga per la curva dei costi")
+            return
+        lots = curves[0]
+        limits = (lots[0], lots[-1], 0, max(max(c) for c in curves[1:]))
+        for series, color in zip(curves[1:], ("#1f77b4", "#2ca02c", "#d62728")):
+            chart.create_line(*scale_points(lots, series, width, height, limits),
+                              fill=color, width=2, tags="curva")
+        x, _ = scale_points([float(result["EOQ (pz)"])], [0], width, height, limits)
+        chart.create_line(x, MARGINE_GRAFICO, x, height - MARGINE_GRAFICO, dash=(3, 3), tags="curva")
+        chart.create_text(MARGINE_GRAFICO, 12, anchor=tk.W, tags="curva",
+                          text=f"Costi annui {result.get('Codice', '')} {result.get('Anno', '')}:"
+                               " ordini, magazzino, totale")
+
+    def draw_trend(self, width, height):
+        # EOQ medio per anno delle righe visibili, con la fascia minimo-massimo
+        text = self.filter_var.get().strip()
+        key = (self.table.modifiche, text)
+        if self.trend is None or self.trend[0] != key:
+            rows = self.table.rows
+            visible = (rows[iid] for iid in self.table.ordered(1, False, text)) if text else rows.values()
+            self.trend = (key, yearly_trend(visible))
+            self.trend_coords = None
+        years, means, lows, highs = self.trend[1]
+        if len(years) < 2:
+            return
+
+        if self.trend_coords is None or self.trend_coords[0] != (width, height):
+            limits = (years[0], years[-1], 0, max(highs))
+            coords = [
+                scale_points(*downsample_minmax(years, series, width), width, height, limits, sinistra=width)
+                for series in (lows, highs, means)
+            ]
+            self.trend_coords = ((width, height), coords)
+        lows_line, highs_line, means_line = self.trend_coords[1]
+        self.chart.create_line(*lows_line, fill="#c5b0d5", tags="andamento")
+        self.chart.create_line(*highs_line, fill="#c5b0d5", tags="andamento")
+        self.chart.create_line(*means_line, fill="#9467bd", width=2, tags="andamento")
+        self.chart.create_text(width + MARGINE_GRAFICO, 12, anchor=tk.W, tags="andamento",
+                               text=f"EOQ (pz) medio per anno (con minimo e massimo):"
+                                    f" {int(years[0])}-{int(years[-1])}")
+
+    def update_summary(self):
+        # Mostra i totali complessivi (mantenuti da TableIndex, senza rileggere le righe)
+        rows, orders, holding, total = self.table.summary.overall()
+        self.summary_var.set(
+            f"{rows} righe - Ordini € {orders} - Magazzino € {holding} - Totale € {total}"
+        )
+
+    def show_summary(self):
+        # Finestra con i totali dei costi per anno e per fornitore
+        window = tk.Toplevel(self.master)
+        window.title("Riepilogo Costi")
+        window.geometry("760x400")
+        notebook = ttk.Notebook(window)
+        notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        headings = ("Righe",) + COLONNE_COSTI
+        for gruppo, title in (("anno", "Anno"), ("fornitore", "Fornitore")):
+            frame = ttk.Frame(notebook)
+            notebook.add(frame, text=f"Per {gruppo}")
+            tree = ttk.Treeview(frame, columns=(title,) + headings, show="headings")
+            for col in (title,) + headings:
+                tree.heading(col, text=col)
+                tree.column(col, width=140, anchor=tk.CENTER)
+            for row in self.table.summary.rows(gruppo):
+                tree.insert("", tk.END, values=row)
+            tree.insert("", tk.END, values=("Totale",) + self.table.summary.overall())
+            tree.pack(fill=tk.BOTH, expand=True)
 
     def clear_results(self):
-        # Pulisce la tabella dei risultati
-        for item in self.results_tree.get_children():
-            self.results_tree.delete(item)
+        # Pulisce la tabella dei risultati (anche le righe nascoste dal filtro)
+        if self.table.rows:
+            self.results_tree.delete(*self.table.rows)
+        self.table.clear()
+        self.update_summary()
+        self.schedule_chart()
         self.status_var.set("Record eliminati")
 
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["--batch"] and len(sys.argv) >= 4:
+        # Elaborazione senza interfaccia: --batch input output [cartella checkpoint]
+        summary = run_batch(sys.argv[2], sys.argv[3], *sys.argv[4:5])
+        print(f"{summary[0]} risultati scritti in {sys.argv[3]}, {len(summary[1])} record scartati")
+        print(format_validation_report(summary[1]))
+        sys.exit(0)
+    if sys.argv[1:2] == ["--shard"] and len(sys.argv) >= 4:
+        # Esecuzione distribuita: --shard input cartella, --worker cartella, --merge cartella output
+        print(f"{create_shards(sys.argv[2], sys.argv[3])} shard creati in {sys.argv[3]}")
+        sys.exit(0)
+    if sys.argv[1:2] == ["--worker"] and len(sys.argv) >= 3:
+        print(f"{run_shard_worker(sys.argv[2])} shard elaborati")
+        sys.exit(0)
+    if sys.argv[1:2] == ["--merge"] and len(sys.argv) >= 4:
+        summary = merge_shards(sys.argv[2], sys.argv[3])
+        print(f"{summary[0]} risultati scritti in {sys.argv[3]}, {len(summary[1])} record scartati")
+        print(format_validation_report(summary[1]))
+        sys.exit(0)
+    if sys.argv[1:2] == ["--diff"] and len(sys.argv) >= 5:
+        # Confronto tra due esecuzioni: --diff vecchio.csv nuovo.csv output.csv [soglia]
+        soglia = float(sys.argv[5]) if len(sys.argv) > 5 else SOGLIA_DIFF
+        print(f"{export_diff(sys.argv[2], sys.argv[3], sys.argv[4], soglia=soglia)} righe cambiate")
+        sys.exit(0)
     root = tk.Tk()
-    app = EOQ_GUI(root)
+    app = EOQ_GUI(root, input_paths=sys.argv[1:] or None)
     root.mainloop()
\ No newline at end of file
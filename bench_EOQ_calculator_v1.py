@@ -0,0 +1,180 @@
+''' Benchmark del motore di calcolo EOQ.
+Uso: python bench_EOQ_calculator_v1.py [numero di record]
+'''
+import os
+import sys
+import json
+import random
+import timeit
+import gzip
+import tempfile
+from EOQ_calculator_v1 import EOQCalculator, format_money_bulk, forecast_demand, snap_lots
+from EOQ_calculator_v1 import stagger_orders, simulate_policy, network_eoq
+from EOQ_calculator_v1 import read_ndjson_parallel, read_ndjson_shared, open_input
+
+
+def make_records(n, seed=42):
+    # Record casuali nel formato di dati.json
+    rng = random.Random(seed)
+    return [
+        {
+            "codice": f"ART{i % 1000:04d}",
+            "anno": 2000 + i // 1000,
+            "domanda_annua": rng.randint(100, 100000),
+            "costo_setup": round(rng.uniform(10, 1000), 2),
+            "costo_mantenimento": round(rng.uniform(0.5, 50), 2)
+        }
+        for i in range(n)
+    ]
+
+
+def report(name, seconds, n):
+    print(f"{name:<45} {seconds * 1000:10.1f} ms  {n / seconds:14,.0f} righe/s")
+
+
+def bench_money_modes(records, repeat=3):
+    # Confronto tra calcolo in float e modalità valuta esatta (Decimal)
+    n = len(records)
+    for label, exact in (("calculate_records (float)", False), ("calculate_records (Decimal)", True)):
+        seconds = min(timeit.repeat(
+            lambda: EOQCalculator(valuta_esatta=exact).calculate_records(records),
+            number=1, repeat=repeat
+        ))
+        report(label, seconds, n)
+
+
+def bench_formatting(n, repeat=3):
+    # Confronto tra f-string per valore e formattazione in blocco
+    rng = random.Random(0)
+    values = [rng.uniform(0, 100000) for _ in range(n)]
+    seconds = min(timeit.repeat(lambda: [f"{v:.2f}" for v in values], number=1, repeat=repeat))
+    report("f-string per valore", seconds, n)
+    seconds = min(timeit.repeat(lambda: format_money_bulk(values), number=1, repeat=repeat))
+    report("format_money_bulk (float)", seconds, n)
+
+    calculator = EOQCalculator(valuta_esatta=True)
+    decimals = []
+    for v in values[:n]:
+        calculator.domanda_annua, calculator.costo_setup, calculator.costo_mantenimento = v + 1, 50, 2
+        calculator.calculate_EOQ()
+        decimals.append(calculator.costi_totali)
+    seconds = min(timeit.repeat(lambda: format_money_bulk(decimals), number=1, repeat=repeat))
+    report("format_money_bulk (Decimal)", seconds, n)
+
+
+def bench_forecast(n, repeat=3):
+    # Previsione su n serie di 10 anni ciascuna
+    rng = random.Random(1)
+    series = [[rng.randint(100, 10000) for _ in range(10)] for _ in range(n)]
+    for metodo in ("ses", "holt", "media_mobile"):
+        seconds = min(timeit.repeat(lambda: forecast_demand(series, metodo), number=1, repeat=repeat))
+        report(f"forecast_demand ({metodo})", seconds, n)
+
+
+def bench_snap_lots(n, repeat=3):
+    # Arrotondamento dei lotti con confezioni e lotto minimo
+    rng = random.Random(2)
+    demands = [rng.randint(100, 100000) for _ in range(n)]
+    setups = [rng.uniform(10, 1000) for _ in range(n)]
+    holdings = [rng.uniform(0.5, 50) for _ in range(n)]
+    eoqs = [(2 * d * s / h) ** 0.5 for d, s, h in zip(demands, setups, holdings)]
+    seconds = min(timeit.repeat(
+        lambda: snap_lots(demands, setups, holdings, eoqs, confezione=12, lotto_minimo=48),
+        number=1, repeat=repeat
+    ))
+    report("snap_lots", seconds, n)
+
+
+def bench_stagger(n, repeat=1):
+    # Sfasamento degli ordini per n articoli (al massimo 5000)
+    n = min(n, 5000)
+    rng = random.Random(3)
+    results = [
+        {"Codice": f"ART{i}", "Domanda Annua (pz)": rng.randint(1000, 10000), "EOQ (pz)": rng.randint(50, 500)}
+        for i in range(n)
+    ]
+    seconds = min(timeit.repeat(lambda: stagger_orders(results), number=1, repeat=repeat))
+    report("stagger_orders", seconds, n)
+
+
+def bench_simulation(n, repeat=3):
+    # Simulazione di n giorni di domanda casuale con politica (Q, r)
+    rng = random.Random(4)
+    demand = [rng.randint(0, 20) for _ in range(n)]
+    events = simulate_policy(demand, 100, 30, 50, 2, lead_time=3)["eventi"]
+    seconds = min(timeit.repeat(
+        lambda: simulate_policy(demand, 100, 30, 50, 2, lead_time=3), number=1, repeat=repeat
+    ))
+    report("simulate_policy (eventi)", seconds, events)
+
+
+def bench_network(n, repeat=1, magazzini=12):
+    # Rete di 12 magazzini con n righe in totale
+    rng = random.Random(5)
+    records = [
+        {"codice": f"ART{i}", "anno": 2024, "domanda_annua": rng.randint(100, 10000),
+         "costo_setup": rng.uniform(10, 500), "costo_mantenimento": rng.uniform(0.5, 20),
+         "magazzino": f"M{i % magazzini}"}
+        for i in range(n)
+    ]
+    for record in records:
+        record["codice"] = f"ART{int(record['codice'][3:]) // magazzini}"
+    seconds = min(timeit.repeat(lambda: network_eoq(records), number=1, repeat=repeat))
+    report("network_eoq", seconds, n)
+
+
+def bench_ndjson(n, repeat=1):
+    # Lettura di un file NDJSON con 1 e 4 processi
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "dati.ndjson")
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in make_records(n))
+        for workers in (1, 4):
+            seconds = min(timeit.repeat(
+                lambda: read_ndjson_parallel(path, max_workers=workers), number=1, repeat=repeat
+            ))
+            report(f"read_ndjson_parallel ({workers} processi)", seconds, n)
+
+        def shared(workers):
+            buffer, _ = read_ndjson_shared(path, max_workers=workers)
+            with buffer:
+                return len(buffer.rows())
+        for workers in (1, 4):
+            seconds = min(timeit.repeat(lambda: shared(workers), number=1, repeat=repeat))
+            report(f"read_ndjson_shared ({workers} processi)", seconds, n)
+
+
+def bench_compression(n, repeat=3):
+    # Lettura di dati.json non compresso e compresso con gzip
+    with tempfile.TemporaryDirectory() as directory:
+        payload = json.dumps(make_records(n)).encode("utf-8")
+        for name, content in (("dati.json", payload), ("dati.json.gz", gzip.compress(payload, 6))):
+            path = os.path.join(directory, name)
+            with open(path, "wb") as f:
+                f.write(content)
+
+            def read():
+                with open_input(path, "r") as f:
+                    return json.load(f)
+            seconds = min(timeit.repeat(read, number=1, repeat=repeat))
+            report(f"lettura {name}", seconds, n)
+
+
+BENCHMARKS = [
+    ("Modalità valuta", lambda n: bench_money_modes(make_records(n))),
+    ("Formattazione importi", bench_formatting),
+    ("Previsione della domanda", bench_forecast),
+    ("Arrotondamento dei lotti", bench_snap_lots),
+    ("Sfasamento degli ordini", bench_stagger),
+    ("Simulazione a eventi discreti", bench_simulation),
+    ("Rete di magazzini", bench_network),
+    ("Lettura NDJSON", bench_ndjson),
+    ("File compressi", bench_compression),
+]
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for title, bench in BENCHMARKS:
+        print(f"\n== {title} ({n} righe) ==")
+        bench(n)
@@ -1,9 +1,42 @@
 import math
 import os
 import json
+import gzip
+import bz2
+import lzma
 import tempfile
 import pytest
-from EOQ_calculator_v1 import EOQCalculator
+from EOQ_calculator_v1 import EOQCalculator, ResultStore, InputWatcher
+from EOQ_calculator_v1 import resolve_input_paths, process_files, merge_reports
+from EOQ_calculator_v1 import validate_records, ValidationError, format_files_report, format_validation_report
+from EOQ_calculator_v1 import format_money_bulk
+from EOQ_calculator_v1 import TransactionAggregator, calculate_from_transactions
+from EOQ_calculator_v1 import forecast_demand, calculate_with_forecast
+from EOQ_calculator_v1 import snap_lots
+from EOQ_calculator_v1 import order_schedule, purchase_plan, export_purchase_plan, load_holidays
+from EOQ_calculator_v1 import stagger_orders, inventory_timeline
+from EOQ_calculator_v1 import simulate_policy, simulate_many
+from EOQ_calculator_v1 import search_ss_policy, search_ss_many, generate_demand
+from EOQ_calculator_v1 import deteriorating_eoq_batch, calculate_deteriorating_records
+from EOQ_calculator_v1 import interpolate_years, dcf_eoq_batch, calculate_dcf_records, CICLO_MASSIMO_DCF
+from EOQ_calculator_v1 import load_network, network_eoq
+from EOQ_calculator_v1 import TableIndex, table_sort_key, ResultSummary
+from EOQ_calculator_v1 import cost_curve, downsample_minmax, scale_points, yearly_trend
+from EOQ_calculator_v1 import parse_number, parse_pasted_table, calculate_pasted
+from EOQ_calculator_v1 import ndjson_chunks, read_ndjson_parallel
+from EOQ_calculator_v1 import compression_of, open_input, ndjson_blocks
+from EOQ_calculator_v1 import run_batch, write_results_csv
+from EOQ_calculator_v1 import create_shards, claim_shard, run_shard_worker, merge_shards
+from EOQ_calculator_v1 import release_stale_locks
+from EOQ_calculator_v1 import read_ndjson_shared
+from EOQ_calculator_v1 import diff_results, export_diff, external_sort
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import time
+import threading
+import socket
+import random
+from decimal import Decimal
 import EOQ_calculator_v1
 
 def test_calculate_EOQ_basic():
@@ -135,6 +168,1088 @@ def test_read_from_json_invalid_json(tmp_path):
     assert "error" in results[0]
     assert "Formato JSON non valido" in results[0]["error"]
 
+def test_read_from_json_store_recomputes_only_changed(tmp_path):
+    """Test dell'archivio persistente: al secondo giro si ricalcolano solo i record modificati"""
+    data = [
+        {"anno": 2022, "domanda_annua": 1200, "costo_setup": 30, "costo_mantenimento": 3},
+        {"anno": 2023, "domanda_annua": 1500, "costo_setup": 40, "costo_mantenimento": 4}
+    ]
+    json_file = tmp_path / "test.json"
+    json_file.write_text(json.dumps(data), encoding="utf-8")
+    store = ResultStore(str(tmp_path / "risultati.db"))
+
+    calc = EOQCalculator()
+    first, _ = calc.read_from_json(str(json_file), store=store)
+    assert calc.record_ricalcolati == 2
+
+    # Modifica di un solo anno: deve essere ricalcolato solo quello
+    data[1]["domanda_annua"] = 3000
+    json_file.write_text(json.dumps(data), encoding="utf-8")
+    second, _ = calc.read_from_json(str(json_file), store=store)
+    assert calc.record_ricalcolati == 1
+    assert second[0] == first[0]
+    assert second[1]["Domanda Annua (pz)"] == 3000
+    store.close()
+
+def test_result_store_load_all(tmp_path):
+    """Test della riapertura dei risultati salvati in una nuova sessione"""
+    percorso = str(tmp_path / "risultati.db")
+    store = ResultStore(percorso)
+    store.put_many([
+        (("", 2024), "h1", {"Anno": 2024}),
+        (("", 2021), "h2", {"Anno": 2021}),
+    ])
+    store.close()
+
+    store = ResultStore(percorso)
+    assert [r["Anno"] for r in store.load_all()] == [2021, 2024]
+    assert store.get(("", 2021), "h2") == {"Anno": 2021}
+    assert store.get(("", 2021), "altro") is None
+    store.close()
+
+def test_result_store_concurrent_writers(tmp_path):
+    """Test dell'archivio condiviso: journal WAL e scritture concorrenti che attendono il blocco"""
+    percorso = str(tmp_path / "risultati.db")
+    store = ResultStore(percorso)
+    assert store.connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    locked = threading.Event()
+
+    def writer():
+        # Un altro processo tiene aperta una transazione di scrittura
+        other = ResultStore(percorso)
+        other.connection.execute("BEGIN IMMEDIATE")
+        other.connection.execute("INSERT INTO risultati VALUES ('A', 2024, 'h1', '{}')")
+        locked.set()
+        time.sleep(0.3)
+        other.connection.commit()
+        other.close()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    locked.wait()
+    # Lettura durante la scrittura, scrittura in attesa del commit dell'altra connessione
+    assert store.get(("A", 2024), "h1") is None
+    store.put_many([(("B", 2024), "h2", {"Anno": 2024})])
+    thread.join()
+    assert store.load_all() == [{}, {"Anno": 2024}]
+    store.close()
+
+def test_result_store_discards_old_format(tmp_path):
+    """Test della versione dell'archivio: i risultati di una versione precedente non vengono riusati"""
+    import sqlite3
+    percorso = str(tmp_path / "risultati.db")
+    store = ResultStore(percorso)
+    store.put_many([(("", 2024), "h1", {"Anno": 2024})])
+    store.close()
+    connection = sqlite3.connect(percorso)
+    connection.execute("PRAGMA user_version = 1")
+    connection.commit()
+    connection.close()
+
+    store = ResultStore(percorso)
+    assert store.get(("", 2024), "h1") is None and store.load_all() == []
+    store.put_many([(("", 2024), "h1", {"Anno": 2024})])
+    store.close()
+    store = ResultStore(percorso)
+    assert store.get(("", 2024), "h1") == {"Anno": 2024}
+    store.close()
+
+def test_input_watcher_detects_changes(tmp_path):
+    """Test del monitoraggio: vengono restituiti solo i record nuovi, modificati o rimossi"""
+    data = [
+        {"anno": 2022, "domanda_annua": 1200, "costo_setup": 30, "costo_mantenimento": 3},
+        {"anno": 2023, "domanda_annua": 1500, "costo_setup": 40, "costo_mantenimento": 4}
+    ]
+    json_file = tmp_path / "test.json"
+    json_file.write_text(json.dumps(data), encoding="utf-8")
+    watcher = InputWatcher(str(json_file))
+
+    changed, removed = watcher.poll()
+    assert len(changed) == 2 and removed == []
+
+    # Nessuna modifica: nessun evento
+    assert watcher.poll() is None
+
+    # Modifica di un anno e rimozione dell'altro
+    data = [
+        {"anno": 2023, "domanda_annua": 1600, "costo_setup": 40, "costo_mantenimento": 4},
+        {"anno": 2024, "domanda_annua": 1700, "costo_setup": 40, "costo_mantenimento": 4}
+    ]
+    json_file.write_text(json.dumps(data), encoding="utf-8")
+    os.utime(json_file, ns=(0, 10**9))
+    changed, removed = watcher.poll()
+    assert [r["anno"] for r in changed] == [2023, 2024]
+    assert removed == [("", 2022)]
+
+def test_input_watcher_skips_non_object_items(tmp_path):
+    """Test del monitoraggio con elementi che non sono oggetti: segnalati una volta, senza errori"""
+    record = {"anno": 2022, "domanda_annua": 10, "costo_setup": 1, "costo_mantenimento": 1}
+    json_file = tmp_path / "test.json"
+    json_file.write_text(json.dumps([record, 42, "testo"]), encoding="utf-8")
+    watcher = InputWatcher(str(json_file))
+    changed, removed = watcher.poll()
+    assert changed == [record, 42, "testo"] and removed == []
+    results, _ = EOQCalculator().calculate_records(changed)
+    assert len(results) == 1
+
+    json_file.write_text(json.dumps([dict(record, anno=2023), 42, "testo"]), encoding="utf-8")
+    os.utime(json_file, ns=(0, 10**9))
+    changed, removed = watcher.poll()
+    assert changed == [dict(record, anno=2023)] and removed == [("", 2022)]
+
+def test_input_watcher_ignores_partial_write(tmp_path):
+    """Test del monitoraggio con file scritto a metà: si riprova al controllo successivo"""
+    json_file = tmp_path / "test.json"
+    json_file.write_text('[{"anno": 2022', encoding="utf-8")
+    watcher = InputWatcher(str(json_file))
+    assert watcher.poll() is None
+
+    json_file.write_text('[{"anno": 2022, "domanda_annua": 10, "costo_setup": 1, "costo_mantenimento": 1}]', encoding="utf-8")
+    changed, removed = watcher.poll()
+    assert len(changed) == 1
+
+def test_input_watcher_and_network_read_ndjson(tmp_path):
+    """Test di monitoraggio e rete di magazzini su file NDJSON"""
+    record = {"codice": "A", "anno": 2022, "domanda_annua": 10, "costo_setup": 1, "costo_mantenimento": 1}
+    ndjson = tmp_path / "nord.ndjson"
+    ndjson.write_text(json.dumps(record) + "\n{ non valida\n" + json.dumps(dict(record, anno=2023))[:20],
+                      encoding="utf-8")
+    watcher = InputWatcher(str(ndjson))
+    assert watcher.poll() is None  # Ultima riga ancora in scrittura
+
+    ndjson.write_text(json.dumps(record) + "\n{ non valida\n" + json.dumps(dict(record, anno=2023)) + "\n",
+                      encoding="utf-8")
+    changed, removed = watcher.poll()
+    assert [r["anno"] for r in changed] == [2022, 2023] and removed == []
+
+    records, errors = load_network([str(tmp_path)])
+    assert [(r["magazzino"], r["anno"]) for r in records] == [("nord", 2022), ("nord", 2023)]
+    assert errors == [f"{ndjson}: 1 righe JSON non valide"]
+
+def test_process_files_batch(tmp_path):
+    """Test dell'elaborazione di più file: ordine deterministico ed errori per singolo file"""
+    cartella = tmp_path / "input"
+    cartella.mkdir()
+    (cartella / "b.json").write_text(json.dumps([
+        {"codice": "B", "anno": 2022, "domanda_annua": 1000, "costo_setup": 10, "costo_mantenimento": 1}
+    ]), encoding="utf-8")
+    (cartella / "a.json").write_text(json.dumps([
+        {"codice": "A", "anno": 2023, "domanda_annua": 1000, "costo_setup": 10, "costo_mantenimento": 1},
+        {"codice": "A", "anno": 2022, "domanda_annua": 1000, "costo_setup": 10, "costo_mantenimento": 1}
+    ]), encoding="utf-8")
+    (cartella / "rotto.json").write_text("{ invalid json }", encoding="utf-8")
+
+    paths = resolve_input_paths([str(cartella), str(cartella / "*.json")])
+    assert [os.path.basename(p) for p in paths] == ["a.json", "b.json", "rotto.json"]
+
+    reports = process_files(paths, max_workers=2)
+    assert [r["file"] for r in reports] == paths
+    results, errors = merge_reports(reports)
+    assert [(r["Codice"], r["Anno"]) for r in results] == [("A", 2022), ("B", 2022), ("A", 2023)]
+    assert len(errors) == 1 and "rotto.json" in errors[0]
+
+def test_validate_records_collect_all():
+    """Test della validazione in blocco: tutti gli errori raccolti in un report strutturato"""
+    data = [
+        {"anno": 2021, "domanda_annua": -100, "costo_setup": 10, "costo_mantenimento": 1},
+        {"anno": 1800, "domanda_annua": 1000, "costo_setup": "dieci", "costo_mantenimento": 1},
+        "non un record",
+        {"anno": 2023, "domanda_annua": 1000, "costo_setup": 10}
+    ] + [{"anno": 2024, "domanda_annua": 1000, "costo_setup": 10, "costo_mantenimento": 1}]
+    valid, issues = validate_records(data)
+
+    assert [r["anno"] for r in valid] == [2024]
+    assert [(i["riga"], i["campo"]) for i in issues] == [
+        (1, "domanda_annua"),
+        (2, "anno"),
+        (2, "costo_setup"),
+        (3, "record"),
+        (4, "costo_mantenimento"),
+    ]
+    assert issues[4]["motivo"] == "Valore mancante"
+
+def test_validate_records_fail_fast(tmp_path):
+    """Test della modalità fail-fast: si interrompe al primo errore"""
+    data = [
+        {"anno": 2022, "domanda_annua": 1000, "costo_setup": 10, "costo_mantenimento": 1},
+        {"anno": 2023, "domanda_annua": 0, "costo_setup": 10, "costo_mantenimento": 1}
+    ]
+    with pytest.raises(ValidationError) as excinfo:
+        validate_records(data, fail_fast=True)
+    assert excinfo.value.issue["riga"] == 2
+
+    # Le righe dopo il primo errore non vengono lette
+    class Untouchable(dict):
+        def get(self, *args):
+            raise AssertionError("riga letta dopo il primo errore")
+    data += [Untouchable() for _ in range(10000)]
+    with pytest.raises(ValidationError) as excinfo:
+        validate_records(data[:2] + [data[0]] * 5 + [data[1]] + data[2:], fail_fast=True)
+    assert excinfo.value.issue["riga"] == 2
+    clean = [data[0]] * 5000
+    assert validate_records(clean, fail_fast=True) == (clean, [])
+
+    # Da file l'errore segue la convenzione [{"error": ...}]
+    json_file = tmp_path / "test.json"
+    json_file.write_text(json.dumps(data), encoding="utf-8")
+    results = EOQCalculator().read_from_json(str(json_file), fail_fast=True)
+    assert "Riga 2" in results[0]["error"]
+
+def test_calculate_EOQ_exact_money_mode():
+    """Test della modalità valuta esatta: costi Decimal al centesimo e totale riconciliato"""
+    calc = EOQCalculator(valuta_esatta=True)
+    calc.anno = 2024
+    calc.domanda_annua = 1000
+    calc.costo_setup = 50.1
+    calc.costo_mantenimento = 2.3
+    calc.calculate_EOQ()
+
+    assert isinstance(calc.costi_totali, Decimal)
+    assert calc.costi_totali == calc.costi_ordinazione + calc.costi_mantenimento
+    assert calc.costi_ordinazione == calc.costi_ordinazione.quantize(Decimal("0.01"))
+    results = calc.get_results_dict()
+    assert results["Costo Totale Annuo (€)"] == str(calc.costi_totali)
+
+def test_format_money_bulk_matches_fstring():
+    """Test del formattatore in blocco: stesso risultato delle f-string"""
+    values = [0, 1.005, 2.5, 1234567.891, 1e-9]
+    assert format_money_bulk(values) == [f"{v:.2f}" for v in values]
+    assert format_money_bulk([Decimal("1.005"), Decimal("2")]) == ["1.01", "2.00"]
+    assert format_money_bulk([]) == []
+
+def _write_transactions(path):
+    righe = [
+        "codice,data,tipo,quantita,valore",
+        "B,2023-01-10,ordine,100,",
+        "A,2023-02-01,ordine,400,",
+        "A,2023-02-03,ricevimento,500,2000",
+        "B,2023-03-01,ricevimento,100,1000",
+        "A,2024-01-05,ordine,300,",
+        "A,2023-06-01,ordine,600,",
+        "A,2024-02-01,ricevimento,300,1500",
+        "C,riga-non-valida,ordine,1,",
+    ]
+    path.write_text("\n".join(righe) + "\n", encoding="utf-8")
+
+def test_transaction_aggregator_spill_matches_memory(tmp_path):
+    """Test dell'aggregazione delle transazioni: stesso risultato con e senza scrittura su disco"""
+    transazioni = tmp_path / "transazioni.csv"
+    _write_transactions(transazioni)
+
+    in_memory = TransactionAggregator(50)
+    expected = list(in_memory.records([str(transazioni)]))
+    assert in_memory.file_spill == 0
+    assert in_memory.righe_scartate == 1
+
+    spilled = TransactionAggregator(50, max_chiavi=1)
+    assert list(spilled.records([str(transazioni)])) == expected
+    assert spilled.file_spill > 1
+
+    assert [(r["codice"], r["anno"]) for r in expected] == [("A", 2023), ("A", 2024), ("B", 2023)]
+    assert expected[0]["domanda_annua"] == 1000
+    assert math.isclose(expected[0]["costo_mantenimento"], 0.25 * 4)
+
+def test_calculate_from_transactions(tmp_path):
+    """Test del calcolo dell'EOQ direttamente dallo storico delle transazioni"""
+    transazioni = tmp_path / "transazioni.csv"
+    _write_transactions(transazioni)
+    parts = list(calculate_from_transactions([str(transazioni)], 50, costi_setup={"B": 80}))
+    results = [r for part in parts for r in part["risultati"]]
+    assert [(r["Codice"], r["Anno"]) for r in results] == [("A", 2023), ("A", 2024), ("B", 2023)]
+    assert results[0]["EOQ (pz)"] == round(math.sqrt(2 * 1000 * 50 / 1.0))
+    assert [part["report"] for part in parts] == [[]]
+
+    # A blocchi di un record: una parte per record, stesso CSV
+    parts = list(calculate_from_transactions([str(transazioni)], 50, dimensione=1, costi_setup={"B": 80}))
+    assert [len(part["risultati"]) for part in parts] == [1, 1, 1]
+    output = tmp_path / "risultati.csv"
+    assert write_results_csv(str(output), iter(parts)) == (3, [])
+    assert output.read_text(encoding="utf-8").count("\n") == 4
+
+def test_forecast_demand_methods():
+    """Test dei metodi di previsione su più serie di lunghezza diversa"""
+    series = [[100, 200, 300], [50], [10, 10, 10, 10]]
+
+    # Livellamento esponenziale semplice: 100 -> 150 -> 225
+    assert forecast_demand(series, "ses", alpha=0.5) == [225, 50, 10]
+    # Media mobile sugli ultimi due valori disponibili
+    assert forecast_demand(series, "media_mobile", finestra=2) == [250, 50, 10]
+    # Holt su serie costante e su serie lineare crescente
+    holt = forecast_demand([[10, 10, 10], [100, 200, 300, 400]], "holt", alpha=1.0, beta=1.0)
+    assert holt == [10, 500]
+    with pytest.raises(ValueError):
+        forecast_demand(series, "sconosciuto")
+
+def test_calculate_with_forecast():
+    """Test del calcolo dell'EOQ sull'anno successivo previsto, nello stesso passaggio"""
+    data = [
+        {"codice": "A", "anno": 2022, "domanda_annua": 1000, "costo_setup": 50, "costo_mantenimento": 2},
+        {"codice": "A", "anno": 2023, "domanda_annua": 2000, "costo_setup": 60, "costo_mantenimento": 3},
+        {"codice": "B", "anno": 2023, "domanda_annua": 500, "costo_setup": 20, "costo_mantenimento": 1},
+    ]
+    historical, predicted, issues = calculate_with_forecast(data, "ses", alpha=0.5)
+    assert len(historical) == 3
+    assert [(r["Codice"], r["Anno"]) for r in predicted] == [("A", 2024), ("B", 2024)]
+    assert predicted[0]["Domanda Annua (pz)"] == 1500
+    assert predicted[0]["EOQ (pz)"] == round(math.sqrt(2 * 1500 * 60 / 3))
+    assert issues == []
+
+    # Holt con trend in calo: previsione nulla segnalata per codice, non come riga dell'input
+    data[0]["domanda_annua"], data[1]["domanda_annua"] = 2000, 500
+    historical, predicted, issues = calculate_with_forecast(data, "holt", alpha=1.0, beta=1.0)
+    assert len(historical) == 3
+    assert [(r["Codice"], r["Anno"]) for r in predicted] == [("B", 2024)]
+    assert [(i["riga"], i["codice"], i["anno"], i["campo"]) for i in issues] == [(None, "A", 2024, "domanda_annua")]
+
+def test_snap_lots_constraints():
+    """Test dell'arrotondamento dei lotti: confezioni, lotto minimo e massimo"""
+    # EOQ continuo = sqrt(2*1000*50/2) = 223.6
+    eoq = math.sqrt(50000)
+    q, ordering, holding, totals = snap_lots(
+        [1000] * 4, [50] * 4, [2] * 4, [eoq] * 4,
+        confezione=[1, 100, 100, 100],
+        lotto_minimo=[0, 0, 500, 0],
+        lotto_massimo=[None, None, None, 150]
+    )
+    # Intero più conveniente, multiplo di 100 più conveniente, lotto minimo, massimo
+    assert q == [224, 200, 500, 100]
+    assert math.isclose(ordering[1], 1000 / 200 * 50)
+    assert math.isclose(holding[1], 200 / 2 * 2)
+    assert math.isclose(totals[2], 1000 / 500 * 50 + 500)
+
+def test_read_records_with_lot_constraints():
+    """Test del calcolo con vincoli di lotto letti dai record"""
+    data = [
+        {"anno": 2023, "domanda_annua": 1000, "costo_setup": 50, "costo_mantenimento": 2,
+         "confezione": 100},
+        {"anno": 2024, "domanda_annua": 1000, "costo_setup": 50, "costo_mantenimento": 2,
+         "confezione": 0}
+    ]
+    calc = EOQCalculator()
+    results, _ = calc.calculate_records(data)
+    assert len(results) == 1
+    assert results[0]["EOQ (pz)"] == 200
+    assert results[0]["Costo Totale Annuo (€)"] == "450.00"
+    assert results[0]["Ordini/Anno"] == 5
+    assert calc.report_validazione[0]["campo"] == "confezione"
+
+@pytest.mark.parametrize("valuta_esatta", [False, True])
+def test_plain_records_snapped_to_integer_lot(valuta_esatta):
+    """Test dei record senza vincoli di lotto: EOQ intero e costi calcolati su quel lotto"""
+    # EOQ continuo = sqrt(20) = 4.47, costo 4.47; con 4 pezzi il costo è 2.50 + 2.00
+    data = [{"anno": 2024, "domanda_annua": 10, "costo_setup": 1, "costo_mantenimento": 1}]
+    results, _ = EOQCalculator(valuta_esatta=valuta_esatta).calculate_records(data)
+    assert results[0]["EOQ (pz)"] == 4
+    assert results[0]["Costo Ordini Annuo (€)"] == "2.50"
+    assert results[0]["Costo Magazzino Annuo (€)"] == "2.00"
+    assert results[0]["Costo Totale Annuo (€)"] == "4.50"
+    assert results[0]["Giorni tra ordini"] == round(365 * 4 / 10)
+
+def test_order_schedule_working_days():
+    """Test del calendario ordini: intervalli regolari spostati ai giorni lavorativi"""
+    # 12 ordini l'anno: uno ogni 365/12 = 30.4 giorni
+    result = {"Codice": "A", "Domanda Annua (pz)": 1200, "EOQ (pz)": 100}
+    festivi = load_holidays(["2024-01-01", "2024-01-31", ""])
+    orders = list(order_schedule(result, datetime.date(2024, 1, 1), giorni=70, festivi=festivi))
+    assert orders == [
+        (datetime.date(2024, 1, 2), "A", 100),   # 1 gennaio festivo
+        (datetime.date(2024, 2, 1), "A", 100),   # 31 gennaio festivo
+        (datetime.date(2024, 3, 1), "A", 100),
+    ]
+
+def test_purchase_plan_merge_and_export(tmp_path):
+    """Test del piano acquisti: ordini di più articoli fusi in ordine di data"""
+    results = [
+        {"Codice": "A", "Domanda Annua (pz)": 365, "EOQ (pz)": 30},
+        {"Codice": "B", "Domanda Annua (pz)": 365, "EOQ (pz)": 7},
+    ]
+    inizio = datetime.date(2024, 1, 1)
+    plan = list(purchase_plan(results, inizio, giorni=31))
+    assert [day for day, _, _ in plan] == sorted(day for day, _, _ in plan)
+    assert sum(1 for _, code, _ in plan if code == "A") == 2
+    assert sum(1 for _, code, _ in plan if code == "B") == 5
+
+    percorso = tmp_path / "piano.csv"
+    assert export_purchase_plan(results, str(percorso), inizio, giorni=31) == len(plan)
+    assert percorso.read_text(encoding="utf-8").splitlines()[1] == "2024-01-01,A,30"
+
+def test_stagger_orders_reduces_peaks():
+    """Test dello sfasamento degli ordini: picchi di ricevimento e giacenza ridotti"""
+    # Due articoli con ciclo di 10 giorni e uno con ciclo di 5 giorni
+    results = [
+        {"Codice": "A", "Domanda Annua (pz)": 3650, "EOQ (pz)": 100},
+        {"Codice": "B", "Domanda Annua (pz)": 3650, "EOQ (pz)": 100},
+        {"Codice": "C", "Domanda Annua (pz)": 3650, "EOQ (pz)": 50},
+    ]
+    offsets, summary = stagger_orders(results, orizzonte=40)
+    assert offsets[0] != offsets[1]
+    assert summary["picco_ricevimenti_prima"] == 250
+    assert summary["picco_ricevimenti_dopo"] == 100
+    assert summary["picco_giacenza_dopo"] < summary["picco_giacenza_prima"]
+
+def test_inventory_timeline_sawtooth():
+    """Test della giacenza complessiva: dente di sega da Q a Q/ciclo"""
+    profile = inventory_timeline([(4, 100)], [1], orizzonte=6)
+    assert profile == [25, 100, 75, 50, 25, 100]
+
+def test_simulate_policy_deterministic_demand():
+    """Test della simulazione con domanda costante e lead time nullo"""
+    sim = simulate_policy([10] * 365, q=100, punto_riordino=0, costo_setup=50,
+                          costo_mantenimento=3.65)
+    # Un ordine ogni 10 giorni a partire dal giorno 9
+    assert sim["ordini"] == 36
+    assert sim["costo_ordini"] == 36 * 50
+    assert sim["unita_mancanti"] == 0
+    # Primo ciclo 90+80+...+0, poi 35 cicli da 100+90+...+10, ultimi 6 giorni 100+...+50
+    # (pezzi * giorni) a 0.01 € al giorno
+    assert math.isclose(sim["costo_magazzino"], (450 + 35 * 550 + 450) * 0.01)
+    assert sim["eventi"] == 365 + 36
+
+def test_simulate_policy_shortages_and_parallel():
+    """Test della simulazione con arretrati e dell'esecuzione in parallelo"""
+    item = dict(domanda_giornaliera=[0, 30, 0, 30, 30, 0], q=40, punto_riordino=10,
+                costo_setup=5, costo_mantenimento=0, lead_time=2, costo_rottura=2,
+                giacenza_iniziale=40)
+    sim = simulate_policy(**item)
+    # Giorno 1: ordine di 40 (arrivo giorno 3); giorno 4: mancano 10 pezzi e si riordina
+    assert sim["ordini"] == 2
+    assert sim["unita_mancanti"] == 10
+    assert sim["costo_rottura"] == 20
+    assert simulate_many([item, item], max_workers=2) == [sim, sim]
+
+def test_generate_demand_zero_inputs():
+    """Test della domanda generata con domanda o probabilità nulle: serie a zero"""
+    assert generate_demand(0, 10, rng=random.Random(1)) == [0] * 10
+    assert generate_demand(1000, 10, probabilita=0, rng=random.Random(1)) == [0] * 10
+    assert len(generate_demand(1000, 10, probabilita=0.5, rng=random.Random(1))) == 10
+
+def test_search_ss_policy_improves_on_eoq():
+    """Test della ricerca (s, S): con domanda irregolare trova una politica migliore dell'EOQ"""
+    item = dict(domanda_annua=2000, costo_setup=100, costo_mantenimento=5, lead_time=5,
+                costo_rottura=20, probabilita=0.1, n_scenari=5, seed=1)
+    best = search_ss_policy(**item)
+    assert best["costo_annuo"] < best["costo_annuo_eoq"]
+    assert best["S"] > best["s"] >= 0
+    assert best["valutazioni"] > 1
+
+    # Stessi scenari, stesso risultato anche in processi separati
+    parallel = search_ss_many([item, item], max_workers=2)
+    assert [(r["s"], r["S"], r["costo_annuo"]) for r in parallel] == [(best["s"], best["S"], best["costo_annuo"])] * 2
+
+def test_deteriorating_eoq_batch():
+    """Test dell'EOQ per merce deperibile: Wilson senza deterioramento, minimo del costo altrimenti"""
+    q, cycles, ordering, holding = deteriorating_eoq_batch(
+        [1000, 1000, 1000], [50, 50, 50], [2, 2, 2], [0, 0.5, 0.5],
+        vite_utili=[None, None, 30], costi_unitari=[0, 10, 10]
+    )
+    # Senza deterioramento coincide con il modello di Wilson
+    assert math.isclose(q[0], math.sqrt(50000), rel_tol=1e-9)
+    assert math.isclose(ordering[0], holding[0], rel_tol=1e-9)
+
+    # Con deterioramento il costo è minimo rispetto a cicli vicini
+    def cost(T):
+        return 50 / T + (2 + 10 * 0.5) * 1000 * (math.expm1(0.5 * T) - 0.5 * T) / (0.25 * T)
+    best = ordering[1] + holding[1]
+    assert math.isclose(best, cost(cycles[1]), rel_tol=1e-9)
+    assert best < cost(cycles[1] * 1.01) and best < cost(cycles[1] * 0.99)
+    assert q[1] < q[0]
+
+    # La vita utile limita il ciclo a 30 giorni
+    assert math.isclose(cycles[2], 30 / 365)
+
+def test_calculate_deteriorating_records_shape():
+    """Test dei risultati per merce deperibile nello stesso formato di get_results_dict"""
+    data = [
+        {"anno": 2024, "domanda_annua": 1000, "costo_setup": 50, "costo_mantenimento": 2,
+         "tasso_deterioramento": 0.5, "costo_unitario": 10},
+        {"anno": 2025, "domanda_annua": 1000, "costo_setup": 50, "costo_mantenimento": 2,
+         "tasso_deterioramento": -1}
+    ]
+    results, issues = calculate_deteriorating_records(data)
+    calc = EOQCalculator()
+    calc.anno, calc.domanda_annua, calc.costo_setup, calc.costo_mantenimento = 2024, 1000, 50, 2
+    calc.calculate_EOQ()
+    assert set(results[0]) == set(calc.get_results_dict())
+    assert results[0]["EOQ (pz)"] == 121
+    assert isinstance(results[0]["Costo Totale Annuo (€)"], str)
+    assert [i["campo"] for i in issues] == ["tasso_deterioramento"]
+
+def test_interpolate_years():
+    """Test dell'interpolazione lineare degli anni mancanti per articolo"""
+    records = [
+        {"codice": "A", "anno": 2024, "domanda_annua": 1300, "costo_setup": 80, "costo_mantenimento": 4},
+        {"codice": "A", "anno": 2021, "domanda_annua": 1000, "costo_setup": 50, "costo_mantenimento": 1},
+        {"codice": "B", "anno": 2021, "domanda_annua": 10, "costo_setup": 1, "costo_mantenimento": 1},
+    ]
+    completed = interpolate_years(records)
+    assert [(r.get("codice"), r["anno"]) for r in completed] == [
+        ("A", 2021), ("A", 2022), ("A", 2023), ("A", 2024), ("B", 2021)
+    ]
+    assert completed[1]["interpolato"] is True
+    assert math.isclose(completed[1]["domanda_annua"], 1100)
+    assert math.isclose(completed[2]["costo_setup"], 70)
+
+def test_dcf_eoq_batch():
+    """Test dell'EOQ attualizzato: Wilson a tasso nullo, lotto minore con costo del capitale"""
+    q, cycles, ordering, holding = dcf_eoq_batch(
+        [1000, 1000], [50, 50], [2, 2], [0.0, 0.10], [0.0, 0.02], costi_unitari=[0, 10]
+    )
+    assert math.isclose(q[0], math.sqrt(50000), rel_tol=1e-6)
+    assert math.isclose(ordering[0], holding[0], rel_tol=1e-6)
+    # Con il costo del capitale il lotto è vicino a sqrt(2DS / (h + c*r))
+    approx = math.sqrt(2 * 1000 * 50 / (2 + 10 * math.log(1.10 / 1.02)))
+    assert q[1] < q[0]
+    assert math.isclose(q[1], approx, rel_tol=0.01)
+
+def test_dcf_eoq_batch_inflation_above_cost_of_capital():
+    """Test dell'EOQ attualizzato con inflazione maggiore del costo del capitale: minimo oltre il doppio di Wilson"""
+    q, cycles, ordering, holding = dcf_eoq_batch([1000], [50], [2], 0.02, 0.10, costi_unitari=[25])
+    assert q[0] > 2 * math.sqrt(50000)
+    # Il ciclo trovato è il minimo del costo su una griglia fine
+    r = math.log(1.02 / 1.10)
+    def cost(T):
+        x = r * T
+        f = -math.expm1(-x) / x
+        g = (x + math.expm1(-x)) / (x * x)
+        return (50 + 25 * 1000 * T + 2 * 1000 * T * T * g) / (T * f) - 25 * 1000
+    grid = min((cost(k / 10000), k / 10000) for k in range(1, 50000))
+    assert math.isclose(cycles[0], grid[1], rel_tol=1e-3)
+    assert math.isclose(ordering[0] + holding[0], grid[0], rel_tol=1e-6)
+
+def test_dcf_eoq_batch_without_minimum():
+    """Test dell'EOQ attualizzato quando il costo scende sempre (h + c*r < 0):
+    ciclo limitato all'orizzonte di pianificazione e segnalato, senza overflow"""
+    q, cycles, _, _ = dcf_eoq_batch([1000], [50], [1], 0.03, inflazione=0.08, costi_unitari=50)
+    assert math.isclose(cycles[0], CICLO_MASSIMO_DCF) and math.isclose(q[0], 1000 * CICLO_MASSIMO_DCF)
+    data = [
+        {"codice": "A", "anno": 2024, "domanda_annua": 1000, "costo_setup": 50, "costo_mantenimento": 1, "costo_unitario": 50},
+        {"codice": "B", "anno": 2024, "domanda_annua": 1000, "costo_setup": 50, "costo_mantenimento": 2},
+    ]
+    results, issues = calculate_dcf_records(data, 0.03, 0.08)
+    assert [r["Codice"] for r in results] == ["A", "B"]
+    assert [(i["codice"], i["campo"]) for i in issues] == [("A", "ciclo")]
+    assert format_validation_report(issues).startswith("Codice A (anno 2024), ciclo:")
+    with pytest.raises(ValueError):
+        calculate_dcf_records(data, [0.03, 0.05])
+
+def test_calculate_dcf_records():
+    """Test del calcolo attualizzato su più anni con interpolazione"""
+    data = [
+        {"anno": 2022, "domanda_annua": 1000, "costo_setup": 50, "costo_mantenimento": 2},
+        {"anno": 2024, "domanda_annua": 3000, "costo_setup": 50, "costo_mantenimento": 2},
+    ]
+    results, issues = calculate_dcf_records(data, costo_capitale=0.0)
+    assert [r["Anno"] for r in results] == [2022, 2023, 2024]
+    assert results[1]["Domanda Annua (pz)"] == 2000
+    assert results[1]["EOQ (pz)"] == round(math.sqrt(2 * 2000 * 50 / 2))
+    assert issues == []
+
+def test_network_eoq_pooling(tmp_path):
+    """Test della rete di magazzini: risparmio della gestione centralizzata"""
+    for location in ("milano", "roma", "napoli", "torino"):
+        (tmp_path / f"{location}.json").write_text(json.dumps([
+            {"codice": "A", "anno": 2024, "domanda_annua": 1000, "costo_setup": 50,
+             "costo_mantenimento": 2, "dev_std_domanda": 100}
+        ]), encoding="utf-8")
+    (tmp_path / "rotto.json").write_text("{", encoding="utf-8")
+
+    records, errors = load_network([str(tmp_path / "*.json")])
+    assert len(records) == 4 and len(errors) == 1
+    per_location, summary = network_eoq(records, z=2, lead_time=365)
+    assert sorted(r["Magazzino"] for r in per_location) == ["milano", "napoli", "roma", "torino"]
+
+    # Ciclo: 4 * 447.21 locale contro 894.43 centrale (legge della radice quadrata)
+    # Scorta: 4 * 2*100*2 locale contro 2*200*2 centrale
+    row = summary[0]
+    assert row["Magazzini"] == 4
+    assert row["EOQ Centrale (pz)"] == round(math.sqrt(2 * 4000 * 50 / 2))
+    local = 4 * 2 * math.sqrt(50000) + 4 * 400
+    central = 2 * math.sqrt(200000) + 800
+    assert row["Costo Totale Locale (€)"] == f"{local:.2f}"
+    assert row["Risparmio (€)"] == f"{local - central:.2f}"
+
+def test_load_network_same_file_name_in_folders(tmp_path):
+    """Test della rete con un dati.json per cartella: il magazzino prende il nome della cartella"""
+    record = {"codice": "A", "anno": 2024, "domanda_annua": 1000, "costo_setup": 50, "costo_mantenimento": 2}
+    for location in ("milano", "roma"):
+        (tmp_path / location).mkdir()
+        (tmp_path / location / "dati.json").write_text(json.dumps([record]), encoding="utf-8")
+    records, errors = load_network([str(tmp_path / "*" / "dati.json")])
+    assert sorted(r["magazzino"] for r in records) == ["milano", "roma"] and errors == []
+
+    # Stesso nome anche per le cartelle: errore invece di perdere un magazzino
+    (tmp_path / "altro" / "milano").mkdir(parents=True)
+    (tmp_path / "altro" / "milano" / "dati.json").write_text(json.dumps([record]), encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_network([str(tmp_path / "milano" / "dati.json"), str(tmp_path / "altro" / "milano" / "dati.json")])
+
+def test_table_index_sort_and_filter():
+    """Test dell'indice della tabella: ordinamento numerico per colonna e ricerca"""
+    table = TableIndex()
+    table.add("r1", {"Codice": "B", "Anno": 2023, "EOQ (pz)": 90, "Costo Totale Annuo (€)": "1000.00"})
+    table.add("r2", {"Codice": "a", "Anno": 2021, "EOQ (pz)": 100, "Costo Totale Annuo (€)": "99.50"})
+    table.add("r3", {"Codice": "C", "Anno": 2022, "EOQ (pz)": 95, "Costo Totale Annuo (€)": "250.00"})
+
+    assert table.ordered(1) == ["r2", "r3", "r1"]
+    assert table.ordered(0) == ["r2", "r1", "r3"]
+    # I costi in stringa vengono ordinati come numeri
+    assert table.ordered(6, reverse=True) == ["r1", "r3", "r2"]
+    assert table.ordered(1, text="202") == ["r2", "r3", "r1"]
+    assert table.ordered(1, text=" 99.5") == ["r2"]
+
+    table.add("r4", {"Codice": "B", "Anno": 2023})
+    assert table.find("B", 2023) == ["r1", "r4"]
+    table.remove("r1")
+    assert table.find("B", 2023) == ["r4"]
+    assert "r1" not in table.ordered(1)
+
+def test_table_index_change_counter():
+    """Test del contatore delle modifiche dell'indice: cambia con aggiunte,
+    rimozioni e svuotamento, non con ordinamento e filtro"""
+    table = TableIndex()
+    table.add("r1", {"Codice": "A", "Anno": 2024, "EOQ (pz)": 100})
+    before = table.modifiche
+    table.ordered(3)
+    table.ordered(1, reverse=True, text="A")
+    assert table.modifiche == before
+    table.add("r2", {"Codice": "B", "Anno": 2024, "EOQ (pz)": 50})
+    assert table.modifiche > before
+    before = table.modifiche
+    table.remove("r1")
+    assert table.modifiche > before
+    before = table.modifiche
+    table.clear()
+    assert table.modifiche > before
+
+def test_table_sort_key_mixed_values():
+    """Test delle chiavi di ordinamento: numeri prima dei testi, senza errori sui tipi misti"""
+    values = ["abc", "10", 9, "", 2.5]
+    assert sorted(values, key=table_sort_key) == [2.5, 9, "10", "", "abc"]
+
+def test_ndjson_chunks_align_to_lines(tmp_path):
+    """Test della divisione di un NDJSON: intervalli contigui che iniziano a capo riga"""
+    ndjson = tmp_path / "dati.ndjson"
+    ndjson.write_bytes(b"".join(b'{"anno": %d}\n' % (2000 + i) for i in range(50)))
+    content = ndjson.read_bytes()
+    chunks = ndjson_chunks(str(ndjson), 7)
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(content)
+    for (_, end), (start, _) in zip(chunks, chunks[1:]):
+        assert end == start and content[start - 1:start] == b"\n"
+
+def test_read_ndjson_parallel_matches_json(tmp_path):
+    """Test della lettura NDJSON in parallelo: stessi risultati e numeri di riga del file"""
+    data = [
+        {"codice": f"A{i}", "anno": 2000 + i % 20, "domanda_annua": 100 + i,
+         "costo_setup": 10, "costo_mantenimento": 1}
+        for i in range(300)
+    ]
+    data[120]["costo_setup"] = -1
+    lines = [json.dumps(record) for record in data]
+    lines.insert(200, "")  # riga vuota, ignorata
+    lines.insert(250, "{ non valida")
+    ndjson = tmp_path / "dati.ndjson"
+    ndjson.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    json_file = tmp_path / "dati.json"
+    json_file.write_text(json.dumps(data), encoding="utf-8")
+
+    expected, _ = EOQCalculator().read_from_json(str(json_file))
+    results, issues = read_ndjson_parallel(str(ndjson), max_workers=3)
+    assert results == expected
+    assert [(i["riga"], i["campo"]) for i in issues] == [(121, "costo_setup"), (251, "record")]
+    assert read_ndjson_parallel(str(ndjson), max_workers=1) == (results, issues)
+
+def corrupt_gzip(payload):
+    # Stream gzip con i byte 30-60 azzerati (errore di zlib in decompressione)
+    corrupt = bytearray(gzip.compress(payload))
+    corrupt[30:60] = bytes(30)
+    return corrupt
+
+def test_compressed_json_inputs(tmp_path):
+    """Test della lettura di JSON compressi: estensione, firma e stessi risultati"""
+    data = [
+        {"codice": f"A{i}", "anno": 2020 + i % 5, "domanda_annua": 1000 + i,
+         "costo_setup": 50, "costo_mantenimento": 2}
+        for i in range(2000)
+    ]
+    payload = json.dumps(data).encode("utf-8")
+    plain = tmp_path / "dati.json"
+    plain.write_bytes(payload)
+    expected = EOQCalculator().read_from_json(str(plain))
+
+    for name, module in (("dati.json.gz", gzip), ("dati.json.bz2", bz2), ("dati.json.xz", lzma),
+                         ("senza_estensione.json", gzip)):
+        path = tmp_path / name
+        path.write_bytes(module.compress(payload))
+        assert compression_of(str(path)) is module
+        assert EOQCalculator().read_from_json(str(path)) == expected
+    assert compression_of(str(plain)) is None
+    assert resolve_input_paths([str(tmp_path)])[0].endswith("dati.json")
+
+    truncated = tmp_path / "troncato.json.gz"
+    truncated.write_bytes(gzip.compress(payload)[:100])
+    assert "error" in EOQCalculator().read_from_json(str(truncated))[0]
+
+    # Flusso corrotto: zlib.error, LZMAError e OSError diventano lo stesso errore
+    for name, module in (("corrotto.json.gz", gzip), ("corrotto.json.bz2", bz2), ("corrotto.json.xz", lzma)):
+        corrupt = bytearray(module.compress(payload))
+        corrupt[30:60] = bytes(30)
+        path = tmp_path / name
+        path.write_bytes(bytes(corrupt))
+        output = EOQCalculator().read_from_json(str(path))
+        assert output[0]["error"].startswith("ERRORE: Impossibile leggere il file")
+        assert load_network([str(path)])[1]
+    ndjson = tmp_path / "corrotto.ndjson.gz"
+    ndjson.write_bytes(bytes(corrupt_gzip(payload)))
+    assert process_files([str(ndjson)])[0]["error"]
+
+def test_compressed_ndjson_and_outputs(tmp_path):
+    """Test di NDJSON compresso letto in blocchi sequenziali e dei file di output compressi"""
+    lines = [json.dumps({"codice": f"A{i}", "anno": 2024, "domanda_annua": 100 + i,
+                         "costo_setup": 10, "costo_mantenimento": 1}) for i in range(500)]
+    lines[300] = "{ non valida"
+    content = ("\n".join(lines) + "\n").encode("utf-8")
+    plain = tmp_path / "dati.ndjson"
+    plain.write_bytes(content)
+    packed = tmp_path / "dati.ndjson.xz"
+    packed.write_bytes(lzma.compress(content))
+
+    expected = read_ndjson_parallel(str(plain), max_workers=1)
+    assert read_ndjson_parallel(str(packed), max_workers=2) == expected
+    assert expected[1][0]["riga"] == 301
+    blocks = list(ndjson_blocks(str(packed), blocco=1000))
+    assert len(blocks) > 1 and b"".join(blocks) == content
+    assert all(block.endswith(b"\n") for block in blocks)
+
+    results = [{"Codice": "A", "Domanda Annua (pz)": 3650, "EOQ (pz)": 500}]
+    csv_path = tmp_path / "piano.csv.gz"
+    count = export_purchase_plan(results, str(csv_path), datetime.date(2024, 1, 1), giorni=60)
+    with gzip.open(csv_path, "rt", encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == count + 1
+    with open_input(str(csv_path), "r", encoding="utf-8") as f:
+        assert f.readline().strip() == "data,codice,quantita"
+
+@pytest.mark.parametrize("input_name, output_name", [
+    ("dati.ndjson", "risultati.csv"), ("dati.json", "risultati.csv.gz")
+])
+def test_run_batch_resume_is_byte_identical(tmp_path, monkeypatch, input_name, output_name):
+    """Test del checkpoint: dopo un'interruzione si riprende dai blocchi mancanti
+    e l'output finale è identico a quello di un'esecuzione completa"""
+    data = [
+        {"codice": f"A{i}", "anno": 2000 + i % 30, "domanda_annua": 100 + i,
+         "costo_setup": 10, "costo_mantenimento": 1}
+        for i in range(95)
+    ]
+    data[42]["domanda_annua"] = -5
+    source = tmp_path / input_name
+    if input_name.endswith(".ndjson"):
+        source.write_text("".join(json.dumps(r) + "\n" for r in data), encoding="utf-8")
+    else:
+        source.write_text(json.dumps(data), encoding="utf-8")
+
+    (tmp_path / "completo").mkdir()
+    reference = tmp_path / "completo" / output_name
+    count, issues = run_batch(str(source), str(reference), dimensione=10)
+    assert count == 94 and [i["riga"] for i in issues] == [43]
+
+    calls = []
+    original = EOQ_calculator_v1.process_chunk
+
+    def crashing(chunk, store_path=None):
+        calls.append(1)
+        if len(calls) == 4 and crash:
+            raise RuntimeError("interruzione simulata")
+        return original(chunk, store_path)
+
+    crash = True
+    output = tmp_path / output_name
+    monkeypatch.setattr(EOQ_calculator_v1, "process_chunk", crashing)
+    with pytest.raises(RuntimeError):
+        run_batch(str(source), str(output), dimensione=10)
+    assert not output.exists()
+
+    calls.clear()
+    crash = False
+    assert run_batch(str(source), str(output), dimensione=10) == (count, issues)
+    assert len(calls) == 10 - 3
+    assert output.read_bytes() == reference.read_bytes()
+    assert not os.path.exists(str(output) + ".checkpoint")
+
+def test_sharded_workers_match_batch(tmp_path):
+    """Test dell'esecuzione distribuita: più processi worker si dividono gli
+    shard tramite file di lock e l'unione coincide con run_batch"""
+    data = [
+        {"codice": f"A{i}", "anno": 2000 + i % 30, "domanda_annua": 100 + i,
+         "costo_setup": 10, "costo_mantenimento": 1}
+        for i in range(200)
+    ]
+    data[77]["anno"] = 1800
+    source = tmp_path / "dati.ndjson"
+    source.write_text("".join(json.dumps(r) + "\n" for r in data), encoding="utf-8")
+    reference = tmp_path / "batch.csv"
+    expected = run_batch(str(source), str(reference), dimensione=15)
+
+    queue_dir = str(tmp_path / "coda")
+    assert create_shards(str(source), queue_dir, dimensione=15) == 14
+    with pytest.raises(ValueError):
+        merge_shards(queue_dir, str(tmp_path / "parziale.csv"))
+    with ProcessPoolExecutor(max_workers=3) as executor:
+        processed = list(executor.map(run_shard_worker, [queue_dir] * 3))
+    assert sum(processed) == 14
+    assert claim_shard(queue_dir) is None
+
+    output = tmp_path / "unito.csv"
+    assert merge_shards(queue_dir, str(output)) == expected
+    assert output.read_bytes() == reference.read_bytes()
+    assert release_stale_locks(queue_dir) == []
+
+def test_claim_shard_reclaims_expired_lease(tmp_path):
+    """Test della prenotazione degli shard: una prenotazione scaduta (worker
+    interrotto) viene recuperata una sola volta, una valida no"""
+    data = [
+        {"codice": f"A{i}", "anno": 2020, "domanda_annua": 100 + i, "costo_setup": 10, "costo_mantenimento": 1}
+        for i in range(20)
+    ]
+    source = tmp_path / "dati.ndjson"
+    source.write_text("".join(json.dumps(r) + "\n" for r in data), encoding="utf-8")
+    queue_dir = str(tmp_path / "coda")
+    assert create_shards(str(source), queue_dir, dimensione=10) == 2
+
+    # Worker interrotto: prenotazione già scaduta
+    assert claim_shard(queue_dir, durata=-1) == 0
+    host, pid, expiry = (tmp_path / "coda" / "shard_000000.lock").read_text(encoding="utf-8").split()
+    assert (host, int(pid)) == (socket.gethostname(), os.getpid())
+
+    # Lo shard 0 viene recuperato e ora ha una prenotazione valida
+    assert claim_shard(queue_dir) == 0
+    assert float((tmp_path / "coda" / "shard_000000.lock").read_text(encoding="utf-8").split()[2]) > float(expiry)
+    assert claim_shard(queue_dir) == 1
+    assert claim_shard(queue_dir) is None
+
+    # Un worker che ha visto la stessa scadenza non prende lo shard una seconda volta
+    (tmp_path / "coda" / "shard_000000.lock").write_text(f"{host} {pid} {expiry}\n", encoding="utf-8")
+    assert claim_shard(queue_dir) is None
+
+    # Lock vuoti di worker interrotti subito dopo averli creati: scadono
+    # in base alla data di modifica e un worker completa tutti gli shard
+    for index in range(2):
+        (tmp_path / "coda" / f"shard_{index:06d}.lock").write_text("", encoding="utf-8")
+        os.utime(tmp_path / "coda" / f"shard_{index:06d}.lock", (0, 0))
+    assert run_shard_worker(queue_dir) == 2
+    assert merge_shards(queue_dir, str(tmp_path / "unito.csv")) == (20, [])
+    assert claim_shard(queue_dir) is None
+
+@pytest.mark.parametrize("name, max_workers", [("dati.ndjson", 2), ("dati.ndjson.gz", 2), ("dati.ndjson", 1)])
+def test_read_ndjson_shared_matches_parallel(tmp_path, name, max_workers):
+    """Test del buffer condiviso: colonne scritte dai processi alle righe
+    del file e stessi risultati di read_ndjson_parallel"""
+    lines = [json.dumps({"codice": f"A{i}", "anno": 2000 + i % 25, "domanda_annua": 500 + i,
+                         "costo_setup": 20, "costo_mantenimento": 1.5}) for i in range(400)]
+    lines[10] = ""
+    lines[50] = "{ non valida"
+    lines[90] = json.dumps({"codice": "X" * 40, "anno": 2020, "domanda_annua": 100,
+                            "costo_setup": 1, "costo_mantenimento": 1})
+    # Confezione frazionaria: EOQ non intero (223.5), da non troncare
+    lines[120] = json.dumps({"codice": "F", "anno": 2020, "domanda_annua": 1000,
+                             "costo_setup": 50, "costo_mantenimento": 2, "confezione": 0.5})
+    content = ("\n".join(lines) + "\n").encode("utf-8")
+    path = tmp_path / name
+    path.write_bytes(gzip.compress(content) if name.endswith(".gz") else content)
+
+    expected, expected_issues = read_ndjson_parallel(str(path), max_workers=1)
+    shared, issues = read_ndjson_shared(str(path), max_workers=max_workers)
+    with shared:
+        assert shared.capacita == 400
+        assert shared.colonne["valido"][0] == 1 and shared.colonne["valido"][10] == 0
+        assert shared.colonne["anno"][3] == 2003 and shared.code(3) == "A3"
+        assert shared.colonne["eoq"][1] == expected[1]["EOQ (pz)"]
+        assert [r["EOQ (pz)"] for r in shared.results() if r["Codice"] == "F"] == [223.5]
+        assert shared.results() == [r for r in expected if r["Codice"] != "X" * 40]
+    assert [(i["riga"], i["campo"]) for i in issues] == [
+        (i["riga"], i["campo"]) for i in expected_issues] + [(91, "codice")]
+
+def test_read_ndjson_shared_exact_costs(tmp_path):
+    """Test del buffer condiviso in modalità valuta esatta: costi in centesimi
+    interi, identici al calcolo in Decimal anche oltre la precisione dei float
+    e anche per i risultati presi dall'archivio"""
+    records = [
+        {"codice": "A", "anno": 2024, "domanda_annua": 10**15, "costo_setup": 10**11, "costo_mantenimento": 1000},
+        {"codice": "B", "anno": 2024, "domanda_annua": 1000, "costo_setup": 50.1, "costo_mantenimento": 2.3},
+    ]
+    path = tmp_path / "dati.ndjson"
+    path.write_text("".join(json.dumps(r) + "\n" for r in records), encoding="utf-8")
+    expected, _ = EOQCalculator(valuta_esatta=True).calculate_records(records)
+    assert len(expected[0]["Costo Totale Annuo (€)"]) > 17  # Oltre le cifre esatte di un float
+    store_path = str(tmp_path / "risultati.db")
+    for _ in range(2):
+        shared, issues = read_ndjson_shared(str(path), max_workers=1, store_path=store_path, valuta_esatta=True)
+        with shared:
+            assert shared.colonne["costo_totale"].format == "q"
+            assert shared.cost("costo_totale", 1) == Decimal(expected[1]["Costo Totale Annuo (€)"])
+            assert shared.results() == expected
+        assert issues == []
+
+def test_external_sort_is_stable_with_spills():
+    """Test dell'ordinamento esterno: stesso risultato di sorted anche con file temporanei"""
+    rows = [[f"A{i % 13}", i % 5, i] for i in range(100)]
+    key = lambda row: (row[0], row[1])
+    assert list(external_sort(rows, key, max_righe=7)) == sorted(rows, key=key)
+    assert list(external_sort(rows, key)) == sorted(rows, key=key)
+
+def test_diff_results_merge_join(tmp_path):
+    """Test del confronto tra due esecuzioni: righe nuove, rimosse e
+    modificate oltre soglia, uguale con e senza ordinamento su disco"""
+    def records(demands):
+        return [{"codice": code, "anno": 2024, "domanda_annua": demand,
+                 "costo_setup": 50, "costo_mantenimento": 2} for code, demand in demands.items()]
+    before = {f"A{i:03d}": 1000 + 10 * i for i in range(60)}
+    after = dict(before)
+    del after["A005"]
+    after["B001"] = 500
+    after["A010"] = before["A010"] * 4  # EOQ doppio
+    after["A020"] = before["A020"] + 1  # Variazione minima
+    for name, demands in (("vecchio", before), ("nuovo", after)):
+        (tmp_path / f"{name}.json").write_text(json.dumps(records(demands)[::-1]), encoding="utf-8")
+        run_batch(str(tmp_path / f"{name}.json"), str(tmp_path / f"{name}.csv"), dimensione=8)
+    old, new = str(tmp_path / "vecchio.csv"), str(tmp_path / "nuovo.csv")
+
+    changes = list(diff_results(old, new, max_righe=5))
+    assert changes == list(diff_results(old, new))
+    assert [(c["Codice"], c["Stato"]) for c in changes] == [
+        ("A005", "rimosso"), ("A010", "modificato"), ("A020", "modificato"), ("B001", "nuovo")]
+    assert abs(changes[1]["EOQ (pz) variazione"] - changes[1]["EOQ (pz) precedente"]) <= 1
+    assert changes[0]["EOQ (pz) nuovo"] is None
+
+    filtered = [c["Codice"] for c in diff_results(old, new, soglia={"EOQ (pz)": 0.05}, colonne=("EOQ (pz)",))]
+    assert filtered == ["A005", "A010", "B001"]
+    assert export_diff(old, new, str(tmp_path / "diff.csv"), soglia=0.05) == 3
+
+def test_result_summary_incremental(tmp_path):
+    """Test dei riepiloghi: totali per anno, fornitore e complessivi
+    aggiornati su aggiunta, sostituzione e pulizia delle righe"""
+    data = [
+        {"codice": "A", "anno": 2023, "domanda_annua": 1000, "costo_setup": 50,
+         "costo_mantenimento": 2, "fornitore": "Rossi"},
+        {"codice": "B", "anno": 2023, "domanda_annua": 2000, "costo_setup": 40,
+         "costo_mantenimento": 1},
+        {"codice": "A", "anno": 2024, "domanda_annua": 1500, "costo_setup": 50,
+         "costo_mantenimento": 2, "fornitore": "Rossi"},
+    ]
+    store = ResultStore(str(tmp_path / "risultati.db"))
+    results, _ = EOQCalculator().calculate_records(data, store=store)
+    assert results[0]["Fornitore"] == "Rossi" and "Fornitore" not in results[1]
+
+    table = TableIndex()
+    for i, result in enumerate(results):
+        table.add(f"r{i}", result)
+    expected = ResultSummary()
+    for result in results:
+        expected.add(result)
+    total = sum(Decimal(r["Costo Totale Annuo (€)"]) for r in results)
+    assert table.summary.overall()[0] == 3 and table.summary.overall()[3] == str(total)
+    assert [row[:2] for row in table.summary.rows("anno")] == [("2023", 2), ("2024", 1)]
+    assert [row[:2] for row in table.summary.rows("fornitore")] == [("(nessun fornitore)", 1), ("Rossi", 2)]
+
+    # Sostituzione: il fornitore cambia anche se il risultato viene dall'archivio
+    data[1]["fornitore"] = "Bianchi"
+    replaced, _ = EOQCalculator().calculate_records([data[1]], store=store)
+    assert replaced[0]["Fornitore"] == "Bianchi"
+    table.remove("r1")
+    table.add("r3", replaced[0])
+    assert [row[0] for row in table.summary.rows("fornitore")] == ["Bianchi", "Rossi"]
+    assert table.summary.overall()[3] == str(total)
+
+    for iid in ("r0", "r2"):
+        table.remove(iid)
+    costs = tuple(replaced[0][column] for column in EOQ_calculator_v1.COLONNE_COSTI)
+    assert table.summary.rows("anno") == [("2023", 1) + costs]
+    table.clear()
+    assert table.summary.overall() == (0, "0.00", "0.00", "0.00")
+    store.close()
+
+def test_cost_curve_minimum_at_eoq():
+    """Test della curva dei costi: passa per i costi del risultato e ha il minimo all'EOQ"""
+    calculator = EOQCalculator()
+    result, _ = calculator.calculate_records([
+        {"anno": 2024, "domanda_annua": 10000, "costo_setup": 50, "costo_mantenimento": 2}
+    ])
+    lots, orders, holding, total = cost_curve(result[0], punti=281, da=0.2, a=3.0)
+    assert len(lots) == 281 and lots[0] == pytest.approx(0.2 * 707)
+    at_eoq = lots.index(min(lots, key=lambda q: abs(q - 707)))
+    assert orders[at_eoq] == pytest.approx(float(result[0]["Costo Ordini Annuo (€)"]), rel=1e-6)
+    assert total.index(min(total)) == at_eoq
+    assert cost_curve({"EOQ (pz)": 0, "Costo Ordini Annuo (€)": "0", "Costo Magazzino Annuo (€)": "0"}) == ([], [], [], [])
+
+def test_downsample_and_scale_points():
+    """Test della riduzione min-max (estremi conservati) e della scala in pixel"""
+    xs = list(range(10000))
+    ys = [math.sin(x / 50) for x in xs]
+    ys[4321] = 5.0
+    ys[777] = -5.0
+    small_x, small_y = downsample_minmax(xs, ys, 100)
+    assert len(small_x) <= 200 and small_x == sorted(small_x)
+    assert max(small_y) == 5.0 and min(small_y) == -5.0
+    assert downsample_minmax([1, 2], [3, 4], 100) == ([1, 2], [3, 4])
+
+    coords = scale_points(small_x, small_y, 400, 200, sinistra=400, margine=20)
+    assert min(coords[0::2]) == pytest.approx(420) and max(coords[0::2]) == pytest.approx(780)
+    assert min(coords[1::2]) == pytest.approx(20) and max(coords[1::2]) == pytest.approx(180)
+
+def test_format_files_report_groups_by_file():
+    """Test del riepilogo di più file: un solo testo con errori e validazione raggruppati per file"""
+    reports = [
+        {"file": "a.json", "error": None, "validation": [
+            {"riga": 3, "anno": 2020, "campo": "costo_setup", "motivo": "Il valore deve essere positivo"}]},
+        {"file": "b.json", "error": None, "validation": []},
+        {"file": "c.json", "error": "ERRORE: Formato JSON non valido.", "validation": []},
+    ]
+    text = format_files_report(reports)
+    assert text.startswith("a.json:\n1 errori di validazione:\nRiga 3")
+    assert "b.json" not in text and text.endswith("c.json:\nERRORE: Formato JSON non valido.")
+    assert format_files_report(reports[1:2]) == ""
+
+def test_yearly_trend_aggregates_items_per_year():
+    """Test dell'andamento per anno: più articoli nello stesso anno danno media, minimo e massimo"""
+    results = [
+        {"Anno": 2024, "EOQ (pz)": 300}, {"Anno": 2023, "EOQ (pz)": 100},
+        {"Anno": 2024, "EOQ (pz)": 100}, {"Anno": 2023, "EOQ (pz)": 50},
+        {"Anno": 2024, "EOQ (pz)": 200}, {"Anno": 2025},
+    ]
+    assert yearly_trend(results) == ([2023, 2024], [75, 200], [50, 100], [100, 300])
+
+def test_parse_number_decimal_separators():
+    """Test dei numeri incollati: virgola o punto decimale e separatore delle migliaia"""
+    assert parse_number("2,5") == 2.5
+    assert parse_number("1.234,5") == 1234.5
+    assert parse_number("1,234.5") == 1234.5
+    assert parse_number(" 2024 ") == 2024 and isinstance(parse_number("2024"), int)
+    assert parse_number("abc") == "abc"
+    assert parse_number("1.234.567") == 1234567 and parse_number("0,125") == 0.125
+    for ambiguous in ("1.000", "12.500", "1,234"):
+        with pytest.raises(ValueError):
+            parse_number(ambiguous)
+
+def test_calculate_pasted_table():
+    """Test dei dati incollati: senza e con intestazione, validazione con le righe del testo"""
+    text = "2023\t10000\t50\t2\n\n2024\t15000\t60,5\t2,5\n1800\t100\t1\t1\n2025\tmolti\t1\t1\n"
+    results, issues = calculate_pasted(text)
+    assert [r["Anno"] for r in results] == [2023, 2024]
+    assert results[0]["EOQ (pz)"] == 707
+    assert [(i["riga"], i["campo"]) for i in issues] == [(4, "anno"), (5, "domanda_annua")]
+
+    pasted = "Codice;Anno;Note;Domanda annua;Costo setup;Costo mantenimento;Fornitore\n" \
+             "A1;2024;urgente;1.000;50;2;Rossi\n"
+    records, lines, ambiguous = parse_pasted_table(pasted)
+    assert records == [{"codice": "A1", "anno": 2024, "domanda_annua": "1.000", "costo_setup": 50,
+                        "costo_mantenimento": 2, "fornitore": "Rossi"}]
+    assert lines == [2] and list(ambiguous) == [(1, "domanda_annua")]
+    # "1.000" non viene letto come 1: la riga è segnalata come ambigua
+    results, issues = calculate_pasted(pasted)
+    assert results == [] and issues[0]["riga"] == 2 and "ambiguo" in issues[0]["motivo"]
+    results, issues = calculate_pasted(pasted.replace("1.000", "1.000,0"))
+    assert results[0]["Domanda Annua (pz)"] == 1000 and issues == []
+    records, _, _ = parse_pasted_table("B7\t2024\t100\t5\t1")
+    assert records[0]["codice"] == "B7" and records[0]["costo_mantenimento"] == 1
+
 
 if __name__ == "__main__":
     # Esegui i test con output verboso